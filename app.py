@@ -1,11 +1,21 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
+from flask import (Flask, render_template, stream_template, request, redirect, url_for, session, flash,
+                   get_flashed_messages, jsonify, Response, g)
+from flask.json.provider import DefaultJSONProvider
 from functools import wraps
+import json
 import os
-from datetime import datetime
+import time
+import uuid
+from datetime import datetime, date
 
 # Importações locais
 from config import Config
+import backup
 import db
+import exportar
+import metricas
+import migracoes
+import perfil_sql
 
 """
 SISTEMA DE GESTÃO FARMACÊUTICA
@@ -16,12 +26,64 @@ Arquivo: app.py
 # CONFIGURAÇÃO DA APLICAÇÃO FLASK
 # =====================================================
 
+class ProvedorJSON(DefaultJSONProvider):
+    """
+    JSON das linhas tipadas do db.py: cada linha vira um dict só enquanto é
+    serializada (_asdict, lido dos __slots__), e as datas saem no texto do
+    SQLite ('AAAA-MM-DD' e 'AAAA-MM-DD HH:MM:SS'), não no formato HTTP
+    padrão do Flask.
+    """
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, db.Linha):
+            return o._asdict()
+        if isinstance(o, datetime):
+            return o.isoformat(sep=' ')
+        if isinstance(o, date):
+            return o.isoformat()
+        return DefaultJSONProvider.default(o)
+
 app = Flask(__name__)
+app.json = ProvedorJSON(app)
 app.config.from_object(Config)
 Config.init_app(app)
+db.init_app(app)
+
+# Aplica migrações pendentes do esquema (índices etc.) - instantâneo se nada mudou
+migracoes.aplicar_migracoes()
+
+# Apaga em segundo plano as reservas de carrinho vencidas
+db.iniciar_varredor_reservas()
+
+# Snapshot dos relatórios (só com RELATORIOS_SNAPSHOT definido)
+db.iniciar_snapshot_relatorios()
+
+# Backup online periódico (só com BACKUP_INTERVALO_HORAS definido)
+backup.iniciar_agendamento()
 
 # =====================================================
-# FILTRO JINJA PARA DATAS (SQLite retorna strings)
+# MÉTRICAS DE LATÊNCIA POR ROTA (/metrics)
+# =====================================================
+
+@app.before_request
+def iniciar_cronometro():
+    g.inicio_requisicao = time.perf_counter()
+
+@app.after_request
+def registrar_latencia(response):
+    inicio = g.pop('inicio_requisicao', None)
+    if inicio is not None:
+        metricas.observar(
+            'farmacia_http_request_duration_seconds',
+            time.perf_counter() - inicio,
+            (request.endpoint or 'desconhecido', request.method, str(response.status_code))
+        )
+        metricas.persistir()
+    return response
+
+# =====================================================
+# FILTRO JINJA PARA DATAS (strings do SQLite ou date/datetime das linhas tipadas)
 # =====================================================
 
 @app.template_filter('format_date')
@@ -45,6 +107,36 @@ def format_datetime_filter(value, format='%d/%m/%Y %H:%M'):
     """Formata data/hora para exibição."""
     return format_date_filter(value, format)
 
+# =====================================================
+# RENDERIZAÇÃO EM FLUXO (produtos, PDV e relatórios)
+# =====================================================
+
+FLUXO_BUFFER = 16 * 1024  # Caracteres juntados antes de cada envio
+
+def _renderizar_em_fluxo(nome, **contexto):
+    """
+    stream_template com os pedaços do Jinja juntados em envios de
+    FLUXO_BUFFER: o topo da página sai enquanto as tabelas ainda são
+    renderizadas, e a resposta nunca fica inteira na memória.
+    As mensagens flash são lidas antes: depois do primeiro byte a sessão
+    (cookie) já foi enviada e não registraria que elas foram exibidas.
+    """
+    get_flashed_messages()
+    partes = stream_template(nome, **contexto)
+
+    def juntar():
+        buffer, tamanho = [], 0
+        for parte in partes:
+            buffer.append(parte)
+            tamanho += len(parte)
+            if tamanho >= FLUXO_BUFFER:
+                yield ''.join(buffer)
+                buffer, tamanho = [], 0
+        if buffer:
+            yield ''.join(buffer)
+
+    return Response(juntar(), mimetype='text/html')
+
 # =====================================================
 # DECORADOR DE AUTENTICAÇÃO (Proteger Rotas)
 # =====================================================
@@ -62,6 +154,38 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def limitar_escrita(f):
+    """
+    Decorador das rotas de escrita: controle de admissão (db.ControleAdmissao).
+    Fila cheia, espera esgotada ou banco travado além do prazo respondem
+    503 com Retry-After, sem prender a thread esperando o lock do SQLite.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        admissao = db.get_admissao_escritas()
+        try:
+            admissao.entrar()
+        except db.BancoOcupado as err:
+            return resposta_banco_ocupado(err)
+        try:
+            return f(*args, **kwargs)
+        except db.BancoOcupado as err:
+            return resposta_banco_ocupado(err)
+        finally:
+            admissao.sair()
+    return decorated_function
+
+def resposta_banco_ocupado(err):
+    """503 em JSON com Retry-After (o PDV tenta de novo depois)."""
+    resposta = jsonify({
+        'success': False,
+        'message': 'Sistema ocupado no momento. Tente novamente em instantes.',
+        'motivo': err.motivo
+    })
+    resposta.status_code = 503
+    resposta.headers['Retry-After'] = str(Config.ESCRITAS_RETRY_AFTER)
+    return resposta
+
 # =====================================================
 # ROTAS: AUTENTICAÇÃO
 # =====================================================
@@ -144,6 +268,8 @@ def dashboard():
         return render_template('dashboard.html', 
                              lotes_vencendo=lotes_vencendo,
                              vendas_recentes=vendas_recentes)
+    except db.BancoOcupado:
+        raise  # 503 em banco_ocupado
     except Exception as e:
         flash(f'Erro ao carregar dashboard: {str(e)}', 'danger')
         return render_template('dashboard.html', lotes_vencendo=[], vendas_recentes=[])
@@ -152,22 +278,60 @@ def dashboard():
 # ROTAS: GESTÃO DE PRODUTOS E ESTOQUE
 # =====================================================
 
+def _filtros_catalogo(args):
+    """
+    Lê da query string os parâmetros de paginação/filtro do catálogo.
+    Usado por /produtos, /pdv e /api/produtos.
+    """
+    apos_id = args.get('apos_id', type=int)
+    limite = args.get('limite', Config.PRODUTOS_POR_PAGINA, type=int)
+    return {
+        'limite': max(1, min(limite, 100)),
+        'apos_nome': args.get('apos_nome') if apos_id is not None else None,
+        'apos_id': apos_id,
+        'categoria': args.get('categoria') or None,
+        'em_estoque': args.get('em_estoque') in ('1', 'true', 'on'),
+        'vencendo': args.get('vencendo') in ('1', 'true', 'on')
+    }
+
 @app.route('/produtos')
 @login_required
 def produtos():
     """
     Tela de gestão de produtos e lotes.
-    Exibe lista em formato Accordion (Bootstrap).
+    Exibe lista em formato Accordion (Bootstrap), uma página por vez
+    (Config.PRODUTOS_POR_PAGINA), com filtros por categoria/estoque/validade.
     """
+    filtros = _filtros_catalogo(request.args)
     try:
-        produtos_lista = db.listar_produtos()
-        return render_template('produtos.html', produtos=produtos_lista)
+        produtos_lista, proxima_pagina = db.listar_produtos_pagina(**filtros)
+        return _renderizar_em_fluxo('produtos.html', produtos=produtos_lista,
+                                    proxima_pagina=proxima_pagina, filtros=filtros)
+    except db.BancoOcupado:
+        raise  # 503 em banco_ocupado
     except Exception as e:
         flash(f'Erro ao carregar produtos: {str(e)}', 'danger')
-        return render_template('produtos.html', produtos=[])
+        return render_template('produtos.html', produtos=[], proxima_pagina=None, filtros=filtros)
+
+@app.route('/api/produtos', methods=['GET'])
+@login_required
+def listar_produtos_api():
+    """
+    API do catálogo paginado (keyset em nome + id).
+    Parâmetros: apos_nome, apos_id, limite, categoria, em_estoque, vencendo.
+    Retorna a página e o cursor da próxima (null na última página).
+    """
+    try:
+        produtos_lista, proxima_pagina = db.listar_produtos_pagina(**_filtros_catalogo(request.args))
+        return jsonify({'success': True, 'produtos': produtos_lista, 'proxima_pagina': proxima_pagina})
+    except db.BancoOcupado:
+        raise  # 503 em banco_ocupado
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
 
 @app.route('/api/produtos', methods=['POST'])
 @login_required
+@limitar_escrita
 def criar_produto():
     """
     API para criar novo produto.
@@ -192,11 +356,33 @@ def criar_produto():
         else:
             return jsonify({'success': False, 'message': 'Erro ao salvar no banco'}), 500
             
+    except db.BancoOcupado:
+        raise  # 503 em limitar_escrita
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/produtos/busca', methods=['GET'])
+@login_required
+def buscar_produtos():
+    """
+    API de busca para o typeahead do PDV.
+    Parâmetros: q (texto, busca por prefixo e sem acentos), limite, em_estoque.
+    """
+    try:
+        termo = request.args.get('q', '')
+        limite = max(1, min(request.args.get('limite', Config.BUSCA_LIMITE, type=int), 100))
+        em_estoque = request.args.get('em_estoque') in ('1', 'true', 'on')
+        
+        produtos_lista = db.buscar_produtos(termo, limite=limite, em_estoque=em_estoque)
+        return jsonify({'success': True, 'produtos': produtos_lista})
+    except db.BancoOcupado:
+        raise  # 503 em banco_ocupado
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
 @app.route('/api/produtos/<int:produto_id>', methods=['PUT'])
 @login_required
+@limitar_escrita
 def atualizar_produto(produto_id):
     """API para atualizar produto existente"""
     try:
@@ -216,11 +402,14 @@ def atualizar_produto(produto_id):
         else:
             return jsonify({'success': False, 'message': 'Erro ao atualizar'}), 500
             
+    except db.BancoOcupado:
+        raise  # 503 em limitar_escrita
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
 @app.route('/api/produtos/<int:produto_id>', methods=['DELETE'])
 @login_required
+@limitar_escrita
 def deletar_produto(produto_id):
     """API para deletar produto"""
     try:
@@ -232,6 +421,13 @@ def deletar_produto(produto_id):
         else:
             return jsonify({'success': False, 'message': 'Erro ao deletar'}), 500
             
+    except db.ProdutoEmUso:
+        return jsonify({
+            'success': False,
+            'message': 'Produto com vendas ou estoque em lotes não pode ser excluído'
+        }), 409
+    except db.BancoOcupado:
+        raise  # 503 em limitar_escrita
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
@@ -242,11 +438,14 @@ def listar_lotes(produto_id):
     try:
         lotes = db.listar_lotes_por_produto(produto_id)
         return jsonify({'success': True, 'lotes': lotes})
+    except db.BancoOcupado:
+        raise  # 503 em banco_ocupado
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
 @app.route('/api/lotes', methods=['POST'])
 @login_required
+@limitar_escrita
 def criar_lote():
     """
     API para criar novo lote de estoque.
@@ -270,9 +469,83 @@ def criar_lote():
         else:
             return jsonify({'success': False, 'message': 'Erro ao salvar lote'}), 500
             
+    except db.BancoOcupado:
+        raise  # 503 em limitar_escrita
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
+def _validar_item_lote(item):
+    """
+    Valida uma entrada do recebimento em massa.
+    Retorna (tupla para o banco, None) ou (None, mensagem de erro).
+    """
+    if not isinstance(item, dict):
+        return None, 'Entrada deve ser um objeto'
+    
+    campos = ('produto_id', 'numero_lote', 'data_validade', 'qtd_atual')
+    faltando = [campo for campo in campos if item.get(campo) in (None, '')]
+    if faltando:
+        return None, f"Campos obrigatórios: {', '.join(faltando)}"
+    
+    try:
+        produto_id = int(item['produto_id'])
+        qtd_atual = int(item['qtd_atual'])
+        data_validade = datetime.strptime(str(item['data_validade']), '%Y-%m-%d').date().isoformat()
+    except (TypeError, ValueError):
+        return None, 'produto_id/qtd_atual devem ser inteiros e data_validade AAAA-MM-DD'
+    
+    if qtd_atual < 0:
+        return None, 'Quantidade não pode ser negativa'
+    
+    return (produto_id, str(item['numero_lote']).strip(), data_validade, qtd_atual), None
+
+@app.route('/api/lotes/lote-em-massa', methods=['POST'])
+@login_required
+@limitar_escrita
+def criar_lotes_em_massa():
+    """
+    Recebimento de mercadoria: vários lotes em uma requisição JSON.
+    Corpo: {"lotes": [{"produto_id", "numero_lote", "data_validade", "qtd_atual"}, ...]}
+    Tudo ou nada: se alguma entrada for inválida nada é gravado e a
+    resposta traz o erro de cada linha.
+    """
+    dados = request.get_json(silent=True) or {}
+    itens = dados.get('lotes')
+    
+    if not isinstance(itens, list) or not itens:
+        return jsonify({'success': False, 'message': 'Informe a lista "lotes"'}), 400
+    if len(itens) > Config.LOTES_POR_RECEBIMENTO_MAX:
+        return jsonify({'success': False,
+                        'message': f'Máximo de {Config.LOTES_POR_RECEBIMENTO_MAX} lotes por requisição'}), 400
+    
+    lotes = []
+    erros = {}
+    for indice, item in enumerate(itens):
+        lote, erro = _validar_item_lote(item)
+        if erro:
+            erros[indice] = erro
+        lotes.append(lote)
+    
+    if not erros:
+        resultado = db.criar_lotes_em_massa(lotes)
+        if resultado is None:
+            return jsonify({'success': False, 'message': 'Erro ao salvar lotes'}), 500
+        ids, erros = resultado
+        if not erros:
+            return jsonify({
+                'success': True,
+                'resultados': [{'indice': i, 'lote_id': lote_id} for i, lote_id in enumerate(ids)]
+            })
+    
+    return jsonify({
+        'success': False,
+        'message': f'{len(erros)} lote(s) inválido(s); nada foi gravado',
+        'resultados': [
+            {'indice': i, 'erro': erros[i]} if i in erros else {'indice': i, 'lote_id': None}
+            for i in range(len(itens))
+        ]
+    }), 400
+
 # =====================================================
 # ROTAS: PONTO DE VENDA (PDV)
 # =====================================================
@@ -285,15 +558,19 @@ def pdv():
     Layout Split Screen: Catálogo + Carrinho
     """
     try:
-        # Buscar produtos disponíveis (com estoque > 0)
-        produtos_disponiveis = db.listar_produtos()
-        # Filtrar apenas produtos com estoque
-        produtos_disponiveis = [p for p in produtos_disponiveis if p['estoque_total'] > 0]
+        # Primeira página de produtos disponíveis (estoque > 0 filtrado no SQL);
+        # as seguintes são carregadas via /api/produtos
+        produtos_disponiveis, proxima_pagina = db.listar_produtos_pagina(
+            Config.PRODUTOS_POR_PAGINA, em_estoque=True
+        )
         
-        return render_template('pdv.html', produtos=produtos_disponiveis)
+        return _renderizar_em_fluxo('pdv.html', produtos=produtos_disponiveis,
+                                    proxima_pagina=proxima_pagina)
+    except db.BancoOcupado:
+        raise  # 503 em banco_ocupado
     except Exception as e:
         flash(f'Erro ao carregar PDV: {str(e)}', 'danger')
-        return render_template('pdv.html', produtos=[])
+        return render_template('pdv.html', produtos=[], proxima_pagina=None)
 
 @app.route('/api/produto/<int:produto_id>/detalhes', methods=['GET'])
 @login_required
@@ -308,55 +585,35 @@ def produto_detalhes(produto_id):
             return jsonify({'success': True, 'produto': produto})
         else:
             return jsonify({'success': False, 'message': 'Produto não encontrado'}), 404
+    except db.BancoOcupado:
+        raise  # 503 em banco_ocupado
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
 @app.route('/api/venda', methods=['POST'])
 @login_required
+@limitar_escrita
 def finalizar_venda():
     """
     API para processar venda completa.
     RN1: Valida receita médica se houver medicamento controlado.
-    RN3: Usa lógica FEFO (First Expire, First Out) via db.get_lote_fefo()
+    RN3: Usa lógica FEFO (First Expire, First Out) em vários lotes, via db.registrar_venda()
+    Preço e categoria vêm do banco, lidos na transação da venda (das reservas
+    do carrinho, quando houver), nunca do PDV.
     """
     try:
         # Dados do carrinho (JSON)
         itens_json = request.form.get('itens')  # String JSON
         supervisor = request.form.get('supervisor')  # Senha supervisor (se houver controlado)
+        carrinho = request.form.get('carrinho')  # Reservas do PDV (opcional)
         
         # Arquivo de receita (se houver)
         arquivo_receita = request.files.get('receita')
         
-        if not itens_json:
-            return jsonify({'success': False, 'message': 'Carrinho vazio'}), 400
-        
-        import json
-        itens_carrinho = json.loads(itens_json)
-        
-        # Validação RN1: Se tem item controlado, DEVE ter receita e supervisor
-        tem_controlado = any(item.get('categoria') == 'Controlado' for item in itens_carrinho)
-        
-        if tem_controlado:
-            # Verificar se receita foi enviada
-            if not arquivo_receita:
-                return jsonify({
-                    'success': False, 
-                    'message': 'Medicamento controlado requer upload da receita médica!'
-                }), 400
-            
-            # Verificar se senha do supervisor foi informada
-            if not supervisor:
-                return jsonify({
-                    'success': False, 
-                    'message': 'Medicamento controlado requer senha do supervisor!'
-                }), 400
-            
-            # VALIDAR SENHA MESTRA (Case-sensitive)
-            if supervisor != Config.SENHA_SUPERVISOR_MESTRA:
-                return jsonify({
-                    'success': False, 
-                    'message': 'Senha do supervisor incorreta! Verifique maiúsculas e minúsculas.'
-                }), 403
+        try:
+            itens_venda = _itens_do_carrinho(itens_json)
+        except ValueError as err:
+            return jsonify({'success': False, 'message': str(err)}), 400
         
         # Validar upload de receita (se houver) - NÃO salva, só valida
         if arquivo_receita:
@@ -367,36 +624,46 @@ def finalizar_venda():
                 }), 400
             # Arquivo validado - descartado (não salva)
         
-        # Preparar itens para db.registrar_venda()
-        # RN3: Para cada produto, buscar lote FEFO automaticamente
-        itens_venda = []
-        for item in itens_carrinho:
-            produto_id = item['produto_id']
-            quantidade = item['quantidade']
-            preco = item['preco']
-            
-            # Buscar lote FEFO (First Expire, First Out)
-            lote = db.get_lote_fefo(produto_id, quantidade)
+        # Registrar venda no banco
+        # RN1: a categoria de cada item é lida dentro da transação da venda
+        # (das reservas do carrinho, quando houver); aqui só se diz se a
+        # venda de controlado está liberada (receita + senha mestra)
+        # RN3: a distribuição FEFO entre os lotes acontece na mesma
+        # transação (um item pode sair de vários lotes)
+        controlado_liberado = bool(arquivo_receita) and supervisor == Config.SENHA_SUPERVISOR_MESTRA
+        try:
+            venda_id = db.registrar_venda(
+                itens_venda,
+                session['user_id'],
+                supervisor=supervisor,
+                carrinho=carrinho,
+                controlado_liberado=controlado_liberado
+            )
+        except db.EstoqueInsuficiente as err:
+            return jsonify({
+                'success': False, 
+                'message': f'Estoque insuficiente para {err.nome or f"produto {err.produto_id}"} '
+                           f'(disponível: {err.disponivel})'
+            }), 400
+        except db.ControladoSemLiberacao:
+            # Validação RN1: item controlado exige receita e supervisor
+            if not arquivo_receita:
+                return jsonify({
+                    'success': False, 
+                    'message': 'Medicamento controlado requer upload da receita médica!'
+                }), 400
             
-            if not lote:
+            if not supervisor:
                 return jsonify({
                     'success': False, 
-                    'message': f'Estoque insuficiente para {item["nome"]}'
+                    'message': 'Medicamento controlado requer senha do supervisor!'
                 }), 400
             
-            itens_venda.append({
-                'produto_id': produto_id,
-                'lote_id': lote['id'],
-                'quantidade': quantidade,
-                'preco': preco
-            })
-        
-        # Registrar venda no banco
-        venda_id = db.registrar_venda(
-            itens_venda,
-            session['user_id'],
-            supervisor=supervisor
-        )
+            # SENHA MESTRA (Case-sensitive)
+            return jsonify({
+                'success': False, 
+                'message': 'Senha do supervisor incorreta! Verifique maiúsculas e minúsculas.'
+            }), 403
         
         if venda_id:
             return jsonify({
@@ -407,10 +674,108 @@ def finalizar_venda():
         else:
             return jsonify({'success': False, 'message': 'Erro ao registrar venda'}), 500
             
+    except db.BancoOcupado:
+        raise  # 503 em limitar_escrita
     except Exception as e:
         print(f"[ERRO] finalizar_venda: {e}")
         return jsonify({'success': False, 'message': str(e)}), 500
 
+def _itens_do_carrinho(itens_json):
+    """
+    Lê o carrinho enviado pelo PDV (string JSON) como [{'produto_id', 'quantidade'}].
+    Preço e categoria enviados são ignorados. Levanta ValueError com a
+    mensagem para o usuário.
+    """
+    try:
+        itens = json.loads(itens_json or '[]')
+    except ValueError:
+        raise ValueError('Carrinho inválido')
+    if not isinstance(itens, list):
+        raise ValueError('Carrinho inválido')
+    if not itens:
+        raise ValueError('Carrinho vazio')
+    
+    resultado = []
+    for item in itens:
+        if not isinstance(item, dict):
+            raise ValueError('Item do carrinho inválido')
+        try:
+            produto_id = int(item['produto_id'])
+            quantidade = int(item['quantidade'])
+        except (KeyError, TypeError, ValueError):
+            raise ValueError('Item do carrinho inválido')
+        if quantidade <= 0:
+            raise ValueError(f'Quantidade inválida para {item.get("nome", "produto")}')
+        resultado.append({'produto_id': produto_id, 'quantidade': quantidade})
+    return resultado
+
+@app.route('/api/carrinho/cotacao', methods=['POST'])
+@login_required
+def cotar_carrinho():
+    """
+    Cotação do carrinho inteiro em uma chamada, antes do pagamento.
+    Form: itens (JSON como em /api/venda) e carrinho (reservas, opcional).
+    Por linha: preço do banco com RN4, categoria/controlado, estoque
+    disponível e lotes previstos (FEFO). Nada é gravado.
+    """
+    try:
+        itens = _itens_do_carrinho(request.form.get('itens'))
+    except ValueError as err:
+        return jsonify({'success': False, 'message': str(err)}), 400
+    
+    cotacao = db.cotar_carrinho(itens, request.form.get('carrinho'))
+    if cotacao is None:
+        return jsonify({'success': False, 'message': 'Erro ao consultar o carrinho'}), 500
+    
+    return jsonify({'success': True, **cotacao})
+
+@app.route('/api/carrinho/reservas', methods=['POST'])
+@login_required
+@limitar_escrita
+def reservar_item_carrinho():
+    """
+    Reserva estoque para um item do carrinho do PDV (prazo Config.RESERVA_TTL).
+    Form: carrinho (vazio na primeira chamada: um id novo é gerado),
+    produto_id e quantidade total do produto no carrinho (0 libera).
+    Retorna o id do carrinho, que vai junto em /api/venda.
+    """
+    carrinho = request.form.get('carrinho') or uuid.uuid4().hex
+    try:
+        produto_id = int(request.form.get('produto_id'))
+        quantidade = int(request.form.get('quantidade'))
+        if quantidade < 0:
+            raise ValueError
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'produto_id e quantidade inválidos'}), 400
+    
+    try:
+        expira_em = db.reservar_estoque(carrinho, session['user_id'], produto_id, quantidade)
+    except db.EstoqueInsuficiente as err:
+        return jsonify({
+            'success': False,
+            'message': f'Estoque insuficiente (disponível: {err.disponivel})',
+            'disponivel': err.disponivel
+        }), 409
+    
+    if expira_em is None:
+        return jsonify({'success': False, 'message': 'Erro ao reservar estoque'}), 500
+    
+    return jsonify({
+        'success': True,
+        'carrinho': carrinho,
+        'expira_em': datetime.fromtimestamp(expira_em).isoformat(timespec='seconds')
+    })
+
+@app.route('/api/carrinho/<carrinho>', methods=['DELETE'])
+@login_required
+@limitar_escrita
+def cancelar_carrinho(carrinho):
+    """Libera as reservas do carrinho (venda cancelada no PDV)."""
+    liberadas = db.liberar_reservas(carrinho, session['user_id'])
+    if liberadas is None:
+        return jsonify({'success': False, 'message': 'Erro ao liberar reservas'}), 500
+    return jsonify({'success': True, 'liberadas': liberadas})
+
 # =====================================================
 # ROTAS: RELATÓRIOS
 # =====================================================
@@ -424,14 +789,173 @@ def relatorios():
     """
     try:
         vendas_recentes = db.get_vendas_recentes(limite=20)
-        lotes_vencendo = db.get_lotes_vencendo()
         
-        return render_template('relatorios.html', 
-                             vendas=vendas_recentes,
-                             lotes_vencendo=lotes_vencendo)
+        # Mês corrente (a partir dos consolidados diários)
+        inicio, fim = _periodo_relatorio(request.args)
+        resumo_mes = db.resumo_vendas_periodo(inicio, fim)
+        top_produtos = db.ranking_vendas('produtos', inicio, fim, limite=5)
+        
+        # Lotes vencendo: gerador sobre o cursor, lido enquanto a tabela é enviada
+        return _renderizar_em_fluxo('relatorios.html',
+                                    vendas=vendas_recentes,
+                                    lotes_vencendo=db.iterar_lotes_vencendo(),
+                                    resumo_mes=resumo_mes,
+                                    top_produtos=top_produtos)
+    except db.BancoOcupado:
+        raise  # 503 em banco_ocupado
     except Exception as e:
         flash(f'Erro ao carregar relatórios: {str(e)}', 'danger')
-        return render_template('relatorios.html', vendas=[], lotes_vencendo=[])
+        return render_template('relatorios.html', vendas=[], lotes_vencendo=[],
+                               resumo_mes=None, top_produtos=[])
+
+def _periodo_relatorio(args):
+    """
+    Lê inicio/fim (YYYY-MM-DD) da query string.
+    Padrão: do dia 1 do mês corrente até hoje.
+    Lança ValueError se alguma data for inválida.
+    """
+    hoje = date.today()
+    inicio = args.get('inicio') or hoje.replace(day=1).isoformat()
+    fim = args.get('fim') or hoje.isoformat()
+    datetime.strptime(inicio, '%Y-%m-%d')
+    datetime.strptime(fim, '%Y-%m-%d')
+    return inicio, fim
+
+@app.route('/api/relatorios/resumo', methods=['GET'])
+@login_required
+def relatorio_resumo():
+    """
+    Totais de vendas do período (receita, unidades, nº de vendas) e a
+    série por dia. Parâmetros: inicio, fim (padrão: mês corrente).
+    """
+    try:
+        inicio, fim = _periodo_relatorio(request.args)
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Datas devem estar no formato AAAA-MM-DD'}), 400
+    
+    resumo = db.resumo_vendas_periodo(inicio, fim)
+    if resumo is None:
+        return jsonify({'success': False, 'message': 'Erro ao consultar relatório'}), 500
+    return jsonify({'success': True, 'resumo': resumo})
+
+@app.route('/api/relatorios/ranking/<dimensao>', methods=['GET'])
+@login_required
+def relatorio_ranking(dimensao):
+    """
+    Ranking do período por produtos, vendedores ou categorias.
+    Parâmetros: inicio, fim, limite, ordem (receita | unidades).
+    """
+    if dimensao not in ('produtos', 'vendedores', 'categorias'):
+        return jsonify({'success': False, 'message': 'Dimensão inválida'}), 404
+    
+    ordem = request.args.get('ordem', 'receita')
+    if ordem not in ('receita', 'unidades'):
+        return jsonify({'success': False, 'message': 'Ordem deve ser receita ou unidades'}), 400
+    
+    try:
+        inicio, fim = _periodo_relatorio(request.args)
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Datas devem estar no formato AAAA-MM-DD'}), 400
+    
+    limite = max(1, min(request.args.get('limite', 10, type=int), 100))
+    ranking = db.ranking_vendas(dimensao, inicio, fim, limite=limite, ordem=ordem)
+    return jsonify({'success': True, 'inicio': inicio, 'fim': fim, 'ranking': ranking})
+
+@app.route('/api/alertas/validade', methods=['GET'])
+@login_required
+def alertas_validade():
+    """
+    RN2: Resumo de validade por horizonte (lotes, unidades e valor).
+    Parâmetro: horizontes=7,30,90 (dias).
+    """
+    try:
+        texto = request.args.get('horizontes', '7,30,90')
+        horizontes = [int(h) for h in texto.split(',') if h.strip()]
+        if not horizontes or any(h < 0 or h > 3650 for h in horizontes):
+            return jsonify({'success': False, 'message': 'Horizontes inválidos'}), 400
+        return jsonify({'success': True, 'faixas': db.resumo_validade(horizontes)})
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Horizontes devem ser números inteiros'}), 400
+    except db.BancoOcupado:
+        raise  # 503 em banco_ocupado
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/exportar/<tipo>', methods=['GET'])
+@login_required
+def exportar_extrato(tipo):
+    """
+    Extrato completo para auditoria/BI, enviado em fluxo.
+    Tipos: itens, vendas, lotes.
+    Parâmetros: inicio, fim (AAAA-MM-DD), formato (csv | ndjson), gzip=1.
+    """
+    formato = request.args.get('formato', 'csv')
+    inicio = request.args.get('inicio') or None
+    fim = request.args.get('fim') or None
+    gzip = request.args.get('gzip') in ('1', 'true')
+    
+    if tipo not in db.EXPORTACOES:
+        return jsonify({'success': False, 'message': 'Tipo de exportação inválido'}), 404
+    try:
+        pedacos = exportar.gerar_exportacao(tipo, formato, inicio, fim, gzip)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    arquivo = exportar.nome_arquivo(tipo, formato, inicio, fim, gzip)
+    return Response(
+        pedacos,
+        mimetype='application/gzip' if gzip else exportar.FORMATOS[formato],
+        headers={'Content-Disposition': f'attachment; filename="{arquivo}"'}
+    )
+
+# =====================================================
+# ROTAS: MONITORAMENTO
+# =====================================================
+
+@app.route('/api/status/db', methods=['GET'])
+@login_required
+def status_db():
+    """
+    Estado do pool de conexões (tamanho, em uso, tempo de espera), do
+    cache do catálogo (acertos/falhas), da fila de escritas (recusas 503),
+    das reservas de carrinho, do caminho de leitura dos relatórios e do backup.
+    Usado para verificar se os caixas estão fazendo fila por conexão.
+    """
+    return jsonify({
+        'success': True,
+        'pool': db.estatisticas_pool(),
+        'cache_catalogo': db.estatisticas_cache_catalogo(),
+        'escritor_vendas': db.estatisticas_escritor_vendas(),
+        'admissao_escritas': db.estatisticas_admissao(),
+        'reservas': db.estatisticas_reservas(),
+        'leitura': db.estatisticas_leitura(),
+        'backup': backup.estatisticas_backup()
+    })
+
+@app.route('/api/status/consultas-lentas', methods=['GET'])
+@login_required
+def status_consultas_lentas():
+    """
+    Piores consultas do log de consultas lentas (CONSULTAS_LENTAS_MS),
+    agrupadas por SQL, com o plano e o alerta de SCAN em tabelas grandes.
+    Parâmetro: limite (padrão 20).
+    """
+    limite = max(1, min(request.args.get('limite', 20, type=int), 200))
+    return jsonify({
+        'success': True,
+        'ativo': Config.CONSULTAS_LENTAS_MS is not None,
+        'limite_ms': Config.CONSULTAS_LENTAS_MS,
+        'consultas': perfil_sql.piores_consultas(limite)
+    })
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Métricas no formato texto do Prometheus (latência por rota e por
+    função do db.py, espera do pool, SQLITE_BUSY). Sem login, para o
+    coletor; somada entre processos quando METRICAS_DIR está definido.
+    """
+    return Response(metricas.texto_prometheus(), mimetype='text/plain; version=0.0.4')
 
 # =====================================================
 # TRATAMENTO DE ERROS (UX - Critério de Avaliação)
@@ -442,9 +966,20 @@ def page_not_found(e):
     """Página customizada para erro 404"""
     return render_template('404.html'), 404
 
+@app.errorhandler(db.BancoOcupado)
+def banco_ocupado(err):
+    """Pool de conexões esgotado numa leitura: 503 com Retry-After, em vez de uma tela vazia"""
+    if request.path.startswith('/api/'):
+        return resposta_banco_ocupado(err)
+    return Response('Sistema ocupado no momento. Tente novamente em instantes.', status=503,
+                    headers={'Retry-After': str(Config.ESCRITAS_RETRY_AFTER)},
+                    mimetype='text/plain')
+
 @app.errorhandler(500)
 def internal_error(e):
-    """Página customizada para erro 500"""
+    """Página customizada para erro 500 (JSON nas rotas /api, que são chamadas via AJAX)"""
+    if request.path.startswith('/api/'):
+        return jsonify({'success': False, 'message': 'Erro interno do servidor'}), 500
     flash('Ocorreu um erro interno. Tente novamente.', 'danger')
     return redirect(url_for('dashboard'))
 
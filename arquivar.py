@@ -0,0 +1,389 @@
+"""
+SISTEMA DE GESTÃO FARMACÊUTICA
+Arquivamento Mensal de Vendas (vendas + itens_venda)
+
+Move os meses fechados anteriores aos Config.ARQUIVO_MESES_QUENTES mais
+recentes para um arquivo SQLite por mês (Config.ARQUIVO_DIR/vendas_AAAA_MM.db),
+em blocos de Config.ARQUIVO_BLOCO vendas por transação, mantendo o banco
+principal pequeno. Cada mês passa por três etapas, registradas na tabela
+arquivo_vendas_meses do banco principal; rodar de novo retoma de onde parou:
+
+  copiando  -> vendas (com seus itens) copiadas em blocos via ATTACH; o
+               ponto de retomada fica no próprio arquivo do mês, na mesma
+               transação da cópia
+  apagando  -> contagens e totais do mês conferidos entre os dois bancos;
+               blocos apagados do banco principal (só o que já está no arquivo)
+  concluido -> conferência final: nenhuma linha do mês no banco principal
+               e o arquivo com as contagens registradas
+
+Cada transação grava em um único arquivo (o do mês na cópia, o principal
+na remoção), então uma queda no meio nunca perde venda: no pior caso ela
+fica nos dois e o passo seguinte resolve.
+
+Os relatórios consolidados (vendas_diarias_*) ficam no banco principal.
+O extrato de um período antigo (exportar.py / db.exportar_blocos) anexa
+os arquivos dos meses pedidos sozinho.
+
+Uso:
+    python arquivar.py                   -> arquiva os meses elegíveis
+    python arquivar.py --ate 2025-06     -> só até o mês dado (inclusive)
+    python arquivar.py --bloco 5000 --vacuum   -> VACUUM no fim (trava as escritas; fora do expediente)
+    python arquivar.py --verificar       -> confere os meses já arquivados
+"""
+
+import os
+import sqlite3
+import sys
+import time
+from datetime import date
+
+from config import Config
+import db
+import migracoes
+
+# Esquema de cada arquivo mensal (mesmas colunas de db.COLUNAS_ARQUIVO)
+ESQUEMA_ARQUIVO = [
+    """CREATE TABLE IF NOT EXISTS arq.vendas (
+           id INTEGER PRIMARY KEY,
+           data_venda TIMESTAMP,
+           total REAL NOT NULL,
+           usuario_id INTEGER NOT NULL,
+           supervisor_liberacao TEXT,
+           caminho_receita TEXT
+       )""",
+    """CREATE TABLE IF NOT EXISTS arq.itens_venda (
+           id INTEGER PRIMARY KEY,
+           venda_id INTEGER NOT NULL,
+           produto_id INTEGER NOT NULL,
+           lote_id INTEGER NOT NULL,
+           quantidade INTEGER NOT NULL,
+           preco_unitario REAL NOT NULL,
+           subtotal REAL NOT NULL
+       )""",
+    "CREATE INDEX IF NOT EXISTS arq.idx_vendas_data ON vendas (data_venda)",
+    "CREATE INDEX IF NOT EXISTS arq.idx_itens_venda_venda ON itens_venda (venda_id)",
+    # Ponto de retomada da cópia (gravado na mesma transação de cada bloco)
+    """CREATE TABLE IF NOT EXISTS arq.arquivamento (
+           mes TEXT PRIMARY KEY,
+           ultimo_venda_id INTEGER NOT NULL
+       )""",
+]
+
+class ErroIntegridade(Exception):
+    """Contagens ou totais do mês não batem entre o banco principal e o arquivo."""
+
+# =====================================================
+# MESES
+# =====================================================
+
+def primeiro_mes_quente(hoje=None):
+    """Mês 'AAAA-MM' a partir do qual as vendas ficam no banco principal."""
+    hoje = hoje or date.today()
+    indice = hoje.year * 12 + hoje.month - 1 - (Config.ARQUIVO_MESES_QUENTES - 1)
+    return f"{indice // 12:04d}-{indice % 12 + 1:02d}"
+
+def meses_a_arquivar(conexao, ate=None):
+    """
+    Meses com vendas antes do primeiro mês quente (e até `ate`, se dado),
+    mais os que ficaram no meio de uma execução anterior.
+    Um MIN() pelo índice de data por mês, sem varrer as vendas.
+    """
+    limite = primeiro_mes_quente()
+    if ate and ate < limite:
+        limite = db.limites_mes(ate)[1][:7]
+
+    meses = {mes for mes, in conexao.execute(
+        "SELECT mes FROM arquivo_vendas_meses WHERE estado != 'concluido' AND mes < ?", (limite,)
+    )}
+    desde = '0000-01-01'
+    while True:
+        mes = conexao.execute("""
+            SELECT substr(MIN(data_venda), 1, 7) FROM vendas
+            WHERE data_venda >= ? AND data_venda < ?
+        """, (desde, f"{limite}-01")).fetchone()[0]
+        if mes is None:
+            break
+        meses.add(mes)
+        desde = db.limites_mes(mes)[1]
+    return sorted(meses)
+
+# =====================================================
+# ETAPAS DE UM MÊS
+# =====================================================
+
+def _estado(conexao, mes):
+    row = conexao.execute(
+        "SELECT estado, vendas, itens, total FROM arquivo_vendas_meses WHERE mes = ?", (mes,)
+    ).fetchone()
+    return row if row else (None, 0, 0, 0.0)
+
+def _registrar(conexao, mes, estado, contagens=None):
+    """Grava a etapa do mês no banco principal (transação só dele)."""
+    conexao.execute("BEGIN IMMEDIATE")
+    try:
+        conexao.execute("""
+            INSERT INTO arquivo_vendas_meses (mes, arquivo, estado) VALUES (?, ?, ?)
+            ON CONFLICT (mes) DO UPDATE SET estado = excluded.estado, atualizado_em = CURRENT_TIMESTAMP
+        """, (mes, db.nome_arquivo_mes(mes), estado))
+        if contagens is not None:
+            conexao.execute(
+                "UPDATE arquivo_vendas_meses SET vendas = ?, itens = ?, total = ? WHERE mes = ?",
+                (*contagens, mes)
+            )
+        conexao.execute("COMMIT")
+    except Exception:
+        conexao.execute("ROLLBACK")
+        raise
+
+def _contagens(conexao, esquema, mes, so_do_principal=False):
+    """
+    (vendas, itens, total) do mês no banco `esquema` ('main' ou 'arq').
+    Com so_do_principal, só das vendas que ainda estão no banco principal.
+    """
+    inicio, fim = db.limites_mes(mes)
+    filtro, parametros = "", (inicio, fim)
+    if so_do_principal:
+        filtro = "AND id IN (SELECT id FROM main.vendas WHERE data_venda >= ? AND data_venda < ?)"
+        parametros = (inicio, fim, inicio, fim)
+    vendas, total = conexao.execute(f"""
+        SELECT COUNT(*), ROUND(COALESCE(SUM(total), 0), 2) FROM {esquema}.vendas
+        WHERE data_venda >= ? AND data_venda < ? {filtro}
+    """, parametros).fetchone()
+    itens = conexao.execute(f"""
+        SELECT COUNT(*) FROM {esquema}.itens_venda
+        WHERE venda_id IN (SELECT id FROM {esquema}.vendas WHERE data_venda >= ? AND data_venda < ? {filtro})
+    """, parametros).fetchone()[0]
+    return vendas, itens, total
+
+def _copiar(conexao, mes, tamanho_bloco):
+    """Copia o mês para o arquivo em blocos; retoma do último bloco gravado."""
+    inicio, fim = db.limites_mes(mes)
+    row = conexao.execute(
+        "SELECT ultimo_venda_id FROM arq.arquivamento WHERE mes = ?", (mes,)
+    ).fetchone()
+    ultimo = row[0] if row else 0
+    copiadas = 0
+    while True:
+        # BEGIN comum: lê o principal (WAL, sem travar os caixas) e só grava no arquivo
+        conexao.execute("BEGIN")
+        try:
+            ids = [id_ for id_, in conexao.execute("""
+                SELECT id FROM main.vendas
+                WHERE data_venda >= ? AND data_venda < ? AND id > ?
+                ORDER BY id LIMIT ?
+            """, (inicio, fim, ultimo, tamanho_bloco))]
+            if not ids:
+                conexao.execute("COMMIT")
+                return copiadas
+
+            faixa = (inicio, fim, ultimo, ids[-1])
+            conexao.execute(f"""
+                INSERT OR IGNORE INTO arq.vendas ({db.COLUNAS_ARQUIVO['vendas']})
+                SELECT {db.COLUNAS_ARQUIVO['vendas']} FROM main.vendas
+                WHERE data_venda >= ? AND data_venda < ? AND id > ? AND id <= ?
+            """, faixa)
+            conexao.execute(f"""
+                INSERT OR IGNORE INTO arq.itens_venda ({db.COLUNAS_ARQUIVO['itens_venda']})
+                SELECT {db.COLUNAS_ARQUIVO['itens_venda']} FROM main.itens_venda
+                WHERE venda_id IN (
+                    SELECT id FROM main.vendas
+                    WHERE data_venda >= ? AND data_venda < ? AND id > ? AND id <= ?
+                )
+            """, faixa)
+            conexao.execute("""
+                INSERT INTO arq.arquivamento (mes, ultimo_venda_id) VALUES (?, ?)
+                ON CONFLICT (mes) DO UPDATE SET ultimo_venda_id = excluded.ultimo_venda_id
+            """, (mes, ids[-1]))
+            conexao.execute("COMMIT")
+        except Exception:
+            conexao.execute("ROLLBACK")
+            raise
+        ultimo = ids[-1]
+        copiadas += len(ids)
+
+def _apagar(conexao, mes, tamanho_bloco):
+    """Apaga do banco principal, em blocos, as vendas do mês que já estão no arquivo."""
+    inicio, fim = db.limites_mes(mes)
+    apagadas = 0
+    while True:
+        conexao.execute("BEGIN IMMEDIATE")
+        try:
+            ids = [id_ for id_, in conexao.execute("""
+                SELECT v.id FROM main.vendas v
+                WHERE v.data_venda >= ? AND v.data_venda < ?
+                    AND EXISTS (SELECT 1 FROM arq.vendas a WHERE a.id = v.id)
+                ORDER BY v.id LIMIT ?
+            """, (inicio, fim, tamanho_bloco))]
+            if not ids:
+                conexao.execute("COMMIT")
+                return apagadas
+
+            faixa = (inicio, fim, ids[-1])
+            conexao.execute("""
+                DELETE FROM main.itens_venda WHERE venda_id IN (
+                    SELECT id FROM main.vendas
+                    WHERE data_venda >= ? AND data_venda < ? AND id <= ?
+                        AND id IN (SELECT id FROM arq.vendas)
+                )
+            """, faixa)
+            conexao.execute("""
+                DELETE FROM main.vendas
+                WHERE data_venda >= ? AND data_venda < ? AND id <= ?
+                    AND id IN (SELECT id FROM arq.vendas)
+            """, faixa)
+            conexao.execute("COMMIT")
+        except Exception:
+            conexao.execute("ROLLBACK")
+            raise
+        apagadas += len(ids)
+
+def arquivar_mes(conexao, mes, tamanho_bloco):
+    """
+    Leva o mês até 'concluido', a partir da etapa em que estiver.
+    Retorna (vendas, itens, total) arquivados. Levanta ErroIntegridade se
+    as contagens não baterem (nada é apagado antes da conferência).
+    """
+    os.makedirs(Config.ARQUIVO_DIR, exist_ok=True)
+    estado, vendas, itens, total = _estado(conexao, mes)
+    conexao.execute("ATTACH DATABASE ? AS arq",
+                    (os.path.join(Config.ARQUIVO_DIR, db.nome_arquivo_mes(mes)),))
+    try:
+        for comando in ESQUEMA_ARQUIVO:
+            conexao.execute(comando)
+
+        if estado in (None, 'concluido'):
+            _registrar(conexao, mes, 'copiando')
+            estado = 'copiando'
+
+        if estado == 'copiando':
+            _copiar(conexao, mes, tamanho_bloco)
+            # Tudo o que está no banco principal tem de estar igual no arquivo
+            principal = _contagens(conexao, 'main', mes)
+            copiado = _contagens(conexao, 'arq', mes, so_do_principal=True)
+            if principal != copiado:
+                raise ErroIntegridade(
+                    f"{mes}: banco principal {principal} x arquivo {copiado} (vendas, itens, total)"
+                )
+            vendas, itens, total = _contagens(conexao, 'arq', mes)
+            _registrar(conexao, mes, 'apagando', (vendas, itens, total))
+
+        _apagar(conexao, mes, tamanho_bloco)
+
+        restantes = _contagens(conexao, 'main', mes)
+        if restantes[0]:
+            # Vendas do mês que não estavam no arquivo: copia de novo na próxima execução
+            _registrar(conexao, mes, 'copiando')
+            raise ErroIntegridade(f"{mes}: {restantes[0]} vendas fora do arquivo; rode de novo")
+        if _contagens(conexao, 'arq', mes) != (vendas, itens, total):
+            raise ErroIntegridade(f"{mes}: arquivo diferente das contagens registradas")
+        _registrar(conexao, mes, 'concluido')
+        return vendas, itens, total
+    finally:
+        conexao.execute("DETACH DATABASE arq")
+
+# =====================================================
+# JOB E VERIFICAÇÃO
+# =====================================================
+
+def _conectar(banco=None):
+    migracoes.aplicar_migracoes(banco)  # arquivo_vendas_meses precisa existir
+    conexao = sqlite3.connect(banco or Config.DATABASE_PATH,
+                              timeout=Config.DB_BUSY_TIMEOUT_MS / 1000,
+                              isolation_level=None)
+    conexao.execute("PRAGMA journal_mode = WAL")
+    return conexao
+
+def arquivar(ate=None, tamanho_bloco=None, vacuum=False, banco=None):
+    """
+    Arquiva todos os meses elegíveis. Retorna {mes: (vendas, itens, total)}
+    dos meses concluídos nesta execução.
+    """
+    tamanho_bloco = tamanho_bloco or Config.ARQUIVO_BLOCO
+    conexao = _conectar(banco)
+    resultado = {}
+    try:
+        for mes in meses_a_arquivar(conexao, ate):
+            inicio = time.perf_counter()
+            resultado[mes] = arquivar_mes(conexao, mes, tamanho_bloco)
+            vendas, itens, total = resultado[mes]
+            print(f"   ✅ {mes}: {vendas} vendas / {itens} itens / R$ {total:.2f} "
+                  f"({time.perf_counter() - inicio:.1f}s)")
+        if vacuum and resultado:
+            conexao.execute("VACUUM")
+        conexao.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    finally:
+        conexao.close()
+    return resultado
+
+def verificar(banco=None):
+    """
+    Confere os meses concluídos: arquivo íntegro (quick_check), contagens
+    iguais às registradas e nenhuma venda do mês no banco principal.
+    Retorna a lista de problemas (vazia = tudo certo).
+    """
+    conexao = _conectar(banco)
+    problemas = []
+    try:
+        meses = conexao.execute("""
+            SELECT mes, arquivo, vendas, itens, total FROM arquivo_vendas_meses
+            WHERE estado = 'concluido' ORDER BY mes
+        """).fetchall()
+        for mes, arquivo, vendas, itens, total in meses:
+            caminho = os.path.join(Config.ARQUIVO_DIR, arquivo)
+            if not os.path.exists(caminho):
+                problemas.append(f"{mes}: arquivo {caminho} não encontrado")
+                continue
+            conexao.execute("ATTACH DATABASE ? AS arq", (caminho,))
+            try:
+                if conexao.execute("PRAGMA arq.quick_check").fetchone()[0] != 'ok':
+                    problemas.append(f"{mes}: quick_check falhou em {arquivo}")
+                encontrado = _contagens(conexao, 'arq', mes)
+                if encontrado != (vendas, itens, round(total, 2)):
+                    problemas.append(f"{mes}: arquivo {encontrado} x registrado {(vendas, itens, total)}")
+                restantes = _contagens(conexao, 'main', mes)[0]
+                if restantes:
+                    problemas.append(f"{mes}: {restantes} vendas ainda no banco principal")
+            finally:
+                conexao.execute("DETACH DATABASE arq")
+            print(f"   {mes}: {vendas} vendas / {itens} itens")
+    finally:
+        conexao.close()
+    return problemas
+
+# =====================================================
+# LINHA DE COMANDO
+# =====================================================
+
+def _opcao(nome, padrao=None):
+    if nome in sys.argv:
+        return sys.argv[sys.argv.index(nome) + 1]
+    return padrao
+
+if __name__ == '__main__':
+    if '--ajuda' in sys.argv or '-h' in sys.argv:
+        print(__doc__)
+        sys.exit(0)
+
+    print("=" * 60)
+    print("🗄️  ARQUIVAMENTO MENSAL DE VENDAS")
+    print("=" * 60)
+    print(f"Banco: {Config.DATABASE_PATH}")
+    print(f"Arquivos: {Config.ARQUIVO_DIR}")
+
+    try:
+        if '--verificar' in sys.argv:
+            problemas = verificar()
+            if problemas:
+                print("\n❌ Problemas encontrados:")
+                for problema in problemas:
+                    print(f"   {problema}")
+                sys.exit(1)
+            print("\n✅ Meses arquivados conferidos")
+        else:
+            print(f"Mantendo no banco principal desde {primeiro_mes_quente()}\n")
+            bloco = _opcao('--bloco')
+            resultado = arquivar(_opcao('--ate'), int(bloco) if bloco else None, '--vacuum' in sys.argv)
+            print(f"\n✅ {len(resultado)} meses arquivados" if resultado else "\nNada a arquivar")
+    except (ErroIntegridade, OSError, sqlite3.Error) as err:
+        print(f"\n❌ Arquivamento interrompido (rode de novo para retomar): {err}")
+        sys.exit(1)
@@ -0,0 +1,239 @@
+"""
+SISTEMA DE GESTÃO FARMACÊUTICA
+Backup Online do Banco (sem parar o PDV)
+
+Copia o farmacia.db com a API de backup do SQLite, em passos de
+Config.BACKUP_PAGINAS páginas com Config.BACKUP_PAUSA segundos entre eles.
+A origem é aberta somente leitura (mode=ro): em WAL o backup nunca segura
+o lock de escrita, e as pausas deixam o disco livre para os caixas.
+A cópia é conferida com PRAGMA integrity_check, comprimida em gzip
+(Config.BACKUP_DIR/farmacia_AAAAMMDD_HHMMSS.db.gz) e só as
+Config.BACKUP_RETER mais recentes são mantidas.
+
+Se alguém grava na origem entre dois passos, o SQLite recomeça a cópia.
+Depois de Config.BACKUP_MAX_REINICIOS recomeços o backup termina em um
+passo só: em WAL é uma única transação de leitura, que também não trava
+as escritas.
+
+Uso:
+    python backup.py                          -> faz um backup agora
+    python backup.py --verificar arquivo.db.gz   -> descomprime e roda integrity_check
+    python backup.py --listar
+
+No app: com BACKUP_INTERVALO_HORAS definido, uma thread faz o backup
+periodicamente (com vários processos, só um copia por intervalo).
+"""
+
+import glob
+import gzip
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from config import Config
+import db
+
+PADRAO_ARQUIVO = 'farmacia_*.db.gz'
+
+class BackupInvalido(Exception):
+    """A cópia não passou no PRAGMA integrity_check."""
+
+class _RecomecosDemais(Exception):
+    """Interrompe a cópia em passos para terminá-la em um passo só."""
+
+_ultimo = None  # Resultado do último backup deste processo (/api/status/db)
+_backup_lock = threading.Lock()  # Um backup por vez neste processo
+_agendador = None
+_agendador_lock = threading.Lock()
+
+# =====================================================
+# CÓPIA
+# =====================================================
+
+def _copiar_em_passos(origem, destino, paginas, pausa, max_reinicios):
+    """
+    Backup da origem para o destino em passos de `paginas`, dormindo
+    `pausa` s entre eles. Retorna (total de páginas, recomeços).
+    """
+    estado = {'restantes': None, 'reinicios': 0, 'total': 0}
+
+    def progresso(status, restantes, total):
+        # Restantes subindo = a origem mudou e o SQLite recomeçou a cópia
+        if estado['restantes'] is not None and restantes > estado['restantes']:
+            estado['reinicios'] += 1
+            if estado['reinicios'] > max_reinicios:
+                raise _RecomecosDemais()
+        estado['restantes'], estado['total'] = restantes, total
+        if restantes:
+            time.sleep(pausa)
+
+    try:
+        origem.backup(destino, pages=paginas, progress=progresso)
+    except _RecomecosDemais:
+        origem.backup(destino)  # Um passo: uma única transação de leitura
+        estado['total'] = destino.execute("PRAGMA page_count").fetchone()[0]
+    return estado['total'], estado['reinicios']
+
+def verificar_copia(caminho):
+    """PRAGMA integrity_check no arquivo (não comprimido). Levanta BackupInvalido."""
+    conexao = sqlite3.connect(caminho)
+    try:
+        resultado = [row[0] for row in conexao.execute("PRAGMA integrity_check")]
+    finally:
+        conexao.close()
+    if resultado != ['ok']:
+        raise BackupInvalido(f"{caminho}: {'; '.join(resultado[:5])}")
+
+def _comprimir(origem, destino):
+    """gzip em fluxo; grava em .tmp e troca no fim (nunca deixa .gz pela metade)."""
+    with open(origem, 'rb') as entrada, gzip.open(destino + '.tmp', 'wb', compresslevel=6) as saida:
+        shutil.copyfileobj(entrada, saida, 1024 * 1024)
+    os.replace(destino + '.tmp', destino)
+
+def rotacionar(pasta=None, reter=None):
+    """Apaga os backups além dos `reter` mais recentes. Retorna os apagados."""
+    pasta = pasta or Config.BACKUP_DIR
+    reter = Config.BACKUP_RETER if reter is None else reter
+    arquivos = sorted(glob.glob(os.path.join(pasta, PADRAO_ARQUIVO)), reverse=True)
+    apagados = arquivos[reter:]
+    for caminho in apagados:
+        os.remove(caminho)
+    return apagados
+
+def fazer_backup(banco=None, pasta=None):
+    """
+    Backup completo: cópia em passos, integrity_check, gzip e rotação.
+    Retorna um dict com arquivo, tamanhos, páginas, recomeços e segundos.
+    Levanta BackupInvalido, sqlite3.Error ou OSError (nada fica pela metade).
+    """
+    global _ultimo
+    banco = banco or Config.DATABASE_PATH
+    pasta = pasta or Config.BACKUP_DIR
+    os.makedirs(pasta, exist_ok=True)
+    inicio = time.perf_counter()
+    nome = f"farmacia_{datetime.now().strftime('%Y%m%d_%H%M%S')}.db.gz"
+    destino = os.path.join(pasta, nome)
+
+    with _backup_lock, tempfile.TemporaryDirectory(dir=pasta) as temporaria:
+        copia = os.path.join(temporaria, 'farmacia.db')
+        origem = sqlite3.connect(db.uri_banco(banco, 'mode=ro'),
+                                 uri=True, timeout=Config.DB_BUSY_TIMEOUT_MS / 1000)
+        saida = sqlite3.connect(copia)
+        try:
+            paginas, reinicios = _copiar_em_passos(origem, saida, Config.BACKUP_PAGINAS,
+                                                   Config.BACKUP_PAUSA, Config.BACKUP_MAX_REINICIOS)
+            # O cabeçalho copiado diz WAL; o backup é um arquivo avulso
+            saida.execute("PRAGMA journal_mode = DELETE")
+        finally:
+            saida.close()
+            origem.close()
+
+        verificar_copia(copia)
+        tamanho = os.path.getsize(copia)
+        _comprimir(copia, destino)
+
+    _ultimo = {
+        'arquivo': destino,
+        'bytes': tamanho,
+        'bytes_gzip': os.path.getsize(destino),
+        'paginas': paginas,
+        'reinicios': reinicios,
+        'segundos': round(time.perf_counter() - inicio, 2),
+        'concluido_em': datetime.now().isoformat(timespec='seconds'),
+        'apagados': [os.path.basename(caminho) for caminho in rotacionar(pasta)]
+    }
+    return _ultimo
+
+def verificar_backup(caminho):
+    """Descomprime o .db.gz em uma pasta temporária e roda integrity_check."""
+    with tempfile.TemporaryDirectory() as temporaria:
+        copia = os.path.join(temporaria, 'farmacia.db')
+        with gzip.open(caminho, 'rb') as entrada, open(copia, 'wb') as saida:
+            shutil.copyfileobj(entrada, saida, 1024 * 1024)
+        verificar_copia(copia)
+
+# =====================================================
+# AGENDAMENTO NO APP
+# =====================================================
+
+def idade_ultimo_backup(pasta=None):
+    """Segundos desde o backup mais recente da pasta (None se não houver)."""
+    arquivos = glob.glob(os.path.join(pasta or Config.BACKUP_DIR, PADRAO_ARQUIVO))
+    if not arquivos:
+        return None
+    return max(0.0, time.time() - max(os.path.getmtime(caminho) for caminho in arquivos))
+
+def iniciar_agendamento():
+    """
+    Inicia (uma vez por processo) a thread de backup a cada
+    Config.BACKUP_INTERVALO_HORAS horas; sem a configuração não faz nada.
+    Com vários processos, quem encontra um backup recente não copia.
+    """
+    global _agendador
+    if not Config.BACKUP_INTERVALO_HORAS:
+        return
+    intervalo = Config.BACKUP_INTERVALO_HORAS * 3600
+    with _agendador_lock:
+        if _agendador is not None:
+            return
+
+        def agendar():
+            while True:
+                idade = idade_ultimo_backup()
+                if idade is None or idade >= intervalo * 0.9:
+                    try:
+                        fazer_backup()
+                    except (BackupInvalido, sqlite3.Error, OSError) as err:
+                        print(f"[ERRO] backup agendado: {err}")
+                    idade = 0.0
+                time.sleep(max(60.0, intervalo - idade))
+
+        _agendador = threading.Thread(target=agendar, name='backup-agendado', daemon=True)
+        _agendador.start()
+
+def estatisticas_backup():
+    """Último backup deste processo e idade do mais recente na pasta."""
+    idade = idade_ultimo_backup()
+    return {
+        'intervalo_horas': Config.BACKUP_INTERVALO_HORAS,
+        'idade_ultimo_s': None if idade is None else round(idade),
+        'ultimo_deste_processo': _ultimo
+    }
+
+# =====================================================
+# LINHA DE COMANDO
+# =====================================================
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("💾 BACKUP ONLINE DO BANCO")
+    print("=" * 60)
+
+    try:
+        if '--verificar' in sys.argv:
+            caminho = sys.argv[sys.argv.index('--verificar') + 1]
+            verificar_backup(caminho)
+            print(f"✅ {caminho}: integrity_check ok")
+
+        elif '--listar' in sys.argv:
+            for caminho in sorted(glob.glob(os.path.join(Config.BACKUP_DIR, PADRAO_ARQUIVO))):
+                print(f"   {os.path.basename(caminho)}  {os.path.getsize(caminho) / 1024:.1f} KiB")
+
+        else:
+            print(f"Banco: {Config.DATABASE_PATH}")
+            print(f"Destino: {Config.BACKUP_DIR} (mantém {Config.BACKUP_RETER})")
+            resultado = fazer_backup()
+            print(f"\n✅ {resultado['arquivo']}")
+            print(f"   {resultado['paginas']} páginas, {resultado['bytes'] / 1024:.1f} KiB -> "
+                  f"{resultado['bytes_gzip'] / 1024:.1f} KiB em {resultado['segundos']}s "
+                  f"({resultado['reinicios']} recomeços)")
+            for nome in resultado['apagados']:
+                print(f"   🗑️  {nome} (rotação)")
+    except (BackupInvalido, sqlite3.Error, OSError) as err:
+        print(f"\n❌ Backup falhou: {err}")
+        sys.exit(1)
@@ -0,0 +1,939 @@
+"""
+SISTEMA DE GESTÃO FARMACÊUTICA
+Benchmarks da Camada de Dados (db.py)
+
+Roda sempre em um banco TEMPORÁRIO com o mesmo esquema do farmacia.db,
+nunca no banco real.
+
+Uso:
+    python benchmark.py checkout                 -> latência da venda x tamanho do carrinho
+    python benchmark.py checkout --repeticoes 100
+
+    python benchmark.py vazao --caixas 8 --segundos 5 [--sincrono FULL]   -> vendas/s: individual x group commit
+
+    python benchmark.py concorrencia --segundos 5   -> vendas e lotes gravando durante um relatório longo
+                                                       (mode=ro e snapshot; sai com 1 se alguma escrita bloquear)
+
+    python benchmark.py linhas --tamanho medio      -> memória/renderização/JSON: linhas tipadas x dicts
+
+    python benchmark.py fluxo [--templates pasta]   -> /relatorios em fluxo x inteiro: 1º byte e pico de memória
+
+    python benchmark.py suite --tamanho pequeno --salvar base.json
+    python benchmark.py suite --tamanho medio --comparar base.json --tolerancia 20   (%)
+    python benchmark.py suite --tamanho grande --dados grande.db   -> gera uma vez e reaproveita
+
+Tamanhos da suíte (produtos / lotes / itens vendidos):
+    pequeno  1k / 10k / 100k
+    medio    10k / 100k / 1M
+    grande   100k / 1M / 10M
+"""
+
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+from itertools import accumulate
+
+from werkzeug.security import generate_password_hash
+
+from config import Config
+import db
+import migracoes
+
+# =====================================================
+# BANCO TEMPORÁRIO
+# =====================================================
+
+# Tabelas criadas pelo setup_banco.py; o resto vem das migrações
+TABELAS_BASE = ('usuarios', 'produtos', 'estoque_lotes', 'vendas', 'itens_venda')
+
+def criar_banco_temporario(pasta, migrar=True):
+    """
+    Cria um banco vazio com o esquema do farmacia.db (tabelas + migrações)
+    e aponta o db.py para ele. Retorna o caminho do arquivo.
+    Com migrar=False ficam só as tabelas base, sem índices nem triggers
+    (carga rápida de dados sintéticos antes das migrações).
+    """
+    caminho = os.path.join(pasta, 'benchmark.db')
+
+    origem = sqlite3.connect(Config.DATABASE_PATH)
+    marcadores = ", ".join("?" for _ in TABELAS_BASE)
+    tabelas = origem.execute(f"""
+        SELECT sql FROM sqlite_master
+        WHERE type = 'table' AND name IN ({marcadores})
+    """, TABELAS_BASE).fetchall()
+    origem.close()
+
+    destino = sqlite3.connect(caminho)
+    for (sql,) in tabelas:
+        destino.execute(sql)
+    destino.execute("""
+        INSERT INTO usuarios (nome, login, senha_hash, cargo)
+        VALUES ('Benchmark', 'benchmark', '-', 'Gerente')
+    """)
+    destino.commit()
+    destino.close()
+
+    if migrar:
+        migracoes.aplicar_migracoes(caminho)
+    Config.DATABASE_PATH = caminho
+    return caminho
+
+def popular_catalogo(caminho, qtd_produtos, lotes_por_produto=3, qtd_por_lote=100000):
+    """Insere produtos com lotes de saldo alto (as vendas nunca esgotam)."""
+    conexao = sqlite3.connect(caminho)
+    hoje = date.today()
+    conexao.executemany("""
+        INSERT INTO produtos (nome, fabricante, categoria, preco_venda, descricao)
+        VALUES (?, ?, 'Comum', ?, '')
+    """, ((f'Produto {i:06d}', 'Benchmark', round(5 + i % 50, 2)) for i in range(qtd_produtos)))
+    conexao.executemany("""
+        INSERT INTO estoque_lotes (produto_id, numero_lote, data_validade, qtd_atual)
+        VALUES (?, ?, ?, ?)
+    """, (
+        (produto_id, f'B{produto_id}-{n}', (hoje + timedelta(days=30 * (n + 1))).isoformat(), qtd_por_lote)
+        for produto_id in range(1, qtd_produtos + 1)
+        for n in range(lotes_por_produto)
+    ))
+    conexao.commit()
+    conexao.execute("ANALYZE")
+    conexao.close()
+
+# =====================================================
+# DADOS SINTÉTICOS (determinísticos pela semente)
+# =====================================================
+
+VOLUMES = {
+    'pequeno': {'produtos': 1000, 'lotes': 10000, 'itens': 100000},
+    'medio': {'produtos': 10000, 'lotes': 100000, 'itens': 1000000},
+    'grande': {'produtos': 100000, 'lotes': 1000000, 'itens': 10000000},
+}
+
+CATEGORIAS_PESOS = [('Comum', 60), ('Higiene', 20), ('Antibiotico', 12), ('Controlado', 8)]
+RADICAIS = ['Dipirona', 'Paracetamol', 'Ibuprofeno', 'Amoxicilina', 'Omeprazol', 'Losartana',
+            'Sinvastatina', 'Metformina', 'Azitromicina', 'Cetoconazol', 'Loratadina', 'Clonazepam',
+            'Sabonete', 'Shampoo', 'Protetor Solar', 'Escova Dental', 'Fralda', 'Vitamina C']
+DOSES = ['10mg', '20mg', '50mg', '100mg', '250mg', '500mg', '750mg', '1g', '200ml', 'unidade']
+QTD_VENDEDORES = 20
+SENHA_BENCHMARK = 'benchmark'
+DIAS_HISTORICO = 365
+ITENS_POR_VENDA_PESOS = ([1, 2, 3, 4, 5, 6, 8, 10], [30, 25, 18, 12, 7, 4, 2, 2])
+BLOCO_INSERCAO = 50000
+
+def _validade_sintetica(aleatorio, hoje):
+    """~3% vencidos, ~7% vencendo em 30 dias, o resto espalhado em ~2 anos."""
+    sorteio = aleatorio.random()
+    if sorteio < 0.03:
+        dias = -aleatorio.randint(1, 90)
+    elif sorteio < 0.10:
+        dias = aleatorio.randint(0, 30)
+    else:
+        dias = aleatorio.randint(31, 720)
+    return (hoje + timedelta(days=dias)).isoformat()
+
+def gerar_dados(caminho, produtos, lotes, itens, semente=42):
+    """
+    Popula um banco SÓ com as tabelas base (criar_banco_temporario com
+    migrar=False). Mesma semente + mesmo dia = mesmos dados.
+    - produtos: categorias ponderadas, preço log-normal (R$ 2 a R$ 300)
+    - lotes: distribuídos entre os produtos; 10% esgotados; validades realistas
+    - vendas: em ordem cronológica no último ano, 1 a 10 itens, popularidade
+      dos produtos em cauda longa (Zipf)
+    Índices, resumo de estoque, FTS e consolidados são montados depois,
+    de uma vez, pelas migrações.
+    """
+    aleatorio = random.Random(semente)
+    hoje = date.today()
+    conexao = sqlite3.connect(caminho)
+    conexao.execute("PRAGMA synchronous = OFF")
+    conexao.execute("PRAGMA journal_mode = MEMORY")
+
+    # Vendedores com senha conhecida (o hash é calculado uma vez)
+    senha_hash = generate_password_hash(SENHA_BENCHMARK)
+    cargos = ['Atendente', 'Atendente', 'Farmaceutico', 'Gerente']
+    conexao.executemany("""
+        INSERT INTO usuarios (nome, login, senha_hash, cargo) VALUES (?, ?, ?, ?)
+    """, ((f'Vendedor {i:02d}', f'vendedor{i:02d}', senha_hash, cargos[i % len(cargos)])
+          for i in range(QTD_VENDEDORES)))
+    usuario_ids = [row[0] for row in conexao.execute("SELECT id FROM usuarios WHERE login LIKE 'vendedor%'")]
+
+    # Produtos (ids explícitos: 1..produtos)
+    categorias, pesos = zip(*CATEGORIAS_PESOS)
+    precos = [0.0] * (produtos + 1)
+
+    def linhas_produtos():
+        for produto_id in range(1, produtos + 1):
+            preco = round(min(max(aleatorio.lognormvariate(3, 0.8), 2), 300), 2)
+            precos[produto_id] = preco
+            nome = f"{aleatorio.choice(RADICAIS)} {aleatorio.choice(DOSES)} {produto_id:06d}"
+            yield (produto_id, nome, f'Laboratório {aleatorio.randrange(200):03d}',
+                   aleatorio.choices(categorias, pesos)[0], preco, '')
+
+    conexao.executemany("""
+        INSERT INTO produtos (id, nome, fabricante, categoria, preco_venda, descricao)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, linhas_produtos())
+
+    # Lotes: o lote k pertence ao produto (k - 1) % produtos + 1, então os
+    # lotes do produto p são p, p + produtos, p + 2*produtos, ...
+    def linhas_lotes():
+        for lote_id in range(1, lotes + 1):
+            produto_id = (lote_id - 1) % produtos + 1
+            qtd = 0 if aleatorio.random() < 0.10 else aleatorio.randint(1, 500)
+            yield (lote_id, produto_id, f'L{lote_id:08d}', _validade_sintetica(aleatorio, hoje), qtd)
+
+    conexao.executemany("""
+        INSERT INTO estoque_lotes (id, produto_id, numero_lote, data_validade, qtd_atual)
+        VALUES (?, ?, ?, ?, ?)
+    """, linhas_lotes())
+    lotes_do_produto = [0] + [lotes // produtos + (1 if p - 1 < lotes % produtos else 0)
+                              for p in range(1, produtos + 1)]
+
+    # Popularidade em cauda longa: poucos produtos concentram as vendas
+    ranking = list(range(1, produtos + 1))
+    aleatorio.shuffle(ranking)
+    pesos_acumulados = list(accumulate(1 / (posicao ** 1.1) for posicao in range(1, produtos + 1)))
+
+    # Vendas em ordem cronológica (ids crescem com a data, como em produção)
+    media_itens = sum(q * p for q, p in zip(*ITENS_POR_VENDA_PESOS)) / sum(ITENS_POR_VENDA_PESOS[1])
+    qtd_vendas_estimada = max(1, int(itens / media_itens))
+    inicio = datetime.combine(hoje - timedelta(days=DIAS_HISTORICO), datetime.min.time())
+    passo = DIAS_HISTORICO * 86400 / qtd_vendas_estimada
+
+    vendas, itens_venda = [], []
+    venda_id = item_id = 0
+    while item_id < itens:
+        venda_id += 1
+        quantidade_itens = min(aleatorio.choices(*ITENS_POR_VENDA_PESOS)[0], itens - item_id)
+        escolhidos = aleatorio.choices(ranking, cum_weights=pesos_acumulados, k=quantidade_itens)
+        total = 0.0
+        for produto_id in escolhidos:
+            item_id += 1
+            quantidade = aleatorio.choice((1, 1, 1, 2, 2, 3))
+            lote_id = produto_id + aleatorio.randrange(max(lotes_do_produto[produto_id], 1)) * produtos
+            subtotal = round(precos[produto_id] * quantidade, 2)
+            total += subtotal
+            itens_venda.append((item_id, venda_id, produto_id, lote_id, quantidade,
+                                precos[produto_id], subtotal))
+        momento = inicio + timedelta(seconds=(venda_id - 1) * passo + aleatorio.random() * passo)
+        vendas.append((venda_id, momento.strftime('%Y-%m-%d %H:%M:%S'), round(total, 2),
+                       aleatorio.choice(usuario_ids)))
+
+        if len(itens_venda) >= BLOCO_INSERCAO or item_id >= itens:
+            conexao.executemany("""
+                INSERT INTO vendas (id, data_venda, total, usuario_id) VALUES (?, ?, ?, ?)
+            """, vendas)
+            conexao.executemany("""
+                INSERT INTO itens_venda (id, venda_id, produto_id, lote_id, quantidade, preco_unitario, subtotal)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, itens_venda)
+            vendas, itens_venda = [], []
+
+    conexao.commit()
+    conexao.close()
+    return {'produtos': produtos, 'lotes': lotes, 'itens': item_id, 'vendas': venda_id}
+
+def preparar_banco_suite(pasta, volumes, semente, dados=None):
+    """
+    Banco temporário com os dados sintéticos e as migrações aplicadas.
+    Com `dados`, o banco gerado é guardado nesse arquivo e reaproveitado
+    nas próximas execuções (a suíte sempre trabalha numa cópia).
+    """
+    if dados and os.path.exists(dados):
+        caminho = os.path.join(pasta, 'benchmark.db')
+        shutil.copyfile(dados, caminho)
+        Config.DATABASE_PATH = caminho
+    else:
+        caminho = criar_banco_temporario(pasta, migrar=False)
+        inicio = time.perf_counter()
+        gerado = gerar_dados(caminho, semente=semente, **volumes)
+        print(f"Dados gerados em {time.perf_counter() - inicio:.1f}s: {gerado}")
+
+    # Índices, resumo, FTS e consolidados em lote, sobre os dados já carregados
+    inicio = time.perf_counter()
+    migracoes.aplicar_migracoes(caminho)
+    print(f"Migrações aplicadas em {time.perf_counter() - inicio:.1f}s")
+
+    if dados and not os.path.exists(dados):
+        shutil.copyfile(caminho, dados)
+    return caminho
+
+# =====================================================
+# ESTATÍSTICAS
+# =====================================================
+
+def percentil(amostras, p):
+    """Percentil p (0-100) por interpolação linear."""
+    ordenadas = sorted(amostras)
+    if not ordenadas:
+        return 0.0
+    k = (len(ordenadas) - 1) * p / 100
+    inferior = int(k)
+    superior = min(inferior + 1, len(ordenadas) - 1)
+    return ordenadas[inferior] + (ordenadas[superior] - ordenadas[inferior]) * (k - inferior)
+
+def resumo(amostras_ms):
+    """Dicionário com p50/p95/p99/média em milissegundos."""
+    return {
+        'p50': round(percentil(amostras_ms, 50), 3),
+        'p95': round(percentil(amostras_ms, 95), 3),
+        'p99': round(percentil(amostras_ms, 99), 3),
+        'media': round(sum(amostras_ms) / len(amostras_ms), 3) if amostras_ms else 0.0,
+        'n': len(amostras_ms)
+    }
+
+# =====================================================
+# CENÁRIO: CHECKOUT x TAMANHO DO CARRINHO
+# =====================================================
+
+TAMANHOS_CARRINHO = [1, 5, 10, 30, 60, 100]
+
+def benchmark_checkout(repeticoes=50, qtd_produtos=2000):
+    """
+    Mede db.registrar_venda() para carrinhos de tamanhos crescentes.
+    Com a resolução do carrinho em uma consulta e executemany, a latência
+    deve crescer bem devagar com o número de linhas.
+    """
+    usuario_id = 1
+    aleatorio = random.Random(42)
+    resultados = {}
+
+    for tamanho in TAMANHOS_CARRINHO:
+        amostras = []
+        for _ in range(repeticoes):
+            produtos = aleatorio.sample(range(1, qtd_produtos + 1), tamanho)
+            itens = [
+                {'produto_id': p, 'quantidade': aleatorio.randint(1, 3), 'preco': 10.0}
+                for p in produtos
+            ]
+            inicio = time.perf_counter()
+            venda_id = db.registrar_venda(itens, usuario_id)
+            amostras.append((time.perf_counter() - inicio) * 1000)
+            if not venda_id:
+                raise RuntimeError("registrar_venda falhou durante o benchmark")
+        resultados[tamanho] = resumo(amostras)
+
+    return resultados
+
+def imprimir_checkout(resultados):
+    print(f"\n{'Itens':>6} | {'p50 ms':>8} | {'p95 ms':>8} | {'p99 ms':>8} | {'ms/item':>8}")
+    print("-" * 50)
+    for tamanho, r in resultados.items():
+        print(f"{tamanho:>6} | {r['p50']:>8.3f} | {r['p95']:>8.3f} | {r['p99']:>8.3f} | {r['p50'] / tamanho:>8.3f}")
+
+# =====================================================
+# CENÁRIO: VAZÃO DE VENDAS (individual x group commit)
+# =====================================================
+
+def benchmark_vazao(caixas=8, segundos=5, qtd_produtos=2000):
+    """
+    Vários caixas (threads) vendendo sem parar por `segundos`, primeiro
+    com um commit por venda e depois com o EscritorVendas (group commit).
+    Retorna {modo: p50/p95/p99 + vendas_por_segundo + falhas}.
+    """
+    original = Config.VENDAS_GRUPO_COMMIT
+    resultados = {}
+
+    for modo, grupo in (('individual', False), ('grupo', True)):
+        Config.VENDAS_GRUPO_COMMIT = grupo
+        latencias = []
+        falhas = [0]
+        lock = threading.Lock()
+        fim = time.perf_counter() + segundos
+
+        def caixa(semente):
+            aleatorio = random.Random(semente)
+            minhas, erros = [], 0
+            while time.perf_counter() < fim:
+                itens = [{'produto_id': p, 'quantidade': 1, 'preco': 10.0}
+                         for p in aleatorio.sample(range(1, qtd_produtos + 1), 3)]
+                inicio = time.perf_counter()
+                try:
+                    if not db.registrar_venda(itens, 1):
+                        erros += 1
+                except db.BancoOcupado:
+                    erros += 1
+                minhas.append((time.perf_counter() - inicio) * 1000)
+            with lock:
+                latencias.extend(minhas)
+                falhas[0] += erros
+
+        threads = [threading.Thread(target=caixa, args=(n,)) for n in range(caixas)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        resultados[modo] = resumo(latencias)
+        resultados[modo]['vendas_por_segundo'] = round((len(latencias) - falhas[0]) / segundos, 1)
+        resultados[modo]['falhas'] = falhas[0]
+        if grupo:
+            resultados[modo]['grupos'] = db.estatisticas_escritor_vendas()
+            db.parar_escritor_vendas()
+
+    Config.VENDAS_GRUPO_COMMIT = original
+    return resultados
+
+def imprimir_vazao(resultados):
+    print(f"\n{'Modo':<11} | {'vendas/s':>9} | {'p50 ms':>8} | {'p99 ms':>8} | {'falhas':>6}")
+    print("-" * 55)
+    for modo, r in resultados.items():
+        print(f"{modo:<11} | {r['vendas_por_segundo']:>9.1f} | {r['p50']:>8.3f} | {r['p99']:>8.3f} | {r['falhas']:>6}")
+    grupos = resultados.get('grupo', {}).get('grupos')
+    if grupos:
+        print(f"\nGroup commit: {grupos['grupos']} commits, média de {grupos['media_por_grupo']} "
+              f"vendas por commit (maior: {grupos['maior_grupo']})")
+
+# =====================================================
+# CENÁRIO: ESCRITAS DURANTE UM RELATÓRIO LONGO
+# =====================================================
+
+ESCRITA_MAX_MS = 250  # Nenhuma venda/lote pode demorar mais que isso com o relatório aberto
+
+def benchmark_concorrencia(segundos=5, qtd_produtos=2000, snapshot=None):
+    """
+    Um relatório longo pelo caminho de leitura (get_db_connection_relatorio):
+    transação de leitura aberta por `segundos`, agregando sem parar. Ao
+    mesmo tempo um caixa vende e o estoque recebe lotes. Em WAL, com a
+    leitura em mode=ro, as escritas não podem esperar pelo relatório.
+    Com `snapshot` (caminho), o relatório lê a cópia do snapshot.
+    As escritas rodam com ESCRITA_PRAZO = 0: uma única tentativa de pegar o
+    lock, então qualquer espera pelo relatório vira BancoOcupado e conta
+    como bloqueio (não depende do tempo da máquina).
+    Retorna latências das escritas, falhas, bloqueios, o pool usado pelo
+    relatório e se a conexão de leitura recusou escrever.
+    """
+    aberto = threading.Event()
+    encerrar = threading.Event()
+    agregacoes = [0]
+    erros = []
+    pool_relatorio = [None]
+
+    Config.RELATORIOS_SNAPSHOT = snapshot
+    if snapshot:
+        db.atualizar_snapshot_relatorios(forcar=True)
+
+    def relatorio():
+        conexao = db.get_db_connection_relatorio()
+        pool_relatorio[0] = conexao.pool.nome
+        try:
+            cursor = conexao.cursor()
+            cursor.execute("BEGIN")
+            cursor.execute("SELECT COUNT(*), SUM(total) FROM vendas").fetchone()
+            aberto.set()
+            while not encerrar.is_set():
+                cursor.execute("""
+                    WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 100000)
+                    SELECT SUM(i) FROM n
+                """).fetchone()
+                cursor.execute("SELECT COUNT(*), SUM(qtd_atual) FROM estoque_lotes").fetchone()
+                agregacoes[0] += 1
+            conexao.rollback()
+        except sqlite3.Error as err:
+            erros.append(err)
+            aberto.set()
+        finally:
+            conexao.close()
+
+    thread = threading.Thread(target=relatorio)
+    thread.start()
+    aberto.wait()
+
+    aleatorio = random.Random(7)
+    validade = (date.today() + timedelta(days=365)).isoformat()
+    latencias = {'registrar_venda': [], 'criar_lote': []}
+    falhas = 0
+    bloqueios = 0
+    prazo_original = Config.ESCRITA_PRAZO
+    Config.ESCRITA_PRAZO = 0
+    fim = time.perf_counter() + segundos
+    n = 0
+    try:
+        while time.perf_counter() < fim:
+            n += 1
+            inicio = time.perf_counter()
+            try:
+                if n % 2:
+                    itens = [{'produto_id': p, 'quantidade': 1}
+                             for p in aleatorio.sample(range(1, qtd_produtos + 1), 3)]
+                    nome = 'registrar_venda'
+                    ok = db.registrar_venda(itens, 1)
+                else:
+                    nome = 'criar_lote'
+                    ok = db.criar_lote(aleatorio.randint(1, qtd_produtos), f'CONC-{n}', validade, 50)
+            except db.BancoOcupado:
+                bloqueios += 1
+                ok = True
+            latencias[nome].append((time.perf_counter() - inicio) * 1000)
+            falhas += not ok
+    finally:
+        Config.ESCRITA_PRAZO = prazo_original
+        encerrar.set()
+        thread.join()
+
+    # A conexão de leitura tem de recusar escrita (mode=ro de verdade)
+    conexao = db.get_db_connection_leitura()
+    try:
+        conexao.execute("UPDATE versoes_cache SET versao = versao WHERE nome = 'catalogo'")
+        somente_leitura = False
+    except sqlite3.OperationalError:
+        somente_leitura = True
+    finally:
+        conexao.close()
+
+    resultados = {nome: resumo(amostras) for nome, amostras in latencias.items()}
+    for nome, amostras in latencias.items():
+        resultados[nome]['max'] = round(max(amostras), 3) if amostras else 0.0
+    resultados['falhas'] = falhas
+    resultados['bloqueios'] = bloqueios
+    resultados['pool_relatorio'] = pool_relatorio[0]
+    resultados['pool_esperado'] = 'snapshot' if snapshot else 'leitura'
+    resultados['agregacoes'] = agregacoes[0]
+    resultados['erros_relatorio'] = [str(err) for err in erros]
+    resultados['somente_leitura'] = somente_leitura
+    return resultados
+
+def imprimir_concorrencia(resultados):
+    """Imprime a tabela e devolve a lista de problemas (vazia = passou)."""
+    print(f"\n{'Escrita':<16} | {'n':>6} | {'p50 ms':>8} | {'p99 ms':>8} | {'max ms':>8}")
+    print("-" * 58)
+    problemas = []
+    for nome in ('registrar_venda', 'criar_lote'):
+        r = resultados[nome]
+        print(f"{nome:<16} | {r['n']:>6} | {r['p50']:>8.3f} | {r['p99']:>8.3f} | {r['max']:>8.3f}")
+        if not r['n'] or r['max'] > ESCRITA_MAX_MS:
+            problemas.append(f"{nome} (max {r['max']} ms > {ESCRITA_MAX_MS} ms)")
+    print(f"\nRelatório: {resultados['agregacoes']} agregações na mesma transação de leitura "
+          f"(pool {resultados['pool_relatorio']})")
+    if resultados['bloqueios']:
+        problemas.append(f"{resultados['bloqueios']} escritas bloquearam esperando o relatório")
+    if resultados['falhas']:
+        problemas.append(f"{resultados['falhas']} escritas falharam")
+    if resultados['pool_relatorio'] != resultados['pool_esperado']:
+        problemas.append(f"relatório leu do pool {resultados['pool_relatorio']}, "
+                         f"não de {resultados['pool_esperado']}")
+    if resultados['erros_relatorio'] or not resultados['agregacoes']:
+        problemas.append(f"relatório não rodou: {resultados['erros_relatorio']}")
+    if not resultados['somente_leitura']:
+        problemas.append("conexão de leitura aceitou escrita")
+    return problemas
+
+# =====================================================
+# CENÁRIO: LINHAS TIPADAS x DICTS (catálogo e relatórios)
+# =====================================================
+
+# Trechos das tabelas de produtos.html e relatorios.html (mesmos filtros)
+TEMPLATES_LINHAS = {
+    'catalogo': """{% for p in linhas %}<tr><td>{{ p.nome }}</td><td>{{ p.fabricante }}</td>
+<td>{{ p.categoria }}</td><td>{{ p.estoque_total }}</td><td>{{ p.validade_mais_proxima|format_date }}</td>
+<td>R$ {{ '%.2f'|format(p.preco_venda) }}</td></tr>{% endfor %}""",
+    'lotes': """{% for lote in linhas %}<tr><td>{{ lote.produto_nome }}</td><td>{{ lote.numero_lote }}</td>
+<td>{{ lote.data_validade|format_date }}</td><td>{{ lote.qtd_atual }}</td><td>{{ lote.dias_para_vencer }}</td></tr>{% endfor %}""",
+    'vendas': """{% for venda in linhas %}<tr><td>#{{ venda.id }}</td>
+<td>{{ venda.data_venda|format_datetime('%d/%m/%Y %H:%M:%S') }}</td><td>{{ venda.vendedor }}</td>
+<td>R$ {{ '%.2f'|format(venda.total) }}</td></tr>{% endfor %}"""
+}
+
+def _linhas_como_dicts(cursor, tipo):
+    """O formato anterior: um dict por linha, datas em texto."""
+    return [dict(row) for row in cursor.fetchall()]
+
+def _medir_consulta(consulta):
+    """(resultado, KiB retidos) de uma consulta a frio, pelo tracemalloc."""
+    db.limpar_cache_catalogo()
+    tracemalloc.start()
+    antes = tracemalloc.get_traced_memory()[0]
+    resultado = consulta()
+    retidos = tracemalloc.get_traced_memory()[0] - antes
+    tracemalloc.stop()
+    return resultado, round(retidos / 1024, 1)
+
+def benchmark_linhas(repeticoes=20):
+    """
+    Para o catálogo inteiro (listar_produtos), os lotes vencendo em 90 dias
+    e as 5000 vendas mais recentes: memória retida pelo resultado, tempo de
+    renderização da tabela do template e do JSON, nas linhas tipadas e no
+    formato anterior (dicts). As duas renderizações têm de ser iguais.
+    """
+    from app import app as aplicacao  # Depois do banco temporário (o app migra ao importar)
+
+    consultas = {
+        'catalogo': lambda: db.listar_produtos(),
+        'lotes': lambda: db.get_lotes_vencendo(90),
+        'vendas': lambda: db.get_vendas_recentes(limite=5000)
+    }
+    # Formatação do jsonify: indentado com o app em debug, compacto em produção
+    formato_json = {'indent': 2} if aplicacao.debug else {'separators': (',', ':')}
+    resultados = {}
+    for nome, consulta in consultas.items():
+        template = aplicacao.jinja_env.from_string(TEMPLATES_LINHAS[nome])
+        medicoes = {}
+        for formato in ('dicts', 'tipadas'):
+            original = db._linhas
+            if formato == 'dicts':
+                db._linhas = _linhas_como_dicts
+            try:
+                linhas, kib = _medir_consulta(consulta)
+            finally:
+                db._linhas = original
+            html = template.render(linhas=linhas)
+            tempos_html, tempos_json = [], []
+            for _ in range(repeticoes):
+                inicio = time.perf_counter()
+                template.render(linhas=linhas)
+                tempos_html.append((time.perf_counter() - inicio) * 1000)
+                inicio = time.perf_counter()
+                texto_json = aplicacao.json.dumps(linhas, **formato_json)
+                tempos_json.append((time.perf_counter() - inicio) * 1000)
+            medicoes[formato] = {
+                'linhas': len(linhas), 'kib': kib, 'html': html, 'json': texto_json,
+                'render_ms': resumo(tempos_html)['p50'], 'json_ms': resumo(tempos_json)['p50']
+            }
+        resultados[nome] = medicoes
+    db.limpar_cache_catalogo()
+    return resultados
+
+def imprimir_linhas(resultados):
+    """Imprime a tabela e devolve a lista de problemas (vazia = passou)."""
+    print(f"\n{'Conjunto':<10} | {'Linhas':>7} | {'KiB dict':>9} | {'KiB tip.':>9} | "
+          f"{'HTML dict':>9} | {'HTML tip.':>9} | {'JSON dict':>9} | {'JSON tip.':>9}")
+    print("-" * 94)
+    problemas = []
+    for nome, r in resultados.items():
+        d, t = r['dicts'], r['tipadas']
+        print(f"{nome:<10} | {t['linhas']:>7} | {d['kib']:>9.1f} | {t['kib']:>9.1f} | "
+              f"{d['render_ms']:>9.3f} | {t['render_ms']:>9.3f} | {d['json_ms']:>9.3f} | {t['json_ms']:>9.3f}")
+        if d['html'] != t['html']:
+            problemas.append(f"{nome}: HTML diferente do formato anterior")
+        if d['json'] != t['json']:
+            problemas.append(f"{nome}: JSON diferente do formato anterior")
+    print("\n(tempos em ms, mediana)")
+    return problemas
+
+# =====================================================
+# CENÁRIO: RELATÓRIOS EM FLUXO x RENDERIZAÇÃO INTEIRA
+# =====================================================
+
+QUANTIDADES_FLUXO = [1000, 10000, 50000]
+
+def _lotes_vencendo_ate(caminho, quantidade):
+    """Completa os lotes que vencem nos próximos 30 dias até `quantidade`."""
+    conexao = sqlite3.connect(caminho)
+    existentes = conexao.execute(
+        "SELECT COUNT(*) FROM estoque_lotes WHERE numero_lote LIKE 'FLUXO-%'").fetchone()[0]
+    conexao.executemany("""
+        INSERT INTO estoque_lotes (produto_id, numero_lote, data_validade, qtd_atual)
+        VALUES (?, ?, date('now', ?), 10)
+    """, ((1 + i % 500, f'FLUXO-{i}', f'+{i % 30} days') for i in range(existentes, quantidade)))
+    conexao.commit()
+    conexao.close()
+
+def benchmark_fluxo(caminho, pasta_templates=None, repeticoes=5):
+    """
+    A tela de relatórios com QUANTIDADES_FLUXO lotes vencendo, renderizada
+    inteira (lista + render_template, como antes) e em fluxo
+    (iterar_lotes_vencendo + _renderizar_em_fluxo): tempo até o primeiro
+    pedaço, tempo total e pico de memória (tracemalloc). O HTML tem de ser
+    o mesmo nos dois modos.
+    """
+    from flask import render_template, session
+    import app as modulo_app  # Depois do banco temporário (o app migra ao importar)
+
+    aplicacao = modulo_app.app
+    if pasta_templates:
+        aplicacao.template_folder = pasta_templates
+    contexto = {'vendas': [], 'resumo_mes': None, 'top_produtos': []}
+
+    def inteiro():
+        db.limpar_cache_catalogo()
+        inicio = time.perf_counter()
+        html = render_template('relatorios.html', lotes_vencendo=db.get_lotes_vencendo(), **contexto)
+        return time.perf_counter() - inicio, html
+
+    def em_fluxo(guardar=True):
+        # guardar=False descarta cada pedaço, como o servidor depois de enviá-lo
+        db.limpar_cache_catalogo()
+        inicio = time.perf_counter()
+        pedacos = iter(modulo_app._renderizar_em_fluxo(
+            'relatorios.html', lotes_vencendo=db.iterar_lotes_vencendo(), **contexto).response)
+        html = [next(pedacos)]
+        primeiro = time.perf_counter() - inicio
+        for pedaco in pedacos:
+            if guardar:
+                html.append(pedaco)
+        return primeiro, ''.join(html)
+
+    def pico(funcao):
+        tracemalloc.start()
+        funcao()
+        maximo = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return round(maximo / 1024 / 1024, 1)
+
+    resultados = []
+    for quantidade in QUANTIDADES_FLUXO:
+        _lotes_vencendo_ate(caminho, quantidade)
+        with aplicacao.test_request_context('/relatorios'):
+            session.update({'user_id': 1, 'user_nome': 'Benchmark', 'user_cargo': 'Gerente'})
+            medicoes = {'inteiro': [], 'fluxo': [], 'fluxo_total': []}
+            for _ in range(repeticoes):
+                medicoes['inteiro'].append(inteiro()[0] * 1000)
+                inicio = time.perf_counter()
+                primeiro, _html = em_fluxo()
+                medicoes['fluxo_total'].append((time.perf_counter() - inicio) * 1000)
+                medicoes['fluxo'].append(primeiro * 1000)
+            resultados.append({
+                'lotes': quantidade,
+                'inteiro_ms': resumo(medicoes['inteiro'])['p50'],
+                'primeiro_byte_ms': resumo(medicoes['fluxo'])['p50'],
+                'fluxo_total_ms': resumo(medicoes['fluxo_total'])['p50'],
+                'pico_inteiro_mib': pico(inteiro),
+                'pico_fluxo_mib': pico(lambda: em_fluxo(guardar=False)),
+                'iguais': inteiro()[1] == em_fluxo()[1]
+            })
+    db.limpar_cache_catalogo()
+    return resultados
+
+def imprimir_fluxo(resultados):
+    """Imprime a tabela e devolve a lista de problemas (vazia = passou)."""
+    print(f"\n{'Lotes':>7} | {'Inteiro ms':>10} | {'1º byte ms':>10} | {'Fluxo ms':>9} | "
+          f"{'Pico inteiro MiB':>16} | {'Pico fluxo MiB':>14}")
+    print("-" * 84)
+    problemas = []
+    for r in resultados:
+        print(f"{r['lotes']:>7} | {r['inteiro_ms']:>10.1f} | {r['primeiro_byte_ms']:>10.1f} | "
+              f"{r['fluxo_total_ms']:>9.1f} | {r['pico_inteiro_mib']:>16.1f} | {r['pico_fluxo_mib']:>14.1f}")
+        if not r['iguais']:
+            problemas.append(f"{r['lotes']} lotes: HTML em fluxo diferente do inteiro")
+    return problemas
+
+# =====================================================
+# SUÍTE: FUNÇÕES DO db.py SOBRE DADOS SINTÉTICOS
+# =====================================================
+
+def _cenarios_suite(caminho, aleatorio):
+    """{nome: função sem argumentos} com entradas sorteadas a cada chamada."""
+    conexao = sqlite3.connect(caminho)
+    com_estoque = [row[0] for row in conexao.execute(
+        "SELECT produto_id FROM produto_estoque_resumo WHERE estoque_total >= 50"
+    )]
+    cursores = conexao.execute("SELECT nome, id FROM produtos").fetchall()
+    logins = [row[0] for row in conexao.execute("SELECT login FROM usuarios WHERE login LIKE 'vendedor%'")]
+    vendedor_id = conexao.execute("SELECT MIN(id) FROM usuarios WHERE login LIKE 'vendedor%'").fetchone()[0]
+    conexao.close()
+
+    fim = date.today().isoformat()
+    inicio_mes = (date.today() - timedelta(days=30)).isoformat()
+
+    def exigir(resultado, nome):
+        if not resultado:
+            raise RuntimeError(f"{nome} não retornou resultado durante o benchmark")
+        return resultado
+
+    def listar_produtos_frio():
+        db.limpar_cache_catalogo()
+        exigir(db.listar_produtos(), 'listar_produtos')
+
+    def listar_produtos_pagina():
+        nome, produto_id = aleatorio.choice(cursores)
+        db.listar_produtos_pagina(Config.PRODUTOS_POR_PAGINA, nome, produto_id)
+
+    def get_lotes_vencendo_frio():
+        db.limpar_cache_catalogo()
+        db.get_lotes_vencendo()
+
+    def registrar_venda():
+        itens = [{'produto_id': p, 'quantidade': 1, 'preco': 10.0}
+                 for p in aleatorio.sample(com_estoque, 3)]
+        exigir(db.registrar_venda(itens, vendedor_id, controlado_liberado=True), 'registrar_venda')
+
+    return {
+        'verificar_login': lambda: exigir(
+            db.verificar_login(aleatorio.choice(logins), SENHA_BENCHMARK), 'verificar_login'),
+        'listar_produtos (frio)': listar_produtos_frio,
+        'listar_produtos (cache)': lambda: db.listar_produtos(),
+        'listar_produtos_pagina': listar_produtos_pagina,
+        'buscar_produtos': lambda: db.buscar_produtos(aleatorio.choice(RADICAIS)[:4]),
+        'get_lote_fefo': lambda: db.get_lote_fefo(aleatorio.choice(com_estoque), 1),
+        'get_lotes_vencendo (frio)': get_lotes_vencendo_frio,
+        'get_vendas_recentes': lambda: exigir(db.get_vendas_recentes(limite=20), 'get_vendas_recentes'),
+        'registrar_venda': registrar_venda,
+        'resumo_vendas_periodo': lambda: db.resumo_vendas_periodo(inicio_mes, fim),
+        'ranking_vendas': lambda: db.ranking_vendas('produtos', inicio_mes, fim),
+    }
+
+def executar_suite(caminho, repeticoes=30, semente=42):
+    """Mede cada cenário (1 chamada de aquecimento + `repeticoes` medidas)."""
+    aleatorio = random.Random(semente)
+    resultados = {}
+    for nome, cenario in _cenarios_suite(caminho, aleatorio).items():
+        cenario()
+        amostras = []
+        for _ in range(repeticoes):
+            inicio = time.perf_counter()
+            cenario()
+            amostras.append((time.perf_counter() - inicio) * 1000)
+        resultados[nome] = resumo(amostras)
+        print(f"   {nome:<28} p50 {resultados[nome]['p50']:>9.3f} ms")
+    return resultados
+
+def _commit_atual():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, cwd=Config.BASE_DIR, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def montar_baseline(tamanho, volumes, semente, repeticoes, resultados):
+    """Resultado da suíte + metadados para comparar execuções entre commits."""
+    return {
+        'meta': {
+            'tamanho': tamanho,
+            'volumes': volumes,
+            'semente': semente,
+            'repeticoes': repeticoes,
+            'data': datetime.now().isoformat(timespec='seconds'),
+            'commit': _commit_atual(),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version
+        },
+        'resultados': resultados
+    }
+
+PISO_REGRESSAO_MS = 0.1  # Diferenças menores que isso são ruído de medição
+
+def comparar_baseline(atual, anterior, tolerancia=0.20):
+    """
+    Imprime p50/p95 antes x agora. Retorna os cenários que pioraram mais
+    que `tolerancia` (fração) em p50 ou p95, e em pelo menos PISO_REGRESSAO_MS.
+    """
+    if atual['meta']['volumes'] != anterior['meta']['volumes']:
+        print("⚠️  Volumes diferentes entre as execuções; a comparação é só indicativa.")
+
+    print(f"\nComparando com {anterior['meta'].get('commit') or '?'} ({anterior['meta']['data']})")
+    print(f"{'Cenário':<28} | {'p50 antes':>10} | {'p50 agora':>10} | {'Δ p50':>7} | {'Δ p95':>7}")
+    print("-" * 76)
+
+    regressoes = []
+    for nome, agora in atual['resultados'].items():
+        antes = anterior['resultados'].get(nome)
+        if not antes:
+            print(f"{nome:<28} | {'-':>10} | {agora['p50']:>10.3f} | {'novo':>7} | {'':>7}")
+            continue
+        variacoes = [
+            (agora[chave] - antes[chave]) / antes[chave] if antes[chave] else 0.0
+            for chave in ('p50', 'p95')
+        ]
+        piorou = any(
+            variacao > tolerancia and agora[chave] - antes[chave] > PISO_REGRESSAO_MS
+            for variacao, chave in zip(variacoes, ('p50', 'p95'))
+        )
+        if piorou:
+            regressoes.append(nome)
+        print(f"{nome:<28} | {antes['p50']:>10.3f} | {agora['p50']:>10.3f} | "
+              f"{variacoes[0]:>+7.0%} | {variacoes[1]:>+7.0%}{'  ❌' if piorou else ''}")
+    return regressoes
+
+# =====================================================
+# LINHA DE COMANDO
+# =====================================================
+
+def _argumento(nome, padrao):
+    if nome in sys.argv:
+        return int(sys.argv[sys.argv.index(nome) + 1])
+    return padrao
+
+def _opcao(nome, padrao=None):
+    if nome in sys.argv:
+        return sys.argv[sys.argv.index(nome) + 1]
+    return padrao
+
+if __name__ == '__main__':
+    cenario = sys.argv[1] if len(sys.argv) > 1 else 'checkout'
+    repeticoes = _argumento('--repeticoes', 50 if cenario == 'checkout' else 30)
+    regressoes = []
+
+    print("=" * 60)
+    print("⏱️  BENCHMARK DO BANCO DE DADOS")
+    print("=" * 60)
+
+    with tempfile.TemporaryDirectory() as pasta:
+        if cenario == 'checkout':
+            caminho = criar_banco_temporario(pasta)
+            popular_catalogo(caminho, 2000)
+            print(f"Cenário: checkout | {repeticoes} vendas por tamanho de carrinho")
+            imprimir_checkout(benchmark_checkout(repeticoes))
+
+        elif cenario == 'vazao':
+            Config.DB_SYNCHRONOUS = _opcao('--sincrono', Config.DB_SYNCHRONOUS).upper()
+            caminho = criar_banco_temporario(pasta)
+            popular_catalogo(caminho, 2000)
+            caixas = _argumento('--caixas', 8)
+            segundos = _argumento('--segundos', 5)
+            print(f"Cenário: vazão | {caixas} caixas | {segundos}s por modo | synchronous={Config.DB_SYNCHRONOUS}")
+            imprimir_vazao(benchmark_vazao(caixas, segundos))
+
+        elif cenario == 'concorrencia':
+            caminho = criar_banco_temporario(pasta)
+            popular_catalogo(caminho, 2000)
+            segundos = _argumento('--segundos', 5)
+            for snapshot in (None, os.path.join(pasta, 'snapshot.db')):
+                print(f"\nCenário: concorrência | {segundos}s de relatório aberto "
+                      f"({'snapshot' if snapshot else 'mode=ro'}) | escritas até {ESCRITA_MAX_MS} ms, sem bloqueio")
+                regressoes += imprimir_concorrencia(benchmark_concorrencia(segundos, snapshot=snapshot))
+            db.get_pool_snapshot().fechar_todas()
+
+        elif cenario == 'linhas':
+            tamanho = _opcao('--tamanho', 'medio')
+            if tamanho not in VOLUMES:
+                print(f"❌ Tamanho desconhecido: {tamanho} (use {', '.join(VOLUMES)})")
+                sys.exit(1)
+            caminho = preparar_banco_suite(pasta, VOLUMES[tamanho], 42, _opcao('--dados'))
+            print(f"Cenário: linhas | {tamanho} {VOLUMES[tamanho]} | {repeticoes} renderizações")
+            regressoes = imprimir_linhas(benchmark_linhas(repeticoes))
+
+        elif cenario == 'fluxo':
+            caminho = criar_banco_temporario(pasta)
+            popular_catalogo(caminho, 500)
+            print(f"Cenário: fluxo | /relatorios com {QUANTIDADES_FLUXO} lotes vencendo")
+            regressoes = imprimir_fluxo(benchmark_fluxo(caminho, _opcao('--templates'), _argumento('--repeticoes', 5)))
+
+        elif cenario == 'suite':
+            tamanho = _opcao('--tamanho', 'pequeno')
+            semente = _argumento('--semente', 42)
+            if tamanho not in VOLUMES:
+                print(f"❌ Tamanho desconhecido: {tamanho} (use {', '.join(VOLUMES)})")
+                sys.exit(1)
+
+            print(f"Suíte: {tamanho} {VOLUMES[tamanho]} | semente {semente} | {repeticoes} repetições")
+            caminho = preparar_banco_suite(pasta, VOLUMES[tamanho], semente, _opcao('--dados'))
+            resultados = executar_suite(caminho, repeticoes, semente)
+            baseline = montar_baseline(tamanho, VOLUMES[tamanho], semente, repeticoes, resultados)
+
+            if _opcao('--comparar'):
+                with open(_opcao('--comparar'), encoding='utf-8') as arquivo:
+                    regressoes = comparar_baseline(baseline, json.load(arquivo),
+                                                   _argumento('--tolerancia', 20) / 100)
+            if _opcao('--salvar'):
+                with open(_opcao('--salvar'), 'w', encoding='utf-8') as arquivo:
+                    json.dump(baseline, arquivo, indent=2, ensure_ascii=False)
+                print(f"\n💾 Baseline salva em {_opcao('--salvar')}")
+
+        else:
+            print(f"❌ Cenário desconhecido: {cenario}")
+
+        db.get_pool().fechar_todas()
+        db.get_pool_leitura().fechar_todas()
+
+    if regressoes:
+        print(f"\n❌ Regressões acima da tolerância: {', '.join(regressoes)}")
+        sys.exit(1)
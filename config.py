@@ -30,6 +30,61 @@ class Config:
     BASE_DIR = os.path.dirname(os.path.abspath(__file__))
     DATABASE_PATH = os.path.join(BASE_DIR, 'farmacia.db')
     
+    # Pool de conexões (db.py) - cada conexão já sai configurada
+    DB_POOL_TAMANHO = int(os.environ.get('DB_POOL_TAMANHO', 8))
+    DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 5))  # segundos esperando conexão livre
+    DB_BUSY_TIMEOUT_MS = 5000          # Espera pelo lock de escrita do SQLite (scripts)
+    DB_BUSY_TENTATIVA_MS = 100         # Idem, por tentativa, nas conexões do pool (ver ESCRITA_PRAZO)
+    DB_SYNCHRONOUS = os.environ.get('DB_SYNCHRONOUS', 'NORMAL')  # NORMAL (WAL) ou FULL (fsync a cada commit)
+    DB_CACHE_STATEMENTS = 256          # Cache de statements preparados por conexão
+    DB_MMAP_BYTES = 256 * 1024 * 1024  # PRAGMA mmap_size
+    DB_CACHE_KB = 16 * 1024            # PRAGMA cache_size (em KiB)
+    
+    # Leitura isolada (dashboard e relatórios): pool de conexões mode=ro,
+    # separado do pool dos caixas. Com RELATORIOS_SNAPSHOT, os relatórios
+    # leem uma cópia do banco (API de backup) renovada a cada
+    # RELATORIOS_SNAPSHOT_INTERVALO s; mais velha que
+    # RELATORIOS_SNAPSHOT_MAX_IDADE, eles voltam para o banco vivo
+    DB_POOL_LEITURA_TAMANHO = int(os.environ.get('DB_POOL_LEITURA_TAMANHO', 4))
+    RELATORIOS_SNAPSHOT = os.environ.get('RELATORIOS_SNAPSHOT')  # caminho do arquivo (None = desligado)
+    RELATORIOS_SNAPSHOT_INTERVALO = int(os.environ.get('RELATORIOS_SNAPSHOT_INTERVALO', 300))
+    RELATORIOS_SNAPSHOT_MAX_IDADE = int(os.environ.get('RELATORIOS_SNAPSHOT_MAX_IDADE', 900))
+    
+    # Cache do catálogo em memória (db.py) - número máximo de entradas (LRU)
+    CACHE_CATALOGO_MAX = int(os.environ.get('CACHE_CATALOGO_MAX', 256))
+    
+    # Group commit de vendas (db.EscritorVendas): uma thread grava as vendas
+    # de todos os caixas em grupos, um commit por grupo
+    VENDAS_GRUPO_COMMIT = os.environ.get('VENDAS_GRUPO_COMMIT', '').lower() in ('1', 'true', 'sim')
+    VENDAS_GRUPO_MAX = 32       # Vendas por transação
+    VENDAS_GRUPO_TIMEOUT = 10   # segundos que o caixa espera pela gravação
+
+    # Controle de admissão das rotas de escrita (db.ControleAdmissao): até
+    # ESCRITAS_CONCORRENTES gravando e ESCRITAS_FILA esperando vaga; além
+    # disso a rota responde 503 na hora, com Retry-After.
+    # No group commit o limite acompanha o tamanho do grupo.
+    ESCRITAS_CONCORRENTES = int(os.environ.get('ESCRITAS_CONCORRENTES') or
+                                (VENDAS_GRUPO_MAX if VENDAS_GRUPO_COMMIT else 4))
+    ESCRITAS_FILA = int(os.environ.get('ESCRITAS_FILA', 16))
+    ESCRITAS_ESPERA = 2.0       # segundos na fila antes de desistir (503)
+    ESCRITAS_RETRY_AFTER = 1    # segundos sugeridos ao cliente no 503
+    ESCRITA_PRAZO = 5.0         # segundos de novas tentativas (com jitter) em SQLITE_BUSY
+
+    # Reservas de estoque do carrinho do PDV: cada item adicionado segura
+    # unidades de lotes específicos por RESERVA_TTL segundos (renovado a
+    # cada alteração do carrinho); o varredor apaga as vencidas
+    RESERVA_TTL = int(os.environ.get('RESERVA_TTL', 900))
+    RESERVAS_VARREDURA = 60     # segundos entre varreduras das reservas vencidas
+    
+    # Métricas Prometheus (/metrics). Com vários processos (gunicorn -w N),
+    # aponte METRICAS_DIR para uma pasta comum: cada processo grava ali seu retrato
+    METRICAS_DIR = os.environ.get('METRICAS_DIR')
+    METRICAS_INTERVALO = 5  # segundos entre gravações do retrato de cada processo
+    
+    # Log de consultas lentas (perfil_sql.py) - desligado se CONSULTAS_LENTAS_MS não for definido
+    CONSULTAS_LENTAS_MS = float(os.environ['CONSULTAS_LENTAS_MS']) if os.environ.get('CONSULTAS_LENTAS_MS') else None
+    CONSULTAS_LENTAS_ARQUIVO = os.environ.get('CONSULTAS_LENTAS_ARQUIVO') or os.path.join(BASE_DIR, 'consultas_lentas.jsonl')
+    
     # ========================================
     # VALIDAÇÃO DE ARQUIVOS (Receitas - só valida, não salva)
     # ========================================
@@ -40,7 +95,27 @@ class Config:
     # ========================================
     DEBUG = os.environ.get('FLASK_DEBUG') or True
     PRODUTOS_POR_PAGINA = 20
+    BUSCA_LIMITE = 20  # Resultados do typeahead do PDV (/api/produtos/busca)
+    BUSCA_CANDIDATOS = 500  # Mais relevantes do FTS5 (após filtro de estoque) que seguem para os joins
     DIAS_ALERTA_VALIDADE = 30
+    EXPORTACAO_BLOCO = 2000  # Linhas lidas por fetchmany nos extratos (exportar.py)
+    STREAM_BLOCO = 500  # Linhas lidas por fetchmany nas tabelas enviadas em fluxo (relatórios)
+    LOTES_POR_RECEBIMENTO_MAX = 500  # Limite de /api/lotes/lote-em-massa
+    
+    # Arquivamento mensal de vendas (arquivar.py): meses fechados anteriores
+    # aos ARQUIVO_MESES_QUENTES mais recentes vão para ARQUIVO_DIR/vendas_AAAA_MM.db
+    ARQUIVO_DIR = os.environ.get('ARQUIVO_DIR') or os.path.join(BASE_DIR, 'arquivo')
+    ARQUIVO_MESES_QUENTES = int(os.environ.get('ARQUIVO_MESES_QUENTES', 6))  # inclui o mês corrente
+    ARQUIVO_BLOCO = 2000  # Vendas por transação (cópia e remoção)
+    
+    # Backup online (backup.py): cópia em passos pela API de backup do SQLite,
+    # conferida, comprimida e rotacionada. Agendado no app só com BACKUP_INTERVALO_HORAS
+    BACKUP_DIR = os.environ.get('BACKUP_DIR') or os.path.join(BASE_DIR, 'backups')
+    BACKUP_RETER = int(os.environ.get('BACKUP_RETER', 7))  # Quantos backups manter
+    BACKUP_INTERVALO_HORAS = float(os.environ['BACKUP_INTERVALO_HORAS']) if os.environ.get('BACKUP_INTERVALO_HORAS') else None
+    BACKUP_PAGINAS = 256        # Páginas copiadas por passo
+    BACKUP_PAUSA = 0.005        # segundos entre passos (disco livre para os caixas)
+    BACKUP_MAX_REINICIOS = 5    # Recomeços (origem alterada) antes de copiar em um passo só
     
     # Senha mestra do supervisor (RN1 - Medicamentos Controlados)
     SENHA_SUPERVISOR_MESTRA = 'farmacia_VS'
@@ -2,37 +2,975 @@
 Camada de Acesso a Dados (Data Access Layer) - SQLite
 """
 
+import os
 import sqlite3
+import queue
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FuturesTimeout
+from flask import g, has_app_context
 from werkzeug.security import check_password_hash
 from config import Config
-from datetime import date, timedelta
+from datetime import date, datetime, timedelta, timezone
+from functools import lru_cache
+from urllib.parse import quote
+import metricas
+import perfil_sql
 
 # =====================================================
-# CONEXÃO COM O BANCO DE DADOS
+# CONEXÃO COM O BANCO DE DADOS (Pool de Conexões)
 # =====================================================
 
-def get_db_connection():
+class CursorMedido(sqlite3.Cursor):
     """
-    Estabelece e retorna uma conexão com o banco SQLite.
+    Cursor que conta os comandos barrados por SQLITE_BUSY (métricas) e,
+    com Config.CONSULTAS_LENTAS_MS definido, cronometra cada comando
+    (execute + fetch*) para o log de consultas lentas (perfil_sql.py).
     """
-    try:
-        conexao = sqlite3.connect(Config.DATABASE_PATH)
+
+    _consulta = None  # [sql, parametros, segundos, linhas] do comando em andamento
+
+    def execute(self, sql, parametros=()):
+        return self._executar(super().execute, sql, parametros)
+
+    def executemany(self, sql, parametros):
+        return self._executar(super().executemany, sql, parametros)
+
+    def _executar(self, metodo, sql, parametros):
+        if self._consulta is not None:
+            self._encerrar_consulta()
+        medir = Config.CONSULTAS_LENTAS_MS is not None
+        inicio = time.perf_counter() if medir else 0.0
+        try:
+            return metodo(sql, parametros)
+        except sqlite3.OperationalError as err:
+            _contar_busy(err)
+            raise
+        finally:
+            if medir:
+                self._consulta = [sql, parametros, time.perf_counter() - inicio, 0]
+
+    def fetchone(self):
+        if self._consulta is None:
+            return super().fetchone()
+        inicio = time.perf_counter()
+        linha = super().fetchone()
+        self._consulta[2] += time.perf_counter() - inicio
+        self._consulta[3] += linha is not None
+        return linha
+
+    def fetchmany(self, size=None):
+        if self._consulta is None:
+            return super().fetchmany(self.arraysize if size is None else size)
+        inicio = time.perf_counter()
+        linhas = super().fetchmany(self.arraysize if size is None else size)
+        self._consulta[2] += time.perf_counter() - inicio
+        self._consulta[3] += len(linhas)
+        return linhas
+
+    def fetchall(self):
+        if self._consulta is None:
+            return super().fetchall()
+        inicio = time.perf_counter()
+        linhas = super().fetchall()
+        self._consulta[2] += time.perf_counter() - inicio
+        self._consulta[3] += len(linhas)
+        self._encerrar_consulta()
+        return linhas
+
+    def close(self):
+        if self._consulta is not None:
+            self._encerrar_consulta()
+        super().close()
+
+    def __del__(self):
+        if self._consulta is not None:
+            self._encerrar_consulta(explicar=False)
+
+    def _encerrar_consulta(self, explicar=True):
+        """Fecha a medição do comando anterior e grava se passou do limite."""
+        sql, parametros, segundos, linhas = self._consulta
+        self._consulta = None
+        limite = Config.CONSULTAS_LENTAS_MS
+        if limite is None or segundos * 1000 < limite:
+            return
+        if not linhas and self.rowcount > 0:
+            linhas = self.rowcount  # INSERT/UPDATE/DELETE
+        perfil_sql.registrar(self.connection if explicar else None, sql, parametros,
+                             segundos * 1000, linhas, metricas.funcao_atual.get())
+
+
+def _ocupado(err):
+    """True para 'database is locked' / SQLITE_BUSY."""
+    return 'locked' in str(err) or 'busy' in str(err)
+
+def _contar_busy(err):
+    if _ocupado(err):
+        metricas.incrementar('farmacia_db_busy_total', (metricas.funcao_atual.get(),))
+
+
+class ConexaoPool(sqlite3.Connection):
+    """
+    Conexão SQLite que volta para o pool ao ser fechada.
+    Assim as funções deste módulo continuam chamando conexao.close()
+    normalmente, sem saber que a conexão é reaproveitada.
+    """
+
+    pool = None
+    fixa = False  # True quando está presa à requisição Flask (flask.g)
+
+    def cursor(self, factory=CursorMedido):
+        return super().cursor(factory)
+
+    def execute(self, sql, parametros=()):
+        return self.cursor().execute(sql, parametros)
+
+    def executemany(self, sql, parametros):
+        return self.cursor().executemany(sql, parametros)
+
+    def close(self):
+        if self.fixa:
+            return  # Devolvida apenas no teardown da requisição
+        if self.pool is not None:
+            self.pool.devolver(self)
+        else:
+            super().close()
+
+    def fechar_definitivo(self):
+        """Fecha a conexão de verdade (usado ao descartar o pool)."""
+        super().close()
+
+
+class PoolConexoes:
+    """
+    Pool thread-safe de conexões SQLite já configuradas (PRAGMAs aplicados
+    uma única vez por conexão). Guarda estatísticas de espera para saber
+    se os caixas estão fazendo fila por conexão.
+
+    Com parametros_uri o pool é somente leitura: 'mode=ro' lê o banco vivo
+    (em WAL, sem travar quem grava) e 'immutable=1' lê um snapshot que
+    ninguém altera, sem lock nenhum.
+    """
+
+    def __init__(self, caminho, tamanho, timeout_espera, parametros_uri=None, nome='principal'):
+        self.caminho = caminho
+        self.tamanho = tamanho
+        self.timeout_espera = timeout_espera
+        self.parametros_uri = parametros_uri
+        self.nome = nome
+        self.descartado = False  # True após fechar_todas: as emprestadas fecham ao voltar
+        self.marca = None        # (arquivo, mtime) no pool do snapshot dos relatórios
+        self._livres = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._criadas = 0
+        self._em_uso = 0
+        self._emprestimos = 0
+        self._esperas = 0
+        self._tempo_espera_total = 0.0
+        self._tempo_espera_max = 0.0
+        self._timeouts = 0
+
+    def _criar_conexao(self):
+        """Abre uma nova conexão e aplica os PRAGMAs de desempenho."""
+        if self.parametros_uri:
+            return self._criar_conexao_leitura()
+        conexao = sqlite3.connect(
+            self.caminho,
+            timeout=Config.DB_BUSY_TENTATIVA_MS / 1000,
+            check_same_thread=False,
+            cached_statements=Config.DB_CACHE_STATEMENTS,
+            factory=ConexaoPool
+        )
         conexao.row_factory = sqlite3.Row  # Retorna dicts ao invés de tuples
+        conexao.execute("PRAGMA journal_mode = WAL")
+        conexao.execute(f"PRAGMA synchronous = {Config.DB_SYNCHRONOUS}")
+        # Espera curta do próprio SQLite: as escritas tentam de novo com
+        # jitter em _iniciar_escrita, até Config.ESCRITA_PRAZO
+        conexao.execute(f"PRAGMA busy_timeout = {int(Config.DB_BUSY_TENTATIVA_MS)}")
+        conexao.execute("PRAGMA foreign_keys = ON")
+        conexao.execute(f"PRAGMA mmap_size = {int(Config.DB_MMAP_BYTES)}")
+        conexao.execute(f"PRAGMA cache_size = -{int(Config.DB_CACHE_KB)}")
+        conexao.execute("PRAGMA temp_store = MEMORY")
+        conexao.pool = self
         return conexao
+
+    def _criar_conexao_leitura(self):
+        """
+        Conexão por URI somente leitura: journal_mode, synchronous e
+        foreign_keys não se aplicam (e o journal_mode nem pode ser trocado).
+        """
+        conexao = sqlite3.connect(
+            uri_banco(self.caminho, self.parametros_uri),
+            uri=True,
+            timeout=Config.DB_BUSY_TIMEOUT_MS / 1000,
+            check_same_thread=False,
+            cached_statements=Config.DB_CACHE_STATEMENTS,
+            factory=ConexaoPool
+        )
+        conexao.row_factory = sqlite3.Row
+        # Leitor em WAL não segura o lock de escrita: esperar aqui não atrasa caixa
+        conexao.execute(f"PRAGMA busy_timeout = {int(Config.DB_BUSY_TIMEOUT_MS)}")
+        conexao.execute(f"PRAGMA mmap_size = {int(Config.DB_MMAP_BYTES)}")
+        conexao.execute(f"PRAGMA cache_size = -{int(Config.DB_CACHE_KB)}")
+        conexao.execute("PRAGMA temp_store = MEMORY")
+        conexao.pool = self
+        return conexao
+
+    def obter(self):
+        """
+        Empresta uma conexão do pool. Cria uma nova se ainda houver vaga;
+        caso contrário espera até timeout_espera segundos.
+        """
+        conexao = None
+        espera = 0.0
+        try:
+            conexao = self._livres.get_nowait()
+        except queue.Empty:
+            criar = False
+            with self._lock:
+                if self._criadas < self.tamanho:
+                    self._criadas += 1
+                    criar = True
+            if criar:
+                try:
+                    conexao = self._criar_conexao()
+                except Exception:
+                    with self._lock:
+                        self._criadas -= 1
+                    raise
+            else:
+                inicio = time.perf_counter()
+                try:
+                    conexao = self._livres.get(timeout=self.timeout_espera)
+                except queue.Empty:
+                    with self._lock:
+                        self._timeouts += 1
+                    raise PoolEsgotado(
+                        f"nenhuma conexão livre após {self.timeout_espera}s "
+                        f"(pool {self.nome} com {self.tamanho} conexões)"
+                    )
+                espera = time.perf_counter() - inicio
+                with self._lock:
+                    self._esperas += 1
+                    self._tempo_espera_total += espera
+                    self._tempo_espera_max = max(self._tempo_espera_max, espera)
+
+        with self._lock:
+            self._em_uso += 1
+            self._emprestimos += 1
+        metricas.observar('farmacia_db_pool_wait_seconds', espera, (self.nome,))
+        return conexao
+
+    def devolver(self, conexao):
+        """Devolve a conexão ao pool, desfazendo transação esquecida aberta."""
+        if self.descartado:
+            conexao.fechar_definitivo()
+            with self._lock:
+                self._criadas -= 1
+                self._em_uso -= 1
+            return
+        try:
+            if conexao.in_transaction:
+                conexao.rollback()
+        except sqlite3.Error:
+            # Conexão inutilizável: descarta e libera a vaga
+            conexao.fechar_definitivo()
+            with self._lock:
+                self._criadas -= 1
+                self._em_uso -= 1
+            return
+        with self._lock:
+            self._em_uso -= 1
+        self._livres.put(conexao)
+
+    def fechar_todas(self):
+        """
+        Fecha todas as conexões livres (ex.: troca de banco, testes); as
+        emprestadas são fechadas quando voltarem.
+        """
+        self.descartado = True
+        while True:
+            try:
+                conexao = self._livres.get_nowait()
+            except queue.Empty:
+                break
+            conexao.fechar_definitivo()
+            with self._lock:
+                self._criadas -= 1
+
+    def estatisticas(self):
+        """Retorna o estado do pool e os tempos de espera acumulados."""
+        with self._lock:
+            return {
+                'nome': self.nome,
+                'tamanho': self.tamanho,
+                'criadas': self._criadas,
+                'em_uso': self._em_uso,
+                'livres': self._livres.qsize(),
+                'emprestimos': self._emprestimos,
+                'esperas': self._esperas,
+                'espera_total_ms': round(self._tempo_espera_total * 1000, 3),
+                'espera_media_ms': round(self._tempo_espera_total * 1000 / self._esperas, 3) if self._esperas else 0.0,
+                'espera_max_ms': round(self._tempo_espera_max * 1000, 3),
+                'timeouts': self._timeouts
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """Retorna o pool global, criando-o na primeira chamada."""
+    global _pool
+    if _pool is None or _pool.caminho != Config.DATABASE_PATH:
+        with _pool_lock:
+            if _pool is None or _pool.caminho != Config.DATABASE_PATH:
+                if _pool is not None:
+                    _pool.fechar_todas()
+                _pool = PoolConexoes(
+                    Config.DATABASE_PATH,
+                    Config.DB_POOL_TAMANHO,
+                    Config.DB_POOL_TIMEOUT
+                )
+    return _pool
+
+def _conexao_da_requisicao(chave, obter):
+    """
+    Dentro de uma requisição Flask, a mesma conexão (uma por `chave` em
+    flask.g) é reutilizada por todas as funções chamadas na requisição e
+    devolvida no teardown. Fora dela, cada chamada empresta uma do pool.
+    Pool esgotado sobe como PoolEsgotado (503), e não como None: senão a
+    tela mostraria um catálogo ou uma lista vazia no lugar do erro.
+    """
+    try:
+        if has_app_context():
+            if chave not in g:
+                conexao = obter()
+                conexao.fixa = True
+                setattr(g, chave, conexao)
+            return getattr(g, chave)
+
+        return obter()
+    except PoolEsgotado:
+        raise
     except Exception as err:
         print(f"[ERRO DB] Falha na conexão: {err}")
         return None
 
+def get_db_connection():
+    """
+    Retorna uma conexão do pool com o banco SQLite (leitura e escrita).
+    Dentro de uma requisição Flask, a mesma conexão é reutilizada por
+    todas as funções chamadas na requisição e devolvida no teardown.
+    """
+    return _conexao_da_requisicao('db_conexao', lambda: get_pool().obter())
+
+def liberar_conexao_requisicao(exc=None):
+    """Devolve aos pools as conexões presas à requisição (teardown_appcontext)."""
+    for chave in ('db_conexao', 'db_conexao_leitura', 'db_conexao_relatorio'):
+        conexao = g.pop(chave, None)
+        if conexao is not None:
+            conexao.fixa = False
+            conexao.close()
+
+def estatisticas_pool():
+    """Tamanho do pool e tempos de espera por conexão."""
+    return get_pool().estatisticas()
+
+# =====================================================
+# LEITURA ISOLADA (dashboard e relatórios)
+# =====================================================
+# Caminho de leitura separado do dos caixas, escolhido explicitamente
+# em cada função do db.py:
+#   get_db_connection_leitura()   -> banco vivo por URI mode=ro (WAL):
+#       get_vendas_recentes, get_lotes_vencendo, resumo_validade
+#   get_db_connection_relatorio() -> snapshot (se configurado e recente)
+#       ou o mesmo mode=ro: resumo_vendas_periodo, ranking_vendas
+#   _abrir_conexao_exportacao()   -> mode=ro, fora dos pools: exportar_blocos
+# Em WAL o leitor trabalha sobre uma foto do último commit e não segura
+# o lock de escrita: um relatório longo não atrasa registrar_venda nem
+# criar_lote, e não ocupa vaga do pool dos caixas.
+
+def uri_banco(caminho, parametros):
+    """
+    URI file: de `caminho` com os parâmetros dados (ex.: 'mode=ro'). Usada
+    por todas as aberturas somente leitura (pools, snapshot, exportação,
+    arquivo morto e backup.py), para que não divirjam no escape do caminho.
+    """
+    return f"file:{quote(os.path.abspath(caminho).replace(os.sep, '/'))}?{parametros}"
+
+_pool_leitura = None
+_pool_leitura_lock = threading.Lock()
+
+def get_pool_leitura():
+    """Pool somente leitura (mode=ro) do banco vivo, criado na primeira chamada."""
+    global _pool_leitura
+    if _pool_leitura is None or _pool_leitura.caminho != Config.DATABASE_PATH:
+        with _pool_leitura_lock:
+            if _pool_leitura is None or _pool_leitura.caminho != Config.DATABASE_PATH:
+                if _pool_leitura is not None:
+                    _pool_leitura.fechar_todas()
+                # mode=ro não troca o journal_mode: uma conexão do pool principal
+                # deixa o banco em WAL antes (senão o leitor travaria as escritas)
+                get_pool().obter().close()
+                _pool_leitura = PoolConexoes(
+                    Config.DATABASE_PATH,
+                    Config.DB_POOL_LEITURA_TAMANHO,
+                    Config.DB_POOL_TIMEOUT,
+                    parametros_uri='mode=ro',
+                    nome='leitura'
+                )
+    return _pool_leitura
+
+def get_db_connection_leitura():
+    """
+    Conexão somente leitura do banco vivo (vê todos os commits). Qualquer
+    INSERT/UPDATE nela falha com 'attempt to write a readonly database'.
+    """
+    return _conexao_da_requisicao('db_conexao_leitura', lambda: get_pool_leitura().obter())
+
+_pool_snapshot = None
+_pool_snapshot_lock = threading.Lock()
+_snapshot_lock = threading.Lock()  # Uma atualização por vez neste processo
+_snapshot_thread = None
+
+def idade_snapshot_relatorios():
+    """Segundos desde a última cópia do snapshot (None se não existir)."""
+    destino = Config.RELATORIOS_SNAPSHOT
+    try:
+        return max(0.0, time.time() - os.path.getmtime(destino)) if destino else None
+    except OSError:
+        return None
+
+def atualizar_snapshot_relatorios(forcar=False):
+    """
+    Copia o banco para Config.RELATORIOS_SNAPSHOT com a API de backup do
+    SQLite (uma única leitura consistente, sem travar as escritas em WAL),
+    grava em um arquivo temporário e troca com os.replace. Com vários
+    processos, quem chega depois de uma cópia recente não copia de novo.
+    Retorna True se copiou.
+    """
+    destino = Config.RELATORIOS_SNAPSHOT
+    if not destino:
+        return False
+    
+    with _snapshot_lock:
+        idade = idade_snapshot_relatorios()
+        if not forcar and idade is not None and idade < Config.RELATORIOS_SNAPSHOT_INTERVALO / 2:
+            return False
+        
+        temporario = f"{destino}.{os.getpid()}.tmp"
+        origem = copia = None
+        try:
+            origem = sqlite3.connect(uri_banco(Config.DATABASE_PATH, 'mode=ro'), uri=True,
+                                     timeout=Config.DB_BUSY_TIMEOUT_MS / 1000)
+            copia = sqlite3.connect(temporario)
+            origem.backup(copia)  # Todas as páginas em um passo: foto de um único commit
+            # O cabeçalho copiado diz WAL; o snapshot é aberto com immutable=1
+            copia.execute("PRAGMA journal_mode = DELETE")
+            copia.close()
+            copia = None
+            os.replace(temporario, destino)
+            return True
+        except (sqlite3.Error, OSError) as err:
+            print(f"[ERRO] atualizar_snapshot_relatorios: {err}")
+            return False
+        finally:
+            if origem is not None:
+                origem.close()
+            if copia is not None:
+                copia.close()
+            if os.path.exists(temporario):
+                os.remove(temporario)
+
+def get_pool_snapshot():
+    """
+    Pool immutable=1 do snapshot atual; recriado quando o arquivo é trocado
+    (as conexões do snapshot anterior fecham ao voltar para o pool).
+    None se o arquivo não puder ser lido agora (removido ou no meio da troca).
+    """
+    global _pool_snapshot
+    try:
+        marca = (Config.RELATORIOS_SNAPSHOT, os.path.getmtime(Config.RELATORIOS_SNAPSHOT))
+    except OSError as err:
+        print(f"[ERRO] get_pool_snapshot: {err}")
+        return None
+    if _pool_snapshot is None or _pool_snapshot.marca != marca:
+        with _pool_snapshot_lock:
+            if _pool_snapshot is None or _pool_snapshot.marca != marca:
+                if _pool_snapshot is not None:
+                    _pool_snapshot.fechar_todas()
+                _pool_snapshot = PoolConexoes(
+                    Config.RELATORIOS_SNAPSHOT,
+                    Config.DB_POOL_LEITURA_TAMANHO,
+                    Config.DB_POOL_TIMEOUT,
+                    parametros_uri='immutable=1',
+                    nome='snapshot'
+                )
+                _pool_snapshot.marca = marca
+    return _pool_snapshot
+
+def _obter_conexao_relatorio():
+    idade = idade_snapshot_relatorios()
+    if idade is not None and idade <= Config.RELATORIOS_SNAPSHOT_MAX_IDADE:
+        pool = get_pool_snapshot()
+        if pool is not None:
+            return pool.obter()
+    return get_pool_leitura().obter()  # Sem snapshot, velho demais ou sumiu: banco vivo
+
+def get_db_connection_relatorio():
+    """
+    Conexão para relatórios analíticos: o snapshot, se configurado e com
+    no máximo RELATORIOS_SNAPSHOT_MAX_IDADE segundos; senão o banco vivo
+    em modo somente leitura.
+    """
+    return _conexao_da_requisicao('db_conexao_relatorio', _obter_conexao_relatorio)
+
+def iniciar_snapshot_relatorios():
+    """Thread que renova o snapshot a cada RELATORIOS_SNAPSHOT_INTERVALO s (se configurado)."""
+    global _snapshot_thread
+    if not Config.RELATORIOS_SNAPSHOT:
+        return
+    with _snapshot_lock:
+        if _snapshot_thread is not None:
+            return
+        
+        def renovar():
+            while True:
+                atualizar_snapshot_relatorios()
+                time.sleep(Config.RELATORIOS_SNAPSHOT_INTERVALO)
+        
+        _snapshot_thread = threading.Thread(target=renovar, name='snapshot-relatorios', daemon=True)
+        _snapshot_thread.start()
+
+def estatisticas_leitura():
+    """Pools de leitura e idade do snapshot dos relatórios."""
+    idade = idade_snapshot_relatorios()
+    return {
+        'pool_leitura': get_pool_leitura().estatisticas(),
+        'snapshot': {
+            'arquivo': Config.RELATORIOS_SNAPSHOT,
+            'idade_s': None if idade is None else round(idade, 1),
+            'max_idade_s': Config.RELATORIOS_SNAPSHOT_MAX_IDADE
+        }
+    }
+
+def init_app(app):
+    """Liga o ciclo de vida do pool ao app Flask."""
+    app.teardown_appcontext(liberar_conexao_requisicao)
+
+# =====================================================
+# CONTROLE DE ESCRITA (admissão e SQLITE_BUSY)
+# =====================================================
+# O SQLite grava uma transação por vez. Sem limite, cada caixa a mais é
+# uma thread e uma conexão paradas no lock até estourar o tempo. Aqui as
+# escritas passam por uma fila curta (ControleAdmissao) e o BEGIN
+# IMMEDIATE tenta de novo com jitter dentro de um prazo; o que não couber
+# vira BancoOcupado, que as rotas devolvem como 503 com Retry-After.
+
+ESPERA_BUSY_BASE = 0.01  # segundos; dobra a cada nova tentativa
+ESPERA_BUSY_MAX = 0.5
+
+class BancoOcupado(Exception):
+    """Escrita recusada por excesso de carga (fila cheia ou lock ocupado além do prazo)."""
+
+    def __init__(self, motivo):
+        self.motivo = motivo
+        super().__init__(f"Banco ocupado: {motivo}")
+
+class PoolEsgotado(BancoOcupado):
+    """Nenhuma conexão livre no pool dentro de timeout_espera (também vira 503)."""
+
+def _iniciar_escrita(cursor):
+    """
+    Abre a transação com BEGIN IMMEDIATE (lock de escrita já no início).
+    Em SQLITE_BUSY espera um tempo aleatório entre 0 e o backoff
+    exponencial (os caixas não voltam todos juntos) e tenta de novo, até
+    Config.ESCRITA_PRAZO segundos. Depois disso levanta BancoOcupado.
+    """
+    prazo = time.monotonic() + Config.ESCRITA_PRAZO
+    tentativa = 0
+    while True:
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            return
+        except sqlite3.OperationalError as err:
+            if not _ocupado(err):
+                raise
+        restante = prazo - time.monotonic()
+        if restante <= 0:
+            raise BancoOcupado("lock de escrita")
+        tentativa += 1
+        metricas.incrementar('farmacia_db_busy_retries_total', (metricas.funcao_atual.get(),))
+        espera = random.uniform(0, min(ESPERA_BUSY_MAX, ESPERA_BUSY_BASE * 2 ** tentativa))
+        time.sleep(min(espera, restante))
+
+
+class ControleAdmissao:
+    """
+    Limita as escritas simultâneas a `limite`. Quem chega sem vaga entra
+    numa fila de até `fila_max` e espera no máximo `espera_max` segundos;
+    com a fila cheia a recusa é imediata (BancoOcupado).
+    """
+
+    def __init__(self, limite, fila_max, espera_max):
+        self.limite = limite
+        self.fila_max = fila_max
+        self.espera_max = espera_max
+        self._vagas = threading.BoundedSemaphore(limite)
+        self._lock = threading.Lock()
+        self._em_execucao = 0
+        self._na_fila = 0
+        self._maior_fila = 0
+        self._admitidas = 0
+        self._rejeitadas = {'fila_cheia': 0, 'espera_esgotada': 0}
+
+    def entrar(self):
+        """Ocupa uma vaga de escrita ou levanta BancoOcupado."""
+        espera = 0.0
+        if self._vagas.acquire(blocking=False):
+            metricas.observar('farmacia_admissao_fila', 0)
+        else:
+            with self._lock:
+                cheia = self._na_fila >= self.fila_max
+                if cheia:
+                    self._rejeitadas['fila_cheia'] += 1
+                else:
+                    self._na_fila += 1
+                    self._maior_fila = max(self._maior_fila, self._na_fila)
+                    profundidade = self._na_fila
+            if cheia:
+                metricas.incrementar('farmacia_admissao_rejeicoes_total', ('fila_cheia',))
+                raise BancoOcupado("fila de escrita cheia")
+            metricas.observar('farmacia_admissao_fila', profundidade)
+
+            inicio = time.perf_counter()
+            admitida = self._vagas.acquire(timeout=self.espera_max)
+            espera = time.perf_counter() - inicio
+            with self._lock:
+                self._na_fila -= 1
+                if not admitida:
+                    self._rejeitadas['espera_esgotada'] += 1
+            if not admitida:
+                metricas.incrementar('farmacia_admissao_rejeicoes_total', ('espera_esgotada',))
+                raise BancoOcupado("espera por vaga de escrita esgotada")
+
+        with self._lock:
+            self._em_execucao += 1
+            self._admitidas += 1
+        metricas.observar('farmacia_admissao_espera_seconds', espera)
+
+    def sair(self):
+        """Libera a vaga ocupada por entrar()."""
+        with self._lock:
+            self._em_execucao -= 1
+        self._vagas.release()
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                'limite': self.limite,
+                'fila_max': self.fila_max,
+                'em_execucao': self._em_execucao,
+                'na_fila': self._na_fila,
+                'maior_fila': self._maior_fila,
+                'admitidas': self._admitidas,
+                'rejeitadas': dict(self._rejeitadas)
+            }
+
+
+_admissao = None
+_admissao_lock = threading.Lock()
+
+def get_admissao_escritas():
+    """Retorna o controle de admissão das escritas do processo."""
+    global _admissao
+    if _admissao is None:
+        with _admissao_lock:
+            if _admissao is None:
+                _admissao = ControleAdmissao(
+                    Config.ESCRITAS_CONCORRENTES,
+                    Config.ESCRITAS_FILA,
+                    Config.ESCRITAS_ESPERA
+                )
+    return _admissao
+
+def estatisticas_admissao():
+    """Escritas em execução, fila atual e recusas (503) acumuladas."""
+    return get_admissao_escritas().estatisticas()
+
+# =====================================================
+# CACHE DO CATÁLOGO (LRU em memória + versão no banco)
+# =====================================================
+
+_AUSENTE = object()
+
+class CacheLRU:
+    """
+    Cache em memória com limite de entradas e despejo LRU.
+    Cada leitura informa a versão atual do catálogo (tabela versoes_cache);
+    se ela mudou desde a última leitura, o cache inteiro é descartado.
+    Assim uma escrita feita por outro processo também invalida este cache.
+    """
+
+    def __init__(self, tamanho_maximo):
+        self.tamanho_maximo = tamanho_maximo
+        self._dados = OrderedDict()
+        self._versao = None
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.falhas = 0
+        self.invalidacoes = 0
+        self.despejos = 0
+
+    def obter(self, chave, versao):
+        """Retorna o valor guardado ou _AUSENTE."""
+        with self._lock:
+            if versao != self._versao:
+                if self._dados:
+                    self.invalidacoes += 1
+                    self._dados.clear()
+                self._versao = versao
+            valor = self._dados.get(chave, _AUSENTE)
+            if valor is _AUSENTE:
+                self.falhas += 1
+            else:
+                self._dados.move_to_end(chave)
+                self.acertos += 1
+            return valor
+
+    def guardar(self, chave, versao, valor):
+        """Guarda o valor, a menos que o catálogo tenha mudado no meio tempo."""
+        with self._lock:
+            if versao != self._versao:
+                return
+            self._dados[chave] = valor
+            self._dados.move_to_end(chave)
+            while len(self._dados) > self.tamanho_maximo:
+                self._dados.popitem(last=False)
+                self.despejos += 1
+
+    def limpar(self):
+        """Invalida tudo (chamado após escritas neste processo)."""
+        with self._lock:
+            if self._dados:
+                self.invalidacoes += 1
+            self._dados.clear()
+            self._versao = None
+
+    def estatisticas(self):
+        with self._lock:
+            consultas = self.acertos + self.falhas
+            return {
+                'entradas': len(self._dados),
+                'tamanho_maximo': self.tamanho_maximo,
+                'versao': self._versao,
+                'acertos': self.acertos,
+                'falhas': self.falhas,
+                'taxa_acerto': round(self.acertos / consultas, 4) if consultas else 0.0,
+                'invalidacoes': self.invalidacoes,
+                'despejos': self.despejos
+            }
+
+
+_cache_catalogo = CacheLRU(Config.CACHE_CATALOGO_MAX)
+
+def _hoje():
+    """
+    Dia de hoje na mesma convenção do date('now') do SQLite (UTC), usado
+    nos limites de validade e nas chaves diárias do cache do catálogo:
+    perto da meia-noite local, os filtros em Python e em SQL não divergem.
+    """
+    return datetime.now(timezone.utc).date()
+
+def _versao_catalogo(conexao):
+    """Lê o contador de versão do catálogo (uma linha, pela chave primária)."""
+    row = conexao.execute(
+        "SELECT versao FROM versoes_cache WHERE nome = 'catalogo'"
+    ).fetchone()
+    return row[0] if row else None
+
+def _incrementar_versao_catalogo(conexao):
+    """Marca o catálogo como alterado. Chamar DENTRO da transação da escrita."""
+    conexao.execute("UPDATE versoes_cache SET versao = versao + 1 WHERE nome = 'catalogo'")
+
+def estatisticas_cache_catalogo():
+    """Contadores de acerto/falha do cache do catálogo."""
+    return _cache_catalogo.estatisticas()
+
+def limpar_cache_catalogo():
+    """Esvazia o cache deste processo (ex.: medir leituras a frio)."""
+    _cache_catalogo.limpar()
+
 def dict_from_row(row):
     """Converte sqlite3.Row para dict"""
     if row is None:
         return None
     return dict(row)
 
+# =====================================================
+# LINHAS TIPADAS (listas grandes: catálogo, lotes, vendas)
+# =====================================================
+# Uma classe com __slots__ por consulta, no lugar de um dict por linha:
+# ocupa uma fração da memória e as datas chegam convertidas uma única vez
+# (date/datetime), em vez de o filtro format_date reinterpretar o texto a
+# cada célula de cada renderização. Para o resto do código a linha se
+# comporta como um dict de leitura (linha['campo'], get, in, keys) e os
+# templates usam linha.campo; campo não preenchido não existe, como uma
+# chave ausente. O JSON (app.ProvedorJSON) é escrito direto dos campos,
+# com as datas de volta no texto ISO que o SQLite devolvia.
+
+class Linha:
+    """
+    Base das linhas tipadas. Cada subclasse declara _colunas (as do SELECT,
+    na ordem do __init__) e __slots__ (as colunas e os campos preenchidos
+    depois da consulta).
+    """
+
+    __slots__ = ()
+    _colunas = ()
+    _campos = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._campos = tuple(cls.__slots__)
+
+    def __getitem__(self, campo):
+        try:
+            return getattr(self, campo)
+        except AttributeError:
+            raise KeyError(campo) from None
+
+    def __setitem__(self, campo, valor):
+        setattr(self, campo, valor)  # Só campos do tipo (AttributeError nos demais)
+
+    def __contains__(self, campo):
+        return hasattr(self, campo)
+
+    def get(self, campo, padrao=None):
+        return getattr(self, campo, padrao)
+
+    def keys(self):
+        return [campo for campo in self._campos if hasattr(self, campo)]
+
+    def items(self):
+        return [(campo, getattr(self, campo)) for campo in self.keys()]
+
+    def _asdict(self):
+        """Dict dos campos preenchidos (usado pelo JSON da app)."""
+        return {campo: getattr(self, campo) for campo in self._campos if hasattr(self, campo)}
+
+    def substituir(self, **campos):
+        """Cópia com `campos` trocados (as do cache não podem ser alteradas)."""
+        copia = object.__new__(type(self))
+        for campo, valor in self.items():
+            setattr(copia, campo, valor)
+        for campo, valor in campos.items():
+            setattr(copia, campo, valor)
+        return copia
+
+    def __repr__(self):
+        return f"{type(self).__name__}({', '.join(f'{c}={v!r}' for c, v in self.items())})"
+
+@lru_cache(maxsize=8192)
+def _converter_data(texto):
+    """'AAAA-MM-DD' -> date e 'AAAA-MM-DD HH:MM:SS' -> datetime (com cache: as validades se repetem)."""
+    if not isinstance(texto, str):
+        return texto
+    try:
+        return date.fromisoformat(texto) if len(texto) == 10 else datetime.fromisoformat(texto)
+    except ValueError:
+        return texto
+
+class ProdutoCatalogo(Linha):
+    """Produto de listar_produtos, listar_produtos_pagina e buscar_produtos."""
+    _colunas = ('id', 'nome', 'fabricante', 'categoria', 'estoque_total', 'validade_mais_proxima',
+                'preco_venda', 'descricao', 'dias_para_vencer')
+    # Preenchidos depois: RN4 (_aplicar_desconto_rn4) e reservas do PDV (_aplicar_reservas)
+    __slots__ = _colunas + ('tem_desconto', 'percentual_desconto', 'preco_original', 'estoque_reservado')
+
+    def __init__(self, id, nome, fabricante, categoria, estoque_total, validade_mais_proxima,
+                 preco_venda, descricao, dias_para_vencer):
+        self.id = id
+        self.nome = nome
+        self.fabricante = fabricante
+        self.categoria = categoria
+        self.estoque_total = estoque_total
+        self.validade_mais_proxima = _converter_data(validade_mais_proxima)
+        self.preco_venda = preco_venda
+        self.descricao = descricao
+        self.dias_para_vencer = dias_para_vencer
+
+class LoteProduto(Linha):
+    """Lote de listar_lotes_por_produto."""
+    __slots__ = _colunas = ('id', 'numero_lote', 'data_validade', 'qtd_atual', 'dias_para_vencer', 'vencendo')
+
+    def __init__(self, id, numero_lote, data_validade, qtd_atual, dias_para_vencer, vencendo):
+        self.id = id
+        self.numero_lote = numero_lote
+        self.data_validade = _converter_data(data_validade)
+        self.qtd_atual = qtd_atual
+        self.dias_para_vencer = dias_para_vencer
+        self.vencendo = vencendo
+
+class LoteVencendo(Linha):
+    """Lote de get_lotes_vencendo e iterar_lotes_vencendo (RN2)."""
+    __slots__ = _colunas = ('lote_id', 'produto_nome', 'fabricante', 'numero_lote', 'data_validade',
+                            'qtd_atual', 'dias_para_vencer')
+
+    def __init__(self, lote_id, produto_nome, fabricante, numero_lote, data_validade, qtd_atual,
+                 dias_para_vencer):
+        self.lote_id = lote_id
+        self.produto_nome = produto_nome
+        self.fabricante = fabricante
+        self.numero_lote = numero_lote
+        self.data_validade = _converter_data(data_validade)
+        self.qtd_atual = qtd_atual
+        self.dias_para_vencer = dias_para_vencer
+
+class VendaRecente(Linha):
+    """Venda de get_vendas_recentes."""
+    __slots__ = _colunas = ('id', 'data_venda', 'total', 'vendedor', 'cargo_vendedor', 'supervisor_liberacao')
+
+    def __init__(self, id, data_venda, total, vendedor, cargo_vendedor, supervisor_liberacao):
+        self.id = id
+        self.data_venda = _converter_data(data_venda)
+        self.total = total
+        self.vendedor = vendedor
+        self.cargo_vendedor = cargo_vendedor
+        self.supervisor_liberacao = supervisor_liberacao
+
+def _conferir_colunas(cursor, tipo):
+    """O SELECT tem de devolver exatamente tipo._colunas, na mesma ordem."""
+    colunas = tuple(coluna[0] for coluna in cursor.description)
+    if colunas != tipo._colunas:
+        raise ValueError(f"{tipo.__name__}: colunas {colunas} diferentes de {tipo._colunas}")
+    cursor.row_factory = None  # Tuplas do SQLite, sem sqlite3.Row
+
+def _linhas(cursor, tipo):
+    """Resultado do cursor como lista de linhas `tipo`."""
+    _conferir_colunas(cursor, tipo)
+    return [tipo(*row) for row in cursor.fetchall()]
+
+def _iterar_linhas(cursor, tipo, tamanho_bloco=None):
+    """Como _linhas, mas gerador: lê Config.STREAM_BLOCO linhas por vez do cursor."""
+    _conferir_colunas(cursor, tipo)
+    tamanho_bloco = tamanho_bloco or Config.STREAM_BLOCO
+    while True:
+        bloco = cursor.fetchmany(tamanho_bloco)
+        if not bloco:
+            break
+        for row in bloco:
+            yield tipo(*row)
+
 # =====================================================
 # MÓDULO: AUTENTICAÇÃO E USUÁRIOS
 # =====================================================
 
+@metricas.medir_consulta
 def verificar_login(login, senha):
     """
     Verifica credenciais de login.
@@ -70,6 +1008,7 @@ def verificar_login(login, senha):
     finally:
         conexao.close()
 
+@metricas.medir_consulta
 def get_usuario_por_id(usuario_id):
     """Busca dados de um usuário pelo ID."""
     conexao = get_db_connection()
@@ -92,6 +1031,7 @@ def get_usuario_por_id(usuario_id):
     finally:
         conexao.close()
 
+@metricas.medir_consulta
 def listar_usuarios():
     """Retorna lista de todos os usuários para o dropdown de login."""
     conexao = get_db_connection()
@@ -118,16 +1058,66 @@ def listar_usuarios():
 # MÓDULO: PRODUTOS (CRUD Completo)
 # =====================================================
 
+def _aplicar_desconto_rn4(produto):
+    """RN4: Desconto automático de 20% para produtos vencendo em 30 dias."""
+    dias = produto.get('dias_para_vencer')
+    if dias is not None and dias <= 30:
+        produto['tem_desconto'] = True
+        produto['percentual_desconto'] = 20
+        produto['preco_original'] = produto['preco_venda']
+        produto['preco_venda'] = round(produto['preco_venda'] * 0.80, 2)  # 20% off
+    else:
+        produto['tem_desconto'] = False
+    return produto
+
+def _aplicar_reservas(conexao, produtos):
+    """
+    Desconta do estoque_total as reservas ativas dos carrinhos do PDV
+    (não entram no cache: mudam a cada item adicionado). As linhas do cache
+    não são alteradas; só os produtos com reserva são copiados, com o
+    campo estoque_reservado.
+    """
+    cursor = conexao.cursor()
+    cursor.execute("""
+        SELECT produto_id, SUM(quantidade) AS reservado
+        FROM reservas_estoque
+        WHERE expira_em > ?
+        GROUP BY produto_id
+    """, (time.time(),))
+    reservados = {row['produto_id']: row['reservado'] for row in cursor.fetchall()}
+    if not reservados:
+        return list(produtos)
+    
+    return [
+        produto.substituir(
+            estoque_total=max(produto['estoque_total'] - reservados[produto['id']], 0),
+            estoque_reservado=reservados[produto['id']])
+        if produto['id'] in reservados else produto
+        for produto in produtos
+    ]
+
+@metricas.medir_consulta
 def listar_produtos():
     """
     Retorna lista de todos os produtos com estoque total calculado.
+    O estoque vem de produto_estoque_resumo (mantida por triggers), então
+    o custo não depende de quantos lotes existem no histórico.
     RN4: Aplica desconto automático de 20% para produtos vencendo em 30 dias.
+    Resultado guardado no cache do catálogo (as linhas são compartilhadas:
+    não alterar). O estoque_total já desconta as reservas ativas do PDV.
     """
     conexao = get_db_connection()
     if not conexao:
         return []
     
     try:
+        # A data entra na chave: dias_para_vencer/RN4 mudam na virada do dia
+        versao = _versao_catalogo(conexao)
+        chave = ('listar_produtos', _hoje())
+        produtos = _cache_catalogo.obter(chave, versao)
+        if produtos is not _AUSENTE:
+            return _aplicar_reservas(conexao, produtos)
+        
         cursor = conexao.cursor()
         cursor.execute("""
             SELECT 
@@ -135,34 +1125,20 @@ def listar_produtos():
                 p.nome,
                 p.fabricante,
                 p.categoria,
-                COALESCE(SUM(el.qtd_atual), 0) AS estoque_total,
-                MIN(el.data_validade) AS validade_mais_proxima,
+                COALESCE(r.estoque_total, 0) AS estoque_total,
+                r.validade_mais_proxima,
                 p.preco_venda,
                 p.descricao,
-                CAST(julianday(MIN(el.data_validade)) - julianday('now') AS INTEGER) AS dias_para_vencer
+                CAST(julianday(r.validade_mais_proxima) - julianday('now') AS INTEGER) AS dias_para_vencer
             FROM produtos p
-            LEFT JOIN estoque_lotes el ON p.id = el.produto_id AND el.qtd_atual > 0
-            GROUP BY p.id, p.nome, p.fabricante, p.categoria, p.preco_venda, p.descricao
+            LEFT JOIN produto_estoque_resumo r ON r.produto_id = p.id
             ORDER BY p.nome ASC
         """)
         
-        produtos = []
-        for row in cursor.fetchall():
-            produto = dict_from_row(row)
-            
-            # RN4: Desconto automático de 20% para produtos vencendo em 30 dias
-            dias = produto.get('dias_para_vencer')
-            if dias is not None and dias <= 30:
-                produto['tem_desconto'] = True
-                produto['percentual_desconto'] = 20
-                produto['preco_original'] = produto['preco_venda']
-                produto['preco_venda'] = round(produto['preco_venda'] * 0.80, 2)  # 20% off
-            else:
-                produto['tem_desconto'] = False
-                
-            produtos.append(produto)
-        
-        return produtos
+        produtos = [_aplicar_desconto_rn4(produto) for produto in
+                    _linhas(cursor, ProdutoCatalogo)]
+        _cache_catalogo.guardar(chave, versao, produtos)
+        return _aplicar_reservas(conexao, produtos)
     
     except Exception as err:
         print(f"[ERRO] listar_produtos: {err}")
@@ -170,21 +1146,181 @@ def listar_produtos():
     finally:
         conexao.close()
 
+@metricas.medir_consulta
+def listar_produtos_pagina(limite, apos_nome=None, apos_id=None,
+                           categoria=None, em_estoque=False, vencendo=False):
+    """
+    Uma página do catálogo com paginação por chave (keyset) em (nome, id):
+    a próxima página começa depois do último (nome, id) recebido, usando o
+    índice idx_produtos_nome, sem OFFSET.
+    Filtros: categoria, em_estoque (saldo > 0) e vencendo (validade mais
+    próxima dentro de Config.DIAS_ALERTA_VALIDADE dias).
+    Retorna (produtos, proxima_pagina); proxima_pagina é None na última.
+    """
+    conexao = get_db_connection()
+    if not conexao:
+        return [], None
+    
+    condicoes = []
+    parametros = []
+    if apos_nome is not None and apos_id is not None:
+        condicoes.append("(p.nome, p.id) > (?, ?)")
+        parametros.extend([apos_nome, apos_id])
+    if categoria:
+        condicoes.append("p.categoria = ?")
+        parametros.append(categoria)
+    if em_estoque:
+        condicoes.append("r.estoque_total > 0")
+    if vencendo:
+        condicoes.append("r.validade_mais_proxima <= date('now', ?)")
+        parametros.append(f"+{int(Config.DIAS_ALERTA_VALIDADE)} days")
+    
+    where = ("WHERE " + " AND ".join(condicoes)) if condicoes else ""
+    
+    try:
+        versao = _versao_catalogo(conexao)
+        chave = ('pagina', _hoje(), limite, apos_nome, apos_id, categoria, em_estoque, vencendo)
+        pagina = _cache_catalogo.obter(chave, versao)
+        if pagina is not _AUSENTE:
+            return _aplicar_reservas(conexao, pagina[0]), pagina[1]
+        
+        cursor = conexao.cursor()
+        # Busca um a mais para saber se existe próxima página
+        cursor.execute(f"""
+            SELECT 
+                p.id,
+                p.nome,
+                p.fabricante,
+                p.categoria,
+                COALESCE(r.estoque_total, 0) AS estoque_total,
+                r.validade_mais_proxima,
+                p.preco_venda,
+                p.descricao,
+                CAST(julianday(r.validade_mais_proxima) - julianday('now') AS INTEGER) AS dias_para_vencer
+            FROM produtos p
+            LEFT JOIN produto_estoque_resumo r ON r.produto_id = p.id
+            {where}
+            ORDER BY p.nome ASC, p.id ASC
+            LIMIT ?
+        """, parametros + [limite + 1])
+        
+        produtos = [_aplicar_desconto_rn4(produto) for produto in
+                    _linhas(cursor, ProdutoCatalogo)]
+        
+        proxima_pagina = None
+        if len(produtos) > limite:
+            produtos = produtos[:limite]
+            ultimo = produtos[-1]
+            proxima_pagina = {'apos_nome': ultimo['nome'], 'apos_id': ultimo['id']}
+        
+        _cache_catalogo.guardar(chave, versao, (produtos, proxima_pagina))
+        return _aplicar_reservas(conexao, produtos), proxima_pagina
+    
+    except Exception as err:
+        print(f"[ERRO] listar_produtos_pagina: {err}")
+        return [], None
+    finally:
+        conexao.close()
+
+def _consulta_fts_prefixo(termo):
+    """
+    Converte o texto digitado em uma consulta FTS5 de prefixo:
+    'dip 500' -> '"dip"* "500"*' (todas as palavras, cada uma como prefixo).
+    Palavras de 1 letra são ignoradas (prefixo curto demais casa com quase
+    tudo). Aspas são escapadas, então o usuário não injeta operadores.
+    """
+    palavras = [p for p in re.findall(r"\w+", termo or "") if len(p) >= 2]
+    return " ".join('"' + p.replace('"', '""') + '"*' for p in palavras)
+
+@metricas.medir_consulta
+def buscar_produtos(termo, limite=20, em_estoque=False):
+    """
+    Busca textual (typeahead do PDV) em nome, fabricante e descrição via
+    FTS5, por prefixo e sem acentos. Ordena por relevância (bm25, com peso
+    maior para o nome) e devolve os primeiros `limite` com estoque e
+    preço efetivo (RN4 aplicada).
+    Para termos muito comuns, só os Config.BUSCA_CANDIDATOS mais relevantes
+    (já filtrados por estoque, se pedido) seguem para os joins do catálogo.
+    """
+    consulta = _consulta_fts_prefixo(termo)
+    if not consulta:
+        return []
+    
+    conexao = get_db_connection()
+    if not conexao:
+        return []
+    
+    try:
+        versao = _versao_catalogo(conexao)
+        chave = ('busca', _hoje(), consulta, limite, em_estoque)
+        produtos = _cache_catalogo.obter(chave, versao)
+        if produtos is not _AUSENTE:
+            return _aplicar_reservas(conexao, produtos)
+        
+        # O filtro de estoque entra antes do corte de candidatos: senão os
+        # mais relevantes sem estoque ocupariam o corte e sobraria nada
+        filtro_estoque = ("INNER JOIN produto_estoque_resumo e ON e.produto_id = produtos_fts.rowid"
+                          " AND e.estoque_total > 0") if em_estoque else ""
+        cursor = conexao.cursor()
+        cursor.execute(f"""
+            SELECT 
+                p.id,
+                p.nome,
+                p.fabricante,
+                p.categoria,
+                COALESCE(r.estoque_total, 0) AS estoque_total,
+                r.validade_mais_proxima,
+                p.preco_venda,
+                p.descricao,
+                CAST(julianday(r.validade_mais_proxima) - julianday('now') AS INTEGER) AS dias_para_vencer
+            FROM (
+                SELECT produtos_fts.rowid AS id, bm25(produtos_fts, 10.0, 3.0, 1.0) AS relevancia
+                FROM produtos_fts
+                {filtro_estoque}
+                WHERE produtos_fts MATCH ?
+                ORDER BY relevancia
+                LIMIT ?
+            ) f
+            INNER JOIN produtos p ON p.id = f.id
+            LEFT JOIN produto_estoque_resumo r ON r.produto_id = p.id
+            ORDER BY f.relevancia, p.nome
+            LIMIT ?
+        """, (consulta, Config.BUSCA_CANDIDATOS, limite))
+        
+        produtos = [_aplicar_desconto_rn4(produto) for produto in
+                    _linhas(cursor, ProdutoCatalogo)]
+        _cache_catalogo.guardar(chave, versao, produtos)
+        return _aplicar_reservas(conexao, produtos)
+    
+    except Exception as err:
+        print(f"[ERRO] buscar_produtos: {err}")
+        return []
+    finally:
+        conexao.close()
+
+@metricas.medir_consulta
 def get_produto_por_id(produto_id):
-    """Busca um produto específico pelo ID"""
+    """Busca um produto específico pelo ID (com cache do catálogo)"""
     conexao = get_db_connection()
     if not conexao:
         return None
     
     try:
-        cursor = conexao.cursor()
-        cursor.execute("""
-            SELECT id, nome, fabricante, categoria, preco_venda, descricao
-            FROM produtos
-            WHERE id = ?
-        """, (produto_id,))
+        versao = _versao_catalogo(conexao)
+        chave = ('produto', produto_id)
+        produto = _cache_catalogo.obter(chave, versao)
+        if produto is _AUSENTE:
+            cursor = conexao.cursor()
+            cursor.execute("""
+                SELECT id, nome, fabricante, categoria, preco_venda, descricao
+                FROM produtos
+                WHERE id = ?
+            """, (produto_id,))
+            
+            produto = dict_from_row(cursor.fetchone())
+            _cache_catalogo.guardar(chave, versao, produto)
         
-        return dict_from_row(cursor.fetchone())
+        return dict(produto) if produto else None
     
     except Exception as err:
         print(f"[ERRO] get_produto_por_id: {err}")
@@ -192,6 +1328,7 @@ def get_produto_por_id(produto_id):
     finally:
         conexao.close()
 
+@metricas.medir_consulta
 def criar_produto(nome, fabricante, categoria, preco_venda, descricao=''):
     """
     Cria um novo produto no catálogo.
@@ -203,14 +1340,20 @@ def criar_produto(nome, fabricante, categoria, preco_venda, descricao=''):
     
     try:
         cursor = conexao.cursor()
+        _iniciar_escrita(cursor)
         cursor.execute("""
             INSERT INTO produtos (nome, fabricante, categoria, preco_venda, descricao)
             VALUES (?, ?, ?, ?, ?)
         """, (nome, fabricante, categoria, preco_venda, descricao))
         
+        _incrementar_versao_catalogo(conexao)
         conexao.commit()
+        _cache_catalogo.limpar()
         return cursor.lastrowid
     
+    except BancoOcupado:
+        conexao.rollback()
+        raise
     except Exception as err:
         print(f"[ERRO] criar_produto: {err}")
         conexao.rollback()
@@ -218,6 +1361,7 @@ def criar_produto(nome, fabricante, categoria, preco_venda, descricao=''):
     finally:
         conexao.close()
 
+@metricas.medir_consulta
 def editar_produto(produto_id, nome, fabricante, categoria, preco_venda, descricao):
     """Atualiza dados de um produto existente"""
     conexao = get_db_connection()
@@ -226,6 +1370,7 @@ def editar_produto(produto_id, nome, fabricante, categoria, preco_venda, descric
     
     try:
         cursor = conexao.cursor()
+        _iniciar_escrita(cursor)
         cursor.execute("""
             UPDATE produtos
             SET nome = ?, fabricante = ?, categoria = ?, 
@@ -233,9 +1378,14 @@ def editar_produto(produto_id, nome, fabricante, categoria, preco_venda, descric
             WHERE id = ?
         """, (nome, fabricante, categoria, preco_venda, descricao, produto_id))
         
+        _incrementar_versao_catalogo(conexao)
         conexao.commit()
+        _cache_catalogo.limpar()
         return True
     
+    except BancoOcupado:
+        conexao.rollback()
+        raise
     except Exception as err:
         print(f"[ERRO] editar_produto: {err}")
         conexao.rollback()
@@ -243,19 +1393,47 @@ def editar_produto(produto_id, nome, fabricante, categoria, preco_venda, descric
     finally:
         conexao.close()
 
+class ProdutoEmUso(Exception):
+    """O produto tem vendas ou lotes com saldo: não pode ser excluído."""
+
+    def __init__(self, produto_id):
+        self.produto_id = produto_id
+        super().__init__(f"Produto {produto_id} tem vendas ou estoque registrados")
+
+@metricas.medir_consulta
 def deletar_produto(produto_id):
-    """Remove um produto do sistema."""
+    """
+    Remove um produto do sistema. Levanta ProdutoEmUso se ele ainda tem
+    lotes com saldo (conferido antes do DELETE) ou vendas (a chave
+    estrangeira de itens_venda recusa). Lotes zerados e reservas saem
+    junto (ON DELETE CASCADE).
+    """
     conexao = get_db_connection()
     if not conexao:
         return False
     
     try:
         cursor = conexao.cursor()
+        _iniciar_escrita(cursor)
+        cursor.execute(
+            "SELECT EXISTS(SELECT 1 FROM estoque_lotes WHERE produto_id = ? AND qtd_atual > 0)",
+            (produto_id,)
+        )
+        if cursor.fetchone()[0]:
+            raise ProdutoEmUso(produto_id)
         cursor.execute("DELETE FROM produtos WHERE id = ?", (produto_id,))
         
+        _incrementar_versao_catalogo(conexao)
         conexao.commit()
+        _cache_catalogo.limpar()
         return True
     
+    except (BancoOcupado, ProdutoEmUso):
+        conexao.rollback()
+        raise
+    except sqlite3.IntegrityError:
+        conexao.rollback()
+        raise ProdutoEmUso(produto_id) from None
     except Exception as err:
         print(f"[ERRO] deletar_produto: {err}")
         conexao.rollback()
@@ -267,6 +1445,7 @@ def deletar_produto(produto_id):
 # MÓDULO: LOTES E ESTOQUE
 # =====================================================
 
+@metricas.medir_consulta
 def listar_lotes_por_produto(produto_id):
     """
     Retorna todos os lotes de um produto específico.
@@ -293,7 +1472,7 @@ def listar_lotes_por_produto(produto_id):
             ORDER BY data_validade ASC
         """, (produto_id,))
         
-        return [dict_from_row(row) for row in cursor.fetchall()]
+        return _linhas(cursor, LoteProduto)
     
     except Exception as err:
         print(f"[ERRO] listar_lotes_por_produto: {err}")
@@ -301,6 +1480,7 @@ def listar_lotes_por_produto(produto_id):
     finally:
         conexao.close()
 
+@metricas.medir_consulta
 def criar_lote(produto_id, numero_lote, data_validade, qtd_atual):
     """Adiciona um novo lote ao estoque"""
     conexao = get_db_connection()
@@ -309,14 +1489,20 @@ def criar_lote(produto_id, numero_lote, data_validade, qtd_atual):
     
     try:
         cursor = conexao.cursor()
+        _iniciar_escrita(cursor)
         cursor.execute("""
             INSERT INTO estoque_lotes (produto_id, numero_lote, data_validade, qtd_atual)
             VALUES (?, ?, ?, ?)
         """, (produto_id, numero_lote, data_validade, qtd_atual))
         
+        _incrementar_versao_catalogo(conexao)
         conexao.commit()
+        _cache_catalogo.limpar()
         return cursor.lastrowid
     
+    except BancoOcupado:
+        conexao.rollback()
+        raise
     except Exception as err:
         print(f"[ERRO] criar_lote: {err}")
         conexao.rollback()
@@ -324,10 +1510,15 @@ def criar_lote(produto_id, numero_lote, data_validade, qtd_atual):
     finally:
         conexao.close()
 
-def get_lote_fefo(produto_id, quantidade_necessaria):
+@metricas.medir_consulta
+def criar_lotes_em_massa(lotes):
     """
-    RN3 - BAIXA DE ESTOQUE FEFO (First Expire, First Out)
-    Retorna o lote com validade mais próxima que tenha estoque suficiente.
+    Recebimento de mercadoria: grava vários lotes em UMA transação, com um
+    único incremento da versão do catálogo para o lote inteiro.
+    lotes: lista de (produto_id, numero_lote, data_validade, qtd_atual) já
+    validados quanto ao formato.
+    Retorna (ids, erros): ids na mesma ordem da entrada, ou erros
+    {indice: mensagem} sem gravar nada (tudo ou nada). None se falhou.
     """
     conexao = get_db_connection()
     if not conexao:
@@ -335,10 +1526,60 @@ def get_lote_fefo(produto_id, quantidade_necessaria):
     
     try:
         cursor = conexao.cursor()
-        cursor.execute("""
-            SELECT id, numero_lote, data_validade, qtd_atual
-            FROM estoque_lotes
-            WHERE produto_id = ? AND qtd_atual >= ?
+        _iniciar_escrita(cursor)
+        
+        produto_ids = list({lote[0] for lote in lotes})
+        marcadores = ", ".join("?" for _ in produto_ids)
+        cursor.execute(f"SELECT id FROM produtos WHERE id IN ({marcadores})", produto_ids)
+        existentes = {row['id'] for row in cursor.fetchall()}
+        
+        erros = {
+            indice: f"Produto {lote[0]} não encontrado"
+            for indice, lote in enumerate(lotes) if lote[0] not in existentes
+        }
+        if erros:
+            conexao.rollback()
+            return [], erros
+        
+        ids = []
+        for lote in lotes:
+            cursor.execute("""
+                INSERT INTO estoque_lotes (produto_id, numero_lote, data_validade, qtd_atual)
+                VALUES (?, ?, ?, ?)
+            """, lote)
+            ids.append(cursor.lastrowid)
+        
+        _incrementar_versao_catalogo(conexao)
+        conexao.commit()
+        _cache_catalogo.limpar()
+        return ids, {}
+    
+    except BancoOcupado:
+        conexao.rollback()
+        raise
+    except Exception as err:
+        print(f"[ERRO] criar_lotes_em_massa: {err}")
+        conexao.rollback()
+        return None
+    finally:
+        conexao.close()
+
+@metricas.medir_consulta
+def get_lote_fefo(produto_id, quantidade_necessaria):
+    """
+    RN3 - BAIXA DE ESTOQUE FEFO (First Expire, First Out)
+    Retorna o lote com validade mais próxima que tenha estoque suficiente.
+    """
+    conexao = get_db_connection()
+    if not conexao:
+        return None
+    
+    try:
+        cursor = conexao.cursor()
+        cursor.execute("""
+            SELECT id, numero_lote, data_validade, qtd_atual
+            FROM estoque_lotes
+            WHERE produto_id = ? AND qtd_atual >= ?
             ORDER BY data_validade ASC
             LIMIT 1
         """, (produto_id, quantidade_necessaria))
@@ -351,6 +1592,7 @@ def get_lote_fefo(produto_id, quantidade_necessaria):
     finally:
         conexao.close()
 
+@metricas.medir_consulta
 def baixar_estoque(lote_id, quantidade):
     """
     Diminui a quantidade de um lote específico.
@@ -361,15 +1603,21 @@ def baixar_estoque(lote_id, quantidade):
     
     try:
         cursor = conexao.cursor()
+        _iniciar_escrita(cursor)
         cursor.execute("""
             UPDATE estoque_lotes
             SET qtd_atual = qtd_atual - ?
             WHERE id = ? AND qtd_atual >= ?
         """, (quantidade, lote_id, quantidade))
         
+        _incrementar_versao_catalogo(conexao)
         conexao.commit()
+        _cache_catalogo.limpar()
         return cursor.rowcount > 0
     
+    except BancoOcupado:
+        conexao.rollback()
+        raise
     except Exception as err:
         print(f"[ERRO] baixar_estoque: {err}")
         conexao.rollback()
@@ -381,37 +1629,157 @@ def baixar_estoque(lote_id, quantidade):
 # MÓDULO: ALERTAS E RELATÓRIOS
 # =====================================================
 
-def get_lotes_vencendo():
+def _janela_validade(dias):
+    """
+    Limites [inicio, fim) em texto ISO para 'vence nos próximos N dias'.
+    Comparar a coluna pura com esses limites deixa o SQLite usar o índice
+    idx_lotes_validade_com_estoque (date(coluna) impediria).
+    """
+    hoje = _hoje()
+    return hoje.isoformat(), (hoje + timedelta(days=int(dias) + 1)).isoformat()
+
+_SQL_LOTES_VENCENDO = """
+    SELECT 
+        el.id AS lote_id,
+        p.nome AS produto_nome,
+        p.fabricante,
+        el.numero_lote,
+        el.data_validade,
+        el.qtd_atual,
+        CAST(julianday(el.data_validade) - julianday(?) AS INTEGER) AS dias_para_vencer
+    FROM estoque_lotes el
+    INNER JOIN produtos p ON el.produto_id = p.id
+    WHERE el.data_validade >= ? AND el.data_validade < ?
+        AND el.qtd_atual > 0
+    ORDER BY el.data_validade ASC
+"""
+
+@metricas.medir_consulta
+def get_lotes_vencendo(dias=None):
     """
     RN2 - ALERTA DE VALIDADE
-    Retorna lotes que vencem nos próximos 30 dias.
+    Retorna lotes com saldo que vencem nos próximos `dias` dias
+    (padrão: Config.DIAS_ALERTA_VALIDADE).
+    Resultado em cache por dia do calendário + versão do estoque, então o
+    dashboard não varre os lotes a cada visualização.
     """
-    conexao = get_db_connection()
+    dias = Config.DIAS_ALERTA_VALIDADE if dias is None else int(dias)
+    inicio, fim = _janela_validade(dias)
+    
+    conexao = get_db_connection_leitura()
     if not conexao:
         return []
     
     try:
+        versao = _versao_catalogo(conexao)
+        chave = ('lotes_vencendo', inicio, dias)
+        lotes = _cache_catalogo.obter(chave, versao)
+        if lotes is not _AUSENTE:
+            return list(lotes)
+        
         cursor = conexao.cursor()
-        cursor.execute("""
-            SELECT 
-                el.id AS lote_id,
-                p.nome AS produto_nome,
-                p.fabricante,
-                el.numero_lote,
-                el.data_validade,
-                el.qtd_atual,
-                CAST(julianday(el.data_validade) - julianday('now') AS INTEGER) AS dias_para_vencer
+        cursor.execute(_SQL_LOTES_VENCENDO, (inicio, inicio, fim))
+        
+        lotes = _linhas(cursor, LoteVencendo)
+        _cache_catalogo.guardar(chave, versao, lotes)
+        return list(lotes)
+    
+    except Exception as err:
+        print(f"[ERRO] get_lotes_vencendo: {err}")
+        return []
+    finally:
+        conexao.close()
+
+def iterar_lotes_vencendo(dias=None):
+    """
+    Gerador dos mesmos lotes de get_lotes_vencendo, para a tela de
+    relatórios em fluxo (stream_template): as linhas saem do cursor em
+    blocos de Config.STREAM_BLOCO enquanto a tabela é enviada, então a
+    memória não cresce com o número de lotes. Se o dashboard já deixou a
+    lista no cache, ela é usada sem consultar o banco.
+    """
+    dias = Config.DIAS_ALERTA_VALIDADE if dias is None else int(dias)
+    inicio, fim = _janela_validade(dias)
+    
+    conexao = get_db_connection_leitura()
+    if not conexao:
+        return
+    
+    try:
+        lotes = _cache_catalogo.obter(('lotes_vencendo', inicio, dias), _versao_catalogo(conexao))
+        if lotes is not _AUSENTE:
+            yield from lotes
+            return
+        
+        cursor = conexao.cursor()
+        cursor.execute(_SQL_LOTES_VENCENDO, (inicio, inicio, fim))
+        yield from _iterar_linhas(cursor, LoteVencendo)
+    
+    except Exception as err:
+        print(f"[ERRO] iterar_lotes_vencendo: {err}")
+    finally:
+        conexao.close()
+
+@metricas.medir_consulta
+def resumo_validade(horizontes=(7, 30, 90)):
+    """
+    RN2 - Resumo por horizonte em UMA passada pelo índice de validade:
+    para cada horizonte (em dias), quantidade de lotes, unidades e valor
+    (qtd x preço de venda) que vencem até lá. Os horizontes são cumulativos
+    (quem vence em 7 dias também conta em 30 e 90).
+    Mesmo cache de get_lotes_vencendo (dia + versão do estoque).
+    """
+    horizontes = sorted({int(h) for h in horizontes})
+    if not horizontes:
+        return []
+    
+    inicio, fim = _janela_validade(horizontes[-1])
+    limites = [_janela_validade(h)[1] for h in horizontes]
+    
+    conexao = get_db_connection_leitura()
+    if not conexao:
+        return []
+    
+    try:
+        versao = _versao_catalogo(conexao)
+        chave = ('resumo_validade', inicio, tuple(horizontes))
+        resumo = _cache_catalogo.obter(chave, versao)
+        if resumo is not _AUSENTE:
+            return [dict(faixa) for faixa in resumo]
+        
+        colunas = []
+        parametros = []
+        for i, limite in enumerate(limites):
+            colunas.append(f"""
+                COALESCE(SUM(el.data_validade < ?), 0) AS lotes_{i},
+                COALESCE(SUM(CASE WHEN el.data_validade < ? THEN el.qtd_atual END), 0) AS unidades_{i},
+                COALESCE(SUM(CASE WHEN el.data_validade < ? THEN el.qtd_atual * p.preco_venda END), 0) AS valor_{i}""")
+            parametros.extend([limite, limite, limite])
+        
+        cursor = conexao.cursor()
+        cursor.execute(f"""
+            SELECT {", ".join(colunas)}
             FROM estoque_lotes el
             INNER JOIN produtos p ON el.produto_id = p.id
-            WHERE date(el.data_validade) BETWEEN date('now') AND date('now', '+30 days')
+            WHERE el.data_validade >= ? AND el.data_validade < ?
                 AND el.qtd_atual > 0
-            ORDER BY el.data_validade ASC
-        """)
+        """, parametros + [inicio, fim])
         
-        return [dict_from_row(row) for row in cursor.fetchall()]
+        row = cursor.fetchone()
+        resumo = [
+            {
+                'dias': h,
+                'lotes': row[f'lotes_{i}'],
+                'unidades': row[f'unidades_{i}'],
+                'valor': round(row[f'valor_{i}'], 2)
+            }
+            for i, h in enumerate(horizontes)
+        ]
+        _cache_catalogo.guardar(chave, versao, resumo)
+        return [dict(faixa) for faixa in resumo]
     
     except Exception as err:
-        print(f"[ERRO] get_lotes_vencendo: {err}")
+        print(f"[ERRO] resumo_validade: {err}")
         return []
     finally:
         conexao.close()
@@ -420,9 +1788,297 @@ def get_lotes_vencendo():
 # MÓDULO: VENDAS E TRANSAÇÕES
 # =====================================================
 
-def registrar_venda(itens, usuario_id, supervisor=None):
+class EstoqueInsuficiente(Exception):
+    """Saldo somado dos lotes não cobre a quantidade pedida de um produto."""
+
+    def __init__(self, produto_id, solicitado, disponivel, nome=None):
+        self.produto_id = produto_id
+        self.solicitado = solicitado
+        self.disponivel = disponivel
+        self.nome = nome
+        super().__init__(
+            f"Estoque insuficiente para o produto {produto_id}: "
+            f"solicitado {solicitado}, disponível {disponivel}"
+        )
+
+class ControladoSemLiberacao(Exception):
+    """RN1: venda com medicamento controlado sem receita e senha do supervisor válidas."""
+
+    def __init__(self, produto_id, nome):
+        self.produto_id = produto_id
+        self.nome = nome
+        super().__init__(f"Medicamento controlado sem liberação: {nome}")
+
+def _resolver_carrinho(cursor, produto_ids, carrinho=None):
+    """
+    Resolve o carrinho inteiro em UMA consulta (IN list): dados de cada
+    produto e seus lotes com saldo, já em ordem FEFO.
+    O saldo de cada lote já desconta as reservas ativas de outros
+    carrinhos do PDV (as do próprio `carrinho` não contam).
+    Retorna {produto_id: {'nome', 'categoria', 'preco_venda', 'dias_para_vencer',
+    'lotes': [[lote_id, qtd, numero_lote, data_validade], ...]}}.
+    Produtos inexistentes não aparecem no dicionário.
+    """
+    produto_ids = list(dict.fromkeys(produto_ids))
+    marcadores = ", ".join("?" for _ in produto_ids)
+    cursor.execute(f"""
+        SELECT 
+            p.id AS produto_id,
+            p.nome,
+            p.categoria,
+            p.preco_venda,
+            CAST(julianday(pr.validade_mais_proxima) - julianday('now') AS INTEGER) AS dias_para_vencer,
+            el.id AS lote_id,
+            el.qtd_atual - COALESCE((
+                SELECT SUM(r.quantidade) FROM reservas_estoque r
+                WHERE r.lote_id = el.id AND r.expira_em > ? AND r.carrinho IS NOT ?
+            ), 0) AS qtd_atual,
+            el.numero_lote,
+            el.data_validade
+        FROM produtos p
+        LEFT JOIN produto_estoque_resumo pr ON pr.produto_id = p.id
+        LEFT JOIN estoque_lotes el ON el.produto_id = p.id AND el.qtd_atual > 0
+        WHERE p.id IN ({marcadores})
+        ORDER BY p.id, el.data_validade ASC, el.id ASC
+    """, [time.time(), carrinho] + produto_ids)
+    
+    produtos = {}
+    for row in cursor.fetchall():
+        produto = produtos.get(row['produto_id'])
+        if produto is None:
+            produto = produtos[row['produto_id']] = {
+                'nome': row['nome'],
+                'categoria': row['categoria'],
+                'preco_venda': row['preco_venda'],
+                'dias_para_vencer': row['dias_para_vencer'],
+                'lotes': []
+            }
+        if row['lote_id'] is not None:
+            produto['lotes'].append([row['lote_id'], row['qtd_atual'], row['numero_lote'], row['data_validade']])
+    
+    return produtos
+
+def _reservas_do_carrinho(cursor, carrinho, usuario_id):
+    """
+    Reservas ativas do carrinho no mesmo formato de _resolver_carrinho:
+    os 'lotes' são as fatias reservadas, em ordem FEFO. Não lê os lotes.
+    """
+    cursor.execute("""
+        SELECT 
+            p.id AS produto_id,
+            p.nome,
+            p.categoria,
+            p.preco_venda,
+            CAST(julianday(pr.validade_mais_proxima) - julianday('now') AS INTEGER) AS dias_para_vencer,
+            r.lote_id,
+            r.quantidade
+        FROM reservas_estoque r
+        INNER JOIN produtos p ON p.id = r.produto_id
+        LEFT JOIN produto_estoque_resumo pr ON pr.produto_id = p.id
+        WHERE r.carrinho = ? AND r.usuario_id = ? AND r.expira_em > ?
+        ORDER BY p.id, r.id
+    """, (carrinho, usuario_id, time.time()))
+    
+    reservas = {}
+    for row in cursor.fetchall():
+        produto = reservas.get(row['produto_id'])
+        if produto is None:
+            produto = reservas[row['produto_id']] = {
+                'nome': row['nome'],
+                'categoria': row['categoria'],
+                'preco_venda': row['preco_venda'],
+                'dias_para_vencer': row['dias_para_vencer'],
+                'lotes': []
+            }
+        produto['lotes'].append([row['lote_id'], row['quantidade']])
+    
+    return reservas
+
+def _alocar_lotes_fefo(lotes, produto_id, quantidade, nome=None):
+    """
+    RN3 - FEFO com vários lotes.
+    Divide a quantidade entre os lotes (já em ordem de validade), do que
+    vence primeiro para o último, descontando o saldo em memória para que
+    o mesmo produto repetido no carrinho não use a mesma unidade duas vezes.
+    Retorna [(lote_id, quantidade_do_lote), ...]; `nome` vai na exceção.
+    """
+    fatias = []
+    restante = quantidade
+    for lote in lotes:
+        if lote[1] <= 0:
+            continue
+        retirar = min(restante, lote[1])
+        lote[1] -= retirar
+        fatias.append((lote[0], retirar))
+        restante -= retirar
+        if restante == 0:
+            break
+    
+    if restante > 0:
+        raise EstoqueInsuficiente(produto_id, quantidade, quantidade - restante, nome)
+    
+    return fatias
+
+def _preco_efetivo(produto):
+    """Preço unitário do banco com a RN4 aplicada (mesma regra do catálogo)."""
+    return _aplicar_desconto_rn4({
+        'preco_venda': produto['preco_venda'],
+        'dias_para_vencer': produto['dias_para_vencer']
+    })['preco_venda']
+
+def _atualizar_consolidados(cursor, venda_id, usuario_id, itens, carrinho, total):
+    """
+    Soma a venda nos consolidados diários (produto, vendedor, categoria).
+    Chamada dentro da transação de registrar_venda; o dia é o mesmo da
+    data_venda gravada (date(), como na carga inicial da migração 5).
     """
-    Registra uma venda completa no sistema.
+    cursor.execute("SELECT date(data_venda) FROM vendas WHERE id = ?", (venda_id,))
+    dia = cursor.fetchone()[0]
+    
+    por_produto = {}
+    por_categoria = {}
+    for item in itens:
+        unidades, receita = por_produto.get(item['produto_id'], (0, 0.0))
+        por_produto[item['produto_id']] = (
+            unidades + item['quantidade'],
+            receita + item['quantidade'] * item['preco']
+        )
+        categoria = carrinho[item['produto_id']]['categoria']
+        unidades, receita = por_categoria.get(categoria, (0, 0.0))
+        por_categoria[categoria] = (
+            unidades + item['quantidade'],
+            receita + item['quantidade'] * item['preco']
+        )
+    
+    cursor.executemany("""
+        INSERT INTO vendas_diarias_produto (dia, produto_id, unidades, receita, qtd_vendas)
+        VALUES (?, ?, ?, ?, 1)
+        ON CONFLICT (dia, produto_id) DO UPDATE SET
+            unidades = unidades + excluded.unidades,
+            receita = receita + excluded.receita,
+            qtd_vendas = qtd_vendas + 1
+    """, [(dia, produto_id, u, r) for produto_id, (u, r) in por_produto.items()])
+    
+    cursor.executemany("""
+        INSERT INTO vendas_diarias_categoria (dia, categoria, unidades, receita, qtd_vendas)
+        VALUES (?, ?, ?, ?, 1)
+        ON CONFLICT (dia, categoria) DO UPDATE SET
+            unidades = unidades + excluded.unidades,
+            receita = receita + excluded.receita,
+            qtd_vendas = qtd_vendas + 1
+    """, [(dia, categoria, u, r) for categoria, (u, r) in por_categoria.items()])
+    
+    cursor.execute("""
+        INSERT INTO vendas_diarias_vendedor (dia, usuario_id, unidades, receita, qtd_vendas)
+        VALUES (?, ?, ?, ?, 1)
+        ON CONFLICT (dia, usuario_id) DO UPDATE SET
+            unidades = unidades + excluded.unidades,
+            receita = receita + excluded.receita,
+            qtd_vendas = qtd_vendas + 1
+    """, (dia, usuario_id, sum(item['quantidade'] for item in itens), total))
+
+def _gravar_venda(cursor, itens, usuario_id, supervisor, carrinho_id=None, controlado_liberado=False):
+    """
+    Grava uma venda dentro de uma transação JÁ aberta (BEGIN IMMEDIATE) e
+    retorna o venda_id. Não faz commit nem mexe na versão do catálogo.
+    Com carrinho_id, as reservas do PDV viram a venda sem consultar os
+    lotes: preço, categoria (RN1) e lotes vêm das linhas reservadas. Só
+    produtos sem reserva suficiente (ex.: prazo vencido) passam pela
+    alocação FEFO normal. As reservas do carrinho são apagadas.
+    Lança EstoqueInsuficiente se algum produto não tiver saldo e
+    ControladoSemLiberacao (RN1) se houver controlado sem controlado_liberado.
+    """
+    carrinho = _reservas_do_carrinho(cursor, carrinho_id, usuario_id) if carrinho_id else {}
+    
+    pedidos = {}
+    for item in itens:
+        pedidos[item['produto_id']] = pedidos.get(item['produto_id'], 0) + item['quantidade']
+    faltantes = [
+        produto_id for produto_id, quantidade in pedidos.items()
+        if produto_id not in carrinho
+        or sum(lote[1] for lote in carrinho[produto_id]['lotes']) < quantidade
+    ]
+    if faltantes:
+        carrinho.update(_resolver_carrinho(cursor, faltantes, carrinho_id))
+    
+    # RN1: a categoria é a do banco, lida nesta mesma transação
+    if not controlado_liberado:
+        for produto_id in pedidos:
+            produto = carrinho.get(produto_id)
+            if produto and produto['categoria'] == 'Controlado':
+                raise ControladoSemLiberacao(produto_id, produto['nome'])
+    
+    # RN3: distribui cada item entre os lotes (em memória)
+    baixas = []
+    linhas_itens = []
+    precos = {}
+    for item in itens:
+        produto = carrinho.get(item['produto_id'])
+        lotes = produto['lotes'] if produto else []
+        fatias = _alocar_lotes_fefo(lotes, item['produto_id'], item['quantidade'],
+                                    produto['nome'] if produto else None)
+        # Preço sempre do banco (RN4 aplicada), nunca o enviado pelo PDV
+        preco = precos[item['produto_id']] = _preco_efetivo(produto)
+        for lote_id, quantidade in fatias:
+            baixas.append((quantidade, lote_id, quantidade))
+            linhas_itens.append((
+                item['produto_id'],
+                lote_id,
+                quantidade,
+                preco,
+                quantidade * preco
+            ))
+    itens = [dict(item, preco=precos[item['produto_id']]) for item in itens]
+    
+    # Calcula total da venda
+    total = sum(item['quantidade'] * item['preco'] for item in itens)
+    
+    # Insere cabeçalho da venda
+    cursor.execute("""
+        INSERT INTO vendas (total, usuario_id, supervisor_liberacao)
+        VALUES (?, ?, ?)
+    """, (total, usuario_id, supervisor))
+    
+    venda_id = cursor.lastrowid
+    
+    # Baixa condicional de todos os lotes: se algum saldo mudou, a
+    # soma de linhas afetadas fica menor que o número de baixas
+    cursor.executemany("""
+        UPDATE estoque_lotes
+        SET qtd_atual = qtd_atual - ?
+        WHERE id = ? AND qtd_atual >= ?
+    """, baixas)
+    
+    if cursor.rowcount != len(baixas):
+        raise sqlite3.IntegrityError("Saldo de lote alterado durante a venda")
+    
+    # Um item de venda por fatia de lote
+    cursor.executemany("""
+        INSERT INTO itens_venda 
+        (venda_id, produto_id, lote_id, quantidade, preco_unitario, subtotal)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, [(venda_id,) + linha for linha in linhas_itens])
+    
+    # Consolidados diários (relatórios) na mesma transação
+    _atualizar_consolidados(cursor, venda_id, usuario_id, itens, carrinho, total)
+    
+    if carrinho_id:
+        cursor.execute(
+            "DELETE FROM reservas_estoque WHERE carrinho = ? AND usuario_id = ?",
+            (carrinho_id, usuario_id)
+        )
+    
+    return venda_id
+
+@metricas.medir_consulta
+def cotar_carrinho(itens, carrinho=None):
+    """
+    Cotação do carrinho inteiro em UMA consulta (a mesma da venda), sem
+    gravar nada. Por linha: preço do banco com RN4, categoria/controlado,
+    estoque disponível e os lotes que a venda usaria (FEFO, descontando
+    reservas de outros carrinhos; as do próprio `carrinho` contam como suas).
+    itens: [{'produto_id', 'quantidade'}, ...].
+    Retorna {'linhas', 'total', 'tem_controlado', 'disponivel'} ou None se falhou.
     """
     conexao = get_db_connection()
     if not conexao:
@@ -430,45 +2086,110 @@ def registrar_venda(itens, usuario_id, supervisor=None):
     
     try:
         cursor = conexao.cursor()
+        produtos = _resolver_carrinho(cursor, [item['produto_id'] for item in itens], carrinho)
         
-        # Calcula total da venda
-        total = sum(item['quantidade'] * item['preco'] for item in itens)
-        
-        # Insere cabeçalho da venda
-        cursor.execute("""
-            INSERT INTO vendas (total, usuario_id, supervisor_liberacao)
-            VALUES (?, ?, ?)
-        """, (total, usuario_id, supervisor))
-        
-        venda_id = cursor.lastrowid
-        
-        # Insere itens da venda
+        linhas = []
         for item in itens:
-            subtotal = item['quantidade'] * item['preco']
+            produto_id, quantidade = item['produto_id'], item['quantidade']
+            produto = produtos.get(produto_id)
+            if produto is None:
+                linhas.append({
+                    'produto_id': produto_id, 'quantidade': quantidade, 'encontrado': False,
+                    'disponivel': False, 'estoque_disponivel': 0, 'lotes': []
+                })
+                continue
             
-            cursor.execute("""
-                INSERT INTO itens_venda 
-                (venda_id, produto_id, lote_id, quantidade, preco_unitario, subtotal)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (
-                venda_id,
-                item['produto_id'],
-                item['lote_id'],
-                item['quantidade'],
-                item['preco'],
-                subtotal
-            ))
+            # Saldo que sobrou para esta linha (o mesmo produto pode se repetir)
+            estoque = sum(lote[1] for lote in produto['lotes'] if lote[1] > 0)
+            lotes = []
+            if estoque >= quantidade:
+                dados_lote = {lote[0]: lote for lote in produto['lotes']}
+                for lote_id, qtd in _alocar_lotes_fefo(produto['lotes'], produto_id, quantidade):
+                    lotes.append({
+                        'lote_id': lote_id,
+                        'numero_lote': dados_lote[lote_id][2],
+                        'data_validade': dados_lote[lote_id][3],
+                        'quantidade': qtd
+                    })
             
-            # Baixa estoque do lote usado
-            cursor.execute("""
-                UPDATE estoque_lotes
-                SET qtd_atual = qtd_atual - ?
-                WHERE id = ?
-            """, (item['quantidade'], item['lote_id']))
+            precificado = _aplicar_desconto_rn4({
+                'preco_venda': produto['preco_venda'],
+                'dias_para_vencer': produto['dias_para_vencer']
+            })
+            linhas.append({
+                'produto_id': produto_id,
+                'nome': produto['nome'],
+                'categoria': produto['categoria'],
+                'controlado': produto['categoria'] == 'Controlado',
+                'quantidade': quantidade,
+                'preco_unitario': precificado['preco_venda'],
+                'preco_original': produto['preco_venda'],
+                'tem_desconto': precificado['tem_desconto'],
+                'percentual_desconto': precificado.get('percentual_desconto', 0),
+                'subtotal': round(precificado['preco_venda'] * quantidade, 2),
+                'encontrado': True,
+                'disponivel': estoque >= quantidade,
+                'estoque_disponivel': estoque,
+                'lotes': lotes
+            })
         
+        return {
+            'linhas': linhas,
+            'total': round(sum(linha.get('subtotal', 0) for linha in linhas), 2),
+            'tem_controlado': any(linha.get('controlado') for linha in linhas),
+            'disponivel': all(linha['disponivel'] for linha in linhas)
+        }
+    
+    except Exception as err:
+        print(f"[ERRO] cotar_carrinho: {err}")
+        return None
+    finally:
+        conexao.close()
+
+@metricas.medir_consulta
+def registrar_venda(itens, usuario_id, supervisor=None, carrinho=None, controlado_liberado=False):
+    """
+    Registra uma venda completa no sistema, em UMA transação (BEGIN IMMEDIATE).
+    O carrinho é resolvido com uma única consulta (produtos + lotes) e
+    gravado com executemany, independente do número de itens.
+    RN3: cada item é distribuído entre os lotes por FEFO; a baixa de cada
+    lote é um UPDATE condicional (qtd_atual >= quantidade), então dois
+    caixas concorrentes nunca vendem a mesma unidade.
+    Cada item: {'produto_id', 'quantidade'}; o preço é sempre o do banco,
+    com a RN4 aplicada ('preco' enviado pelo PDV é ignorado).
+    Lança EstoqueInsuficiente se algum produto não tiver saldo e
+    BancoOcupado se o lock de escrita não vier dentro de Config.ESCRITA_PRAZO.
+    carrinho: id do carrinho do PDV cujas reservas (reservar_estoque) viram
+    a venda, sem nova consulta aos lotes.
+    RN1: com item controlado, só grava se controlado_liberado (receita e
+    senha do supervisor já conferidas); senão ControladoSemLiberacao.
+    Com Config.VENDAS_GRUPO_COMMIT a venda é gravada pelo EscritorVendas,
+    junto com as de outros caixas (mesmo retorno e mesmas exceções).
+    """
+    if Config.VENDAS_GRUPO_COMMIT:
+        return get_escritor_vendas().registrar(itens, usuario_id, supervisor, carrinho, controlado_liberado)
+    
+    conexao = get_db_connection()
+    if not conexao:
+        return None
+    
+    try:
+        cursor = conexao.cursor()
+        
+        # Trava de escrita já no início: a leitura dos lotes e a baixa
+        # enxergam o mesmo saldo
+        _iniciar_escrita(cursor)
+        
+        venda_id = _gravar_venda(cursor, itens, usuario_id, supervisor, carrinho, controlado_liberado)
+        
+        _incrementar_versao_catalogo(conexao)
         conexao.commit()
+        _cache_catalogo.limpar()
         return venda_id
     
+    except (EstoqueInsuficiente, ControladoSemLiberacao, BancoOcupado):
+        conexao.rollback()
+        raise
     except Exception as err:
         print(f"[ERRO] registrar_venda: {err}")
         conexao.rollback()
@@ -476,9 +2197,345 @@ def registrar_venda(itens, usuario_id, supervisor=None):
     finally:
         conexao.close()
 
+# =====================================================
+# ESCRITOR ÚNICO DE VENDAS (group commit)
+# =====================================================
+# Com vários caixas, cada venda disputando o lock de escrita e fazendo
+# o próprio commit gera fila e "database is locked". No modo grupo, uma
+# thread grava as vendas pendentes juntas: um BEGIN/COMMIT (e uma
+# invalidação do cache) para o grupo, com um SAVEPOINT por venda.
+
+class EscritorVendas:
+    """
+    Thread única que drena a fila de vendas em grupos de até max_grupo.
+    A falha de uma venda desfaz só o SAVEPOINT dela; cada chamador recebe
+    o próprio resultado (venda_id, None, EstoqueInsuficiente ou
+    ControladoSemLiberacao) num Future.
+    """
+
+    def __init__(self, caminho, max_grupo):
+        self.caminho = caminho
+        self.max_grupo = max_grupo
+        self._fila = queue.Queue()
+        self._lock = threading.Lock()
+        self._grupos = 0
+        self._vendas = 0
+        self._maior_grupo = 0
+        self._thread = threading.Thread(target=self._executar, name='escritor-vendas', daemon=True)
+        self._thread.start()
+
+    def registrar(self, itens, usuario_id, supervisor=None, carrinho=None, controlado_liberado=False):
+        """
+        Entrega a venda ao escritor e espera o resultado.
+        Levanta BancoOcupado se a thread do escritor não estiver viva ou se o
+        grupo já em gravação não terminar dentro de Config.ESCRITA_PRAZO.
+        """
+        if not self.ativo():
+            raise BancoOcupado("escritor de vendas parado")
+        futuro = Future()
+        self._fila.put((itens, usuario_id, supervisor, carrinho, controlado_liberado, futuro))
+        try:
+            return futuro.result(timeout=Config.VENDAS_GRUPO_TIMEOUT)
+        except FuturesTimeout:
+            if futuro.cancel():
+                print("[ERRO] registrar_venda: escritor de vendas não respondeu a tempo")
+                return None
+        # Já está sendo gravada: o resultado sai junto com o commit do grupo,
+        # que tem no máximo ESCRITA_PRAZO para pegar o lock
+        try:
+            return futuro.result(timeout=Config.ESCRITA_PRAZO)
+        except FuturesTimeout:
+            print("[ERRO] registrar_venda: gravação do grupo excedeu o prazo")
+            raise BancoOcupado("gravação do grupo de vendas excedeu o prazo") from None
+
+    def ativo(self):
+        """Se a thread do escritor ainda está drenando a fila."""
+        return self._thread.is_alive()
+
+    def parar(self):
+        """Encerra a thread depois de gravar o que já está na fila."""
+        self._fila.put(None)
+        self._thread.join()
+
+    def _executar(self):
+        conexao = None
+        metricas.funcao_atual.set('registrar_venda')
+        while True:
+            pedido = self._fila.get()
+            if pedido is None:
+                break
+            grupo = [pedido]
+            while len(grupo) < self.max_grupo:
+                try:
+                    pedido = self._fila.get_nowait()
+                except queue.Empty:
+                    break
+                if pedido is None:
+                    self._fila.put(None)  # Para depois deste grupo
+                    break
+                grupo.append(pedido)
+            
+            # Pedidos cujo caixa desistiu (timeout) não são gravados
+            grupo = [pedido for pedido in grupo if pedido[-1].set_running_or_notify_cancel()]
+            if not grupo:
+                continue
+            
+            try:
+                if conexao is None:
+                    conexao = get_pool()._criar_conexao()
+                    conexao.pool = None  # Conexão própria: close() fecha de verdade
+                self._gravar_grupo(conexao, grupo)
+            except Exception as err:
+                print(f"[ERRO] EscritorVendas: {err}")
+                for *_, futuro in grupo:
+                    if not futuro.done():
+                        if isinstance(err, BancoOcupado):
+                            futuro.set_exception(err)  # O caixa recebe 503
+                        else:
+                            futuro.set_result(None)
+                if conexao is not None:
+                    conexao.close()
+                    conexao = None
+        
+        if conexao is not None:
+            conexao.close()
+
+    def _gravar_grupo(self, conexao, grupo):
+        cursor = conexao.cursor()
+        _iniciar_escrita(cursor)
+        resultados = []
+        try:
+            for itens, usuario_id, supervisor, carrinho, controlado_liberado, futuro in grupo:
+                cursor.execute("SAVEPOINT venda")
+                try:
+                    venda_id = _gravar_venda(cursor, itens, usuario_id, supervisor, carrinho,
+                                             controlado_liberado)
+                    cursor.execute("RELEASE venda")
+                    resultados.append((futuro, venda_id, None))
+                except Exception as err:
+                    cursor.execute("ROLLBACK TO venda")
+                    cursor.execute("RELEASE venda")
+                    if not isinstance(err, (EstoqueInsuficiente, ControladoSemLiberacao)):
+                        print(f"[ERRO] registrar_venda: {err}")
+                        err = None
+                    resultados.append((futuro, None, err))
+            
+            if any(venda_id for _, venda_id, _ in resultados):
+                _incrementar_versao_catalogo(conexao)
+            conexao.commit()
+        except Exception:
+            conexao.rollback()
+            raise
+        
+        _cache_catalogo.limpar()
+        with self._lock:
+            self._grupos += 1
+            self._vendas += len(grupo)
+            self._maior_grupo = max(self._maior_grupo, len(grupo))
+        
+        for futuro, venda_id, erro in resultados:
+            if erro is not None:
+                futuro.set_exception(erro)
+            else:
+                futuro.set_result(venda_id)
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                'fila': self._fila.qsize(),
+                'grupos': self._grupos,
+                'vendas': self._vendas,
+                'media_por_grupo': round(self._vendas / self._grupos, 2) if self._grupos else 0.0,
+                'maior_grupo': self._maior_grupo,
+                'max_grupo': self.max_grupo
+            }
+
+
+_escritor = None
+_escritor_lock = threading.Lock()
+
+def get_escritor_vendas():
+    """Retorna o escritor de vendas do processo, criando-o na primeira venda."""
+    global _escritor
+    if _escritor is None or _escritor.caminho != Config.DATABASE_PATH or not _escritor.ativo():
+        with _escritor_lock:
+            if _escritor is None or _escritor.caminho != Config.DATABASE_PATH or not _escritor.ativo():
+                if _escritor is not None:
+                    _escritor.parar()
+                _escritor = EscritorVendas(Config.DATABASE_PATH, Config.VENDAS_GRUPO_MAX)
+    return _escritor
+
+def estatisticas_escritor_vendas():
+    """Grupos gravados e tamanho da fila do modo group commit (None se desligado)."""
+    return _escritor.estatisticas() if _escritor is not None else None
+
+def parar_escritor_vendas():
+    """Grava o que estiver na fila e encerra o escritor (testes, benchmark)."""
+    global _escritor
+    with _escritor_lock:
+        if _escritor is not None:
+            _escritor.parar()
+            _escritor = None
+
+# =====================================================
+# RESERVAS DE ESTOQUE (carrinho aberto no PDV)
+# =====================================================
+# Cada item adicionado ao carrinho segura unidades de lotes específicos
+# por Config.RESERVA_TTL segundos. Outros caixas (e o catálogo do PDV)
+# enxergam o saldo já descontado; na venda as reservas viram itens sem
+# nova consulta aos lotes. Reservas vencidas deixam de valer na hora
+# (todas as consultas filtram expira_em) e o varredor apaga as linhas.
+
+@metricas.medir_consulta
+def reservar_estoque(carrinho, usuario_id, produto_id, quantidade):
+    """
+    Define quantas unidades do produto ficam reservadas para o carrinho
+    (substitui a reserva anterior do mesmo produto; 0 libera). Os lotes
+    são escolhidos por FEFO (RN3) descontando as reservas de outros
+    carrinhos, e o prazo de todo o carrinho é renovado.
+    Retorna o novo expira_em (timestamp) ou None se falhou.
+    Lança EstoqueInsuficiente (nada muda) e BancoOcupado.
+    """
+    conexao = get_db_connection()
+    if not conexao:
+        return None
+    
+    try:
+        cursor = conexao.cursor()
+        _iniciar_escrita(cursor)
+        
+        cursor.execute(
+            "DELETE FROM reservas_estoque WHERE carrinho = ? AND usuario_id = ? AND produto_id = ?",
+            (carrinho, usuario_id, produto_id)
+        )
+        
+        if quantidade > 0:
+            produto = _resolver_carrinho(cursor, [produto_id], carrinho).get(produto_id)
+            fatias = _alocar_lotes_fefo(produto['lotes'] if produto else [], produto_id, quantidade)
+            cursor.executemany("""
+                INSERT INTO reservas_estoque (carrinho, usuario_id, produto_id, lote_id, quantidade, expira_em)
+                VALUES (?, ?, ?, ?, ?, 0)
+            """, [(carrinho, usuario_id, produto_id, lote_id, qtd) for lote_id, qtd in fatias])
+        
+        expira_em = time.time() + Config.RESERVA_TTL
+        cursor.execute(
+            "UPDATE reservas_estoque SET expira_em = ? WHERE carrinho = ? AND usuario_id = ?",
+            (expira_em, carrinho, usuario_id)
+        )
+        
+        conexao.commit()
+        return expira_em
+    
+    except (EstoqueInsuficiente, BancoOcupado):
+        conexao.rollback()
+        raise
+    except Exception as err:
+        print(f"[ERRO] reservar_estoque: {err}")
+        conexao.rollback()
+        return None
+    finally:
+        conexao.close()
+
+@metricas.medir_consulta
+def liberar_reservas(carrinho, usuario_id):
+    """Apaga todas as reservas do carrinho (venda cancelada). Retorna quantas."""
+    conexao = get_db_connection()
+    if not conexao:
+        return None
+    
+    try:
+        cursor = conexao.cursor()
+        _iniciar_escrita(cursor)
+        cursor.execute(
+            "DELETE FROM reservas_estoque WHERE carrinho = ? AND usuario_id = ?",
+            (carrinho, usuario_id)
+        )
+        conexao.commit()
+        return cursor.rowcount
+    
+    except BancoOcupado:
+        conexao.rollback()
+        raise
+    except Exception as err:
+        print(f"[ERRO] liberar_reservas: {err}")
+        conexao.rollback()
+        return None
+    finally:
+        conexao.close()
+
+@metricas.medir_consulta
+def limpar_reservas_expiradas():
+    """Apaga as reservas vencidas (varredor). Retorna quantas."""
+    conexao = get_db_connection()
+    if not conexao:
+        return None
+    
+    try:
+        cursor = conexao.cursor()
+        _iniciar_escrita(cursor)
+        cursor.execute("DELETE FROM reservas_estoque WHERE expira_em <= ?", (time.time(),))
+        conexao.commit()
+        return cursor.rowcount
+    
+    except Exception as err:
+        print(f"[ERRO] limpar_reservas_expiradas: {err}")
+        conexao.rollback()
+        return None
+    finally:
+        conexao.close()
+
+@metricas.medir_consulta
+def estatisticas_reservas():
+    """Carrinhos com reserva, unidades seguradas e linhas vencidas à espera do varredor."""
+    conexao = get_db_connection()
+    if not conexao:
+        return None
+    
+    try:
+        cursor = conexao.cursor()
+        cursor.execute("""
+            SELECT
+                COUNT(DISTINCT CASE WHEN expira_em > :agora THEN carrinho END) AS carrinhos,
+                COALESCE(SUM(CASE WHEN expira_em > :agora THEN quantidade END), 0) AS unidades,
+                COUNT(CASE WHEN expira_em <= :agora THEN 1 END) AS vencidas
+            FROM reservas_estoque
+        """, {'agora': time.time()})
+        return dict_from_row(cursor.fetchone())
+    
+    except Exception as err:
+        print(f"[ERRO] estatisticas_reservas: {err}")
+        return None
+    finally:
+        conexao.close()
+
+_varredor = None
+_varredor_lock = threading.Lock()
+
+def iniciar_varredor_reservas():
+    """
+    Inicia (uma vez por processo) a thread que apaga as reservas vencidas
+    a cada Config.RESERVAS_VARREDURA segundos.
+    """
+    global _varredor
+    with _varredor_lock:
+        if _varredor is not None:
+            return
+
+        def varrer():
+            while True:
+                time.sleep(Config.RESERVAS_VARREDURA)
+                try:
+                    limpar_reservas_expiradas()
+                except BancoOcupado as err:
+                    print(f"[ERRO] varredor de reservas: {err}")
+
+        _varredor = threading.Thread(target=varrer, name='varredor-reservas', daemon=True)
+        _varredor.start()
+
+@metricas.medir_consulta
 def get_vendas_recentes(limite=10):
     """Retorna as últimas vendas realizadas"""
-    conexao = get_db_connection()
+    conexao = get_db_connection_leitura()
     if not conexao:
         return []
     
@@ -498,10 +2555,305 @@ def get_vendas_recentes(limite=10):
             LIMIT ?
         """, (limite,))
         
-        return [dict_from_row(row) for row in cursor.fetchall()]
+        return _linhas(cursor, VendaRecente)
     
     except Exception as err:
         print(f"[ERRO] get_vendas_recentes: {err}")
         return []
     finally:
         conexao.close()
+
+# =====================================================
+# MÓDULO: RELATÓRIOS CONSOLIDADOS (vendas_diarias_*)
+# =====================================================
+# Consultas sobre os consolidados diários: custo proporcional ao número
+# de dias do período, não ao número de vendas/itens.
+
+_RANKINGS = {
+    'produtos': """
+        SELECT d.produto_id AS id, p.nome, p.categoria,
+               SUM(d.unidades) AS unidades, ROUND(SUM(d.receita), 2) AS receita,
+               SUM(d.qtd_vendas) AS qtd_vendas
+        FROM vendas_diarias_produto d
+        LEFT JOIN produtos p ON p.id = d.produto_id
+        WHERE d.dia BETWEEN ? AND ?
+        GROUP BY d.produto_id
+    """,
+    'vendedores': """
+        SELECT d.usuario_id AS id, u.nome, u.cargo,
+               SUM(d.unidades) AS unidades, ROUND(SUM(d.receita), 2) AS receita,
+               SUM(d.qtd_vendas) AS qtd_vendas
+        FROM vendas_diarias_vendedor d
+        LEFT JOIN usuarios u ON u.id = d.usuario_id
+        WHERE d.dia BETWEEN ? AND ?
+        GROUP BY d.usuario_id
+    """,
+    'categorias': """
+        SELECT d.categoria AS id, d.categoria AS nome,
+               SUM(d.unidades) AS unidades, ROUND(SUM(d.receita), 2) AS receita,
+               SUM(d.qtd_vendas) AS qtd_vendas
+        FROM vendas_diarias_categoria d
+        WHERE d.dia BETWEEN ? AND ?
+        GROUP BY d.categoria
+    """,
+}
+
+@metricas.medir_consulta
+def resumo_vendas_periodo(inicio, fim):
+    """
+    Totais do período [inicio, fim] (datas 'YYYY-MM-DD') e a série por dia:
+    receita, unidades e número de vendas.
+    """
+    conexao = get_db_connection_relatorio()
+    if not conexao:
+        return None
+    
+    try:
+        cursor = conexao.cursor()
+        cursor.execute("""
+            SELECT dia, ROUND(SUM(receita), 2) AS receita, SUM(unidades) AS unidades,
+                   SUM(qtd_vendas) AS qtd_vendas
+            FROM vendas_diarias_vendedor
+            WHERE dia BETWEEN ? AND ?
+            GROUP BY dia
+            ORDER BY dia
+        """, (inicio, fim))
+        
+        dias = [dict_from_row(row) for row in cursor.fetchall()]
+        return {
+            'inicio': inicio,
+            'fim': fim,
+            'receita': round(sum(d['receita'] for d in dias), 2),
+            'unidades': sum(d['unidades'] for d in dias),
+            'qtd_vendas': sum(d['qtd_vendas'] for d in dias),
+            'dias': dias
+        }
+    
+    except Exception as err:
+        print(f"[ERRO] resumo_vendas_periodo: {err}")
+        return None
+    finally:
+        conexao.close()
+
+@metricas.medir_consulta
+def ranking_vendas(dimensao, inicio, fim, limite=10, ordem='receita'):
+    """
+    Ranking do período por 'produtos', 'vendedores' ou 'categorias',
+    ordenado por 'receita' ou 'unidades'.
+    """
+    if dimensao not in _RANKINGS or ordem not in ('receita', 'unidades'):
+        return []
+    
+    conexao = get_db_connection_relatorio()
+    if not conexao:
+        return []
+    
+    try:
+        cursor = conexao.cursor()
+        cursor.execute(
+            _RANKINGS[dimensao] + f" ORDER BY {ordem} DESC LIMIT ?",
+            (inicio, fim, limite)
+        )
+        return [dict_from_row(row) for row in cursor.fetchall()]
+    
+    except Exception as err:
+        print(f"[ERRO] ranking_vendas: {err}")
+        return []
+    finally:
+        conexao.close()
+
+# =====================================================
+# MÓDULO: EXPORTAÇÃO (streaming para auditoria/BI)
+# =====================================================
+# Os extratos são lidos em blocos (fetchmany) de uma conexão própria,
+# fora do pool: um export longo não ocupa a vaga de um caixa e, em WAL,
+# a leitura não bloqueia as vendas que continuam sendo gravadas.
+
+EXPORTACOES = {
+    # Uma linha por item vendido: é também a saída de estoque por lote
+    'itens': {
+        'colunas': [
+            'venda_id', 'data_venda', 'usuario_id', 'vendedor', 'supervisor_liberacao',
+            'item_id', 'produto_id', 'produto', 'fabricante', 'categoria',
+            'lote_id', 'numero_lote', 'data_validade',
+            'quantidade', 'preco_unitario', 'subtotal', 'total_venda'
+        ],
+        'sql': """
+            SELECT v.id, v.data_venda, v.usuario_id, u.nome, v.supervisor_liberacao,
+                   iv.id, iv.produto_id, p.nome, p.fabricante, p.categoria,
+                   iv.lote_id, l.numero_lote, l.data_validade,
+                   iv.quantidade, iv.preco_unitario, iv.subtotal, v.total
+            FROM {vendas} v
+            INNER JOIN {itens_venda} iv ON iv.venda_id = v.id
+            LEFT JOIN usuarios u ON u.id = v.usuario_id
+            LEFT JOIN produtos p ON p.id = iv.produto_id
+            LEFT JOIN estoque_lotes l ON l.id = iv.lote_id
+            WHERE v.data_venda >= :inicio AND v.data_venda < date(:fim, '+1 day')
+            ORDER BY v.data_venda, v.id
+        """,
+        'arquivavel': True
+    },
+    # Uma linha por venda (cabeçalho)
+    'vendas': {
+        'colunas': [
+            'venda_id', 'data_venda', 'usuario_id', 'vendedor', 'cargo_vendedor',
+            'total', 'supervisor_liberacao', 'caminho_receita'
+        ],
+        'sql': """
+            SELECT v.id, v.data_venda, v.usuario_id, u.nome, u.cargo,
+                   v.total, v.supervisor_liberacao, v.caminho_receita
+            FROM {vendas} v
+            LEFT JOIN usuarios u ON u.id = v.usuario_id
+            WHERE v.data_venda >= :inicio AND v.data_venda < date(:fim, '+1 day')
+            ORDER BY v.data_venda, v.id
+        """,
+        'arquivavel': True
+    },
+    # Posição atual de estoque por lote (entradas), filtrada pela data de cadastro
+    'lotes': {
+        'colunas': [
+            'lote_id', 'produto_id', 'produto', 'categoria', 'numero_lote',
+            'data_validade', 'qtd_atual', 'created_at'
+        ],
+        'sql': """
+            SELECT l.id, l.produto_id, p.nome, p.categoria, l.numero_lote,
+                   l.data_validade, l.qtd_atual, l.created_at
+            FROM estoque_lotes l
+            LEFT JOIN produtos p ON p.id = l.produto_id
+            WHERE l.created_at >= :inicio AND l.created_at < date(:fim, '+1 day')
+            ORDER BY l.id
+        """
+    }
+}
+
+def _abrir_conexao_exportacao():
+    """Conexão dedicada e somente leitura (URI mode=ro) para os extratos."""
+    conexao = sqlite3.connect(
+        uri_banco(Config.DATABASE_PATH, 'mode=ro'),
+        uri=True,
+        timeout=Config.DB_BUSY_TIMEOUT_MS / 1000,
+        check_same_thread=False
+    )
+    conexao.execute(f"PRAGMA busy_timeout = {int(Config.DB_BUSY_TIMEOUT_MS)}")
+    return conexao
+
+def exportar_blocos(tipo, inicio=None, fim=None, tamanho_bloco=None):
+    """
+    Gerador de blocos (listas de tuplas) do extrato `tipo`, na ordem de
+    EXPORTACOES[tipo]['colunas']. inicio/fim são datas 'YYYY-MM-DD'
+    inclusivas; sem elas o extrato é completo.
+    A memória usada é a de um bloco, qualquer que seja o tamanho do extrato.
+    Meses de vendas já arquivados (arquivar.py) são lidos do arquivo do
+    mês, anexado (ATTACH) só enquanto o trecho dele é lido.
+    """
+    exportacao = EXPORTACOES[tipo]
+    tamanho_bloco = tamanho_bloco or Config.EXPORTACAO_BLOCO
+    inicio, fim = inicio or '0000-01-01', fim or '9999-12-30'
+    
+    conexao = _abrir_conexao_exportacao()
+    try:
+        if not exportacao.get('arquivavel'):
+            trechos = [(inicio, fim, None)]
+        else:
+            trechos = _trechos_arquivados(conexao, inicio, fim)
+        
+        for trecho_inicio, trecho_fim, arquivo in trechos:
+            if arquivo is None:
+                consulta = exportacao['sql'].format(vendas='vendas', itens_venda='itens_venda')
+            else:
+                conexao.execute("ATTACH DATABASE ? AS arq",
+                                (uri_banco(os.path.join(Config.ARQUIVO_DIR, arquivo), 'mode=ro'),))
+                consulta = exportacao['sql'].format(
+                    vendas=_origem_arquivada('vendas'),
+                    itens_venda=_origem_arquivada('itens_venda')
+                )
+            try:
+                cursor = conexao.execute(consulta, {'inicio': trecho_inicio, 'fim': trecho_fim})
+                while True:
+                    bloco = cursor.fetchmany(tamanho_bloco)
+                    if not bloco:
+                        break
+                    yield bloco
+            finally:
+                if arquivo is not None:
+                    conexao.execute("DETACH DATABASE arq")
+    finally:
+        conexao.close()
+
+# =====================================================
+# ARQUIVO DE VENDAS (meses antigos fora do banco principal)
+# =====================================================
+# arquivar.py move os meses fechados de vendas/itens_venda para um arquivo
+# SQLite por mês (Config.ARQUIVO_DIR) e registra cada mês em
+# arquivo_vendas_meses. Os consolidados (vendas_diarias_*) continuam no
+# banco principal, então resumo_vendas_periodo e ranking_vendas não mudam;
+# o extrato de um período antigo junta o arquivo do mês com o que ainda
+# estiver no banco principal.
+
+COLUNAS_ARQUIVO = {
+    'vendas': 'id, data_venda, total, usuario_id, supervisor_liberacao, caminho_receita',
+    'itens_venda': 'id, venda_id, produto_id, lote_id, quantidade, preco_unitario, subtotal',
+}
+
+# Mês arquivado: o arquivo mais o que ainda estiver no banco principal
+# (durante a etapa 'apagando' a mesma venda pode estar nos dois). O ramo do
+# banco principal já sai filtrado pelo trecho pedido (:inicio/:fim, pelo
+# idx_vendas_data), e não a tabela inteira antes do UNION ALL.
+_ORIGEM_ARQUIVADA = """(
+    SELECT {colunas} FROM main.{tabela} WHERE {filtro_principal}
+    UNION ALL
+    SELECT {colunas} FROM arq.{tabela} a
+    WHERE NOT EXISTS (SELECT 1 FROM main.{tabela} m WHERE m.id = a.id)
+)"""
+
+_PERIODO_PRINCIPAL = "data_venda >= :inicio AND data_venda < date(:fim, '+1 day')"
+
+_FILTRO_PRINCIPAL = {
+    'vendas': _PERIODO_PRINCIPAL,
+    'itens_venda': f"venda_id IN (SELECT id FROM main.vendas WHERE {_PERIODO_PRINCIPAL})",
+}
+
+def _origem_arquivada(tabela):
+    """Subconsulta de `tabela` para um trecho com mês arquivado (arq anexado)."""
+    return _ORIGEM_ARQUIVADA.format(tabela=tabela, colunas=COLUNAS_ARQUIVO[tabela],
+                                    filtro_principal=_FILTRO_PRINCIPAL[tabela])
+
+def nome_arquivo_mes(mes):
+    """Nome do arquivo de vendas do mês 'AAAA-MM' (ex.: vendas_2025_01.db)."""
+    return f"vendas_{mes.replace('-', '_')}.db"
+
+def limites_mes(mes):
+    """[inicio, fim) do mês 'AAAA-MM' em texto ISO, comparável com data_venda."""
+    ano, numero = int(mes[:4]), int(mes[5:7])
+    return f"{mes}-01", f"{ano + numero // 12:04d}-{numero % 12 + 1:02d}-01"
+
+def _trechos_arquivados(conexao, inicio, fim):
+    """
+    Divide [inicio, fim] (datas inclusivas) em trechos consecutivos
+    (inicio, fim, arquivo): os meses arquivados, com o nome do arquivo, e
+    os intervalos que só existem no banco principal (arquivo None).
+    """
+    existe = conexao.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'arquivo_vendas_meses'"
+    ).fetchone()
+    if not existe:
+        return [(inicio, fim, None)]
+    
+    meses = conexao.execute("""
+        SELECT mes, arquivo FROM arquivo_vendas_meses
+        WHERE estado IN ('apagando', 'concluido') AND mes BETWEEN ? AND ?
+        ORDER BY mes
+    """, (inicio[:7], fim[:7])).fetchall()
+    
+    trechos = []
+    atual = inicio
+    for mes, arquivo in meses:
+        primeiro, proximo = limites_mes(mes)
+        ultimo = (date.fromisoformat(proximo) - timedelta(days=1)).isoformat()
+        if atual < primeiro:
+            trechos.append((atual, (date.fromisoformat(primeiro) - timedelta(days=1)).isoformat(), None))
+        trechos.append((max(atual, primeiro), min(fim, ultimo), arquivo))
+        atual = proximo
+    if atual <= fim:
+        trechos.append((atual, fim, None))
+    return trechos
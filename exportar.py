@@ -0,0 +1,131 @@
+"""
+SISTEMA DE GESTÃO FARMACÊUTICA
+Exportação de Extratos (CSV / NDJSON, opcionalmente gzip)
+
+Usado pelas rotas /api/exportar/<tipo> (app.py) e pela linha de comando.
+Tudo é gerado em fluxo: as linhas saem do banco em blocos (db.exportar_blocos)
+e cada bloco é serializado e, se pedido, comprimido antes do próximo ser lido.
+
+Uso:
+    python exportar.py itens  --inicio 2025-01-01 --fim 2025-01-31 --saida itens.csv
+    python exportar.py vendas --formato ndjson --gzip --saida vendas.ndjson.gz
+    python exportar.py lotes                                  -> escreve na saída padrão
+
+Tipos: itens (um item vendido por linha, com lote), vendas, lotes.
+"""
+
+import csv
+import io
+import json
+import sys
+import time
+import zlib
+from datetime import datetime
+
+import db
+
+FORMATOS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson'
+}
+
+# =====================================================
+# SERIALIZAÇÃO EM FLUXO
+# =====================================================
+
+def gerar_csv(colunas, blocos):
+    """Cabeçalho e depois um pedaço de texto CSV por bloco."""
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer, lineterminator='\n')
+    escritor.writerow(colunas)
+    yield buffer.getvalue()
+
+    for bloco in blocos:
+        buffer.seek(0)
+        buffer.truncate()
+        escritor.writerows(bloco)
+        yield buffer.getvalue()
+
+def gerar_ndjson(colunas, blocos):
+    """Um objeto JSON por linha; um pedaço de texto por bloco."""
+    for bloco in blocos:
+        yield ''.join(
+            json.dumps(dict(zip(colunas, linha)), ensure_ascii=False) + '\n'
+            for linha in bloco
+        )
+
+def comprimir_gzip(pedacos):
+    """Comprime em gzip pedaço a pedaço (sem montar o arquivo em memória)."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31 = formato gzip
+    for pedaco in pedacos:
+        dados = compressor.compress(pedaco)
+        if dados:
+            yield dados
+    yield compressor.flush()
+
+def gerar_exportacao(tipo, formato='csv', inicio=None, fim=None, gzip=False):
+    """
+    Iterador de bytes com o extrato completo no formato pedido.
+    Levanta ValueError para tipo, formato ou datas inválidos.
+    """
+    if tipo not in db.EXPORTACOES:
+        raise ValueError(f"Tipo de exportação inválido: {tipo}")
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato inválido: {formato}")
+    for valor in (inicio, fim):
+        if valor:
+            datetime.strptime(valor, '%Y-%m-%d')
+
+    colunas = db.EXPORTACOES[tipo]['colunas']
+    blocos = db.exportar_blocos(tipo, inicio, fim)
+    serializar = gerar_csv if formato == 'csv' else gerar_ndjson
+
+    pedacos = (texto.encode('utf-8') for texto in serializar(colunas, blocos))
+    return comprimir_gzip(pedacos) if gzip else pedacos
+
+def nome_arquivo(tipo, formato, inicio=None, fim=None, gzip=False):
+    """Nome sugerido para download, ex.: itens_2025-01-01_2025-01-31.csv.gz"""
+    partes = [tipo] + [valor for valor in (inicio, fim) if valor]
+    return '_'.join(partes) + f'.{formato}' + ('.gz' if gzip else '')
+
+# =====================================================
+# LINHA DE COMANDO
+# =====================================================
+
+def _opcao(nome, padrao=None):
+    if nome in sys.argv:
+        return sys.argv[sys.argv.index(nome) + 1]
+    return padrao
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] not in db.EXPORTACOES:
+        print(__doc__)
+        sys.exit(1)
+
+    tipo = sys.argv[1]
+    formato = _opcao('--formato', 'csv')
+    inicio = _opcao('--inicio')
+    fim = _opcao('--fim')
+    gzip = '--gzip' in sys.argv
+    caminho = _opcao('--saida')
+
+    try:
+        pedacos = gerar_exportacao(tipo, formato, inicio, fim, gzip)
+    except ValueError as err:
+        print(f"❌ {err}")
+        sys.exit(1)
+
+    saida = open(caminho, 'wb') if caminho else sys.stdout.buffer
+    inicio_exportacao = time.perf_counter()
+    total_bytes = 0
+    try:
+        for pedaco in pedacos:
+            saida.write(pedaco)
+            total_bytes += len(pedaco)
+    finally:
+        if caminho:
+            saida.close()
+
+    if caminho:
+        duracao = time.perf_counter() - inicio_exportacao
+        print(f"✅ {caminho}: {total_bytes / 1024:.1f} KiB em {duracao:.2f}s")
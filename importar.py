@@ -0,0 +1,281 @@
+"""
+SISTEMA DE GESTÃO FARMACÊUTICA
+Importação em Massa de Produtos e Lotes (implantação de nova loja)
+
+Lê o arquivo em blocos, valida cada linha antes de gravar (categorias
+conforme o CHECK da tabela produtos) e insere com executemany em uma
+única transação. Durante a carga os índices e triggers das tabelas
+afetadas são removidos e recriados no fim; o resumo de estoque e a busca
+FTS5 são recalculados de uma vez.
+
+Uso:
+    python importar.py produtos produtos.csv
+    python importar.py lotes lotes.csv --bloco 50000
+    python importar.py lotes lotes.ndjson --manter-indices   -> cargas pequenas
+
+Formatos: .csv (com cabeçalho), .ndjson/.jsonl (um objeto por linha) e
+.json (lista de objetos; lido inteiro).
+Colunas de produtos: nome, fabricante, categoria, preco_venda, descricao (opcional)
+Colunas de lotes:    produto_id ou produto (nome), numero_lote, data_validade (AAAA-MM-DD), qtd_atual
+"""
+
+import csv
+import json
+import re
+import sqlite3
+import sys
+import time
+from datetime import date
+from itertools import islice
+
+from config import Config
+import migracoes
+
+TAMANHO_BLOCO = 20000
+MAX_ERROS_EXIBIDOS = 20
+
+# =====================================================
+# LEITURA EM FLUXO
+# =====================================================
+
+def ler_registros(caminho):
+    """Gera um dict por linha do arquivo, sem carregá-lo inteiro (exceto .json)."""
+    if caminho.endswith('.csv'):
+        with open(caminho, newline='', encoding='utf-8-sig') as arquivo:
+            yield from csv.DictReader(arquivo)
+    elif caminho.endswith(('.ndjson', '.jsonl')):
+        with open(caminho, encoding='utf-8') as arquivo:
+            for linha in arquivo:
+                if linha.strip():
+                    yield json.loads(linha)
+    elif caminho.endswith('.json'):
+        with open(caminho, encoding='utf-8') as arquivo:
+            yield from json.load(arquivo)
+    else:
+        raise ValueError(f"Formato não suportado: {caminho} (use .csv, .ndjson ou .json)")
+
+def em_blocos(registros, tamanho):
+    """Agrupa o iterador em listas de até `tamanho` itens."""
+    iterador = iter(registros)
+    while True:
+        bloco = list(islice(iterador, tamanho))
+        if not bloco:
+            return
+        yield bloco
+
+# =====================================================
+# VALIDAÇÃO (antes de chegar ao banco)
+# =====================================================
+
+def categorias_permitidas(conexao):
+    """Lê as categorias do CHECK da tabela produtos (fonte única da regra)."""
+    sql = conexao.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'produtos'"
+    ).fetchone()[0]
+    encontrado = re.search(r"categoria\s+IN\s*\(([^)]*)\)", sql, re.IGNORECASE)
+    return set(re.findall(r"'([^']*)'", encontrado.group(1))) if encontrado else None
+
+def _texto(registro, campo, obrigatorio=True):
+    valor = registro.get(campo)
+    if isinstance(valor, str):
+        valor = valor.strip()
+    if obrigatorio and valor in (None, ''):
+        raise ValueError(f"campo '{campo}' vazio")
+    return valor
+
+def _validar_produto(registro, categorias):
+    """Retorna a tupla para o INSERT ou levanta ValueError."""
+    categoria = _texto(registro, 'categoria')
+    if categorias is not None and categoria not in categorias:
+        raise ValueError(f"categoria inválida '{categoria}' (permitidas: {', '.join(sorted(categorias))})")
+    preco = float(_texto(registro, 'preco_venda'))
+    if preco < 0:
+        raise ValueError("preco_venda negativo")
+    return (
+        _texto(registro, 'nome'),
+        _texto(registro, 'fabricante'),
+        categoria,
+        preco,
+        _texto(registro, 'descricao', obrigatorio=False) or ''
+    )
+
+def _validar_lote(registro, produtos_ids, produtos_por_nome):
+    """Retorna a tupla para o INSERT ou levanta ValueError."""
+    if registro.get('produto_id') not in (None, ''):
+        produto_id = int(registro['produto_id'])
+        if produto_id not in produtos_ids:
+            raise ValueError(f"produto_id {produto_id} não existe")
+    else:
+        nome = _texto(registro, 'produto')
+        if nome not in produtos_por_nome:
+            raise ValueError(f"produto '{nome}' não existe")
+        produto_id = produtos_por_nome[nome]
+        if produto_id is None:
+            raise ValueError(f"produto '{nome}' é ambíguo (nome repetido); use produto_id")
+
+    validade = _texto(registro, 'data_validade')
+    try:
+        if len(validade) != 10:
+            raise ValueError
+        date.fromisoformat(validade)
+    except ValueError:
+        raise ValueError(f"data_validade '{validade}' fora do formato AAAA-MM-DD")
+
+    quantidade = int(_texto(registro, 'qtd_atual'))
+    if quantidade < 0:
+        raise ValueError("qtd_atual negativa")
+    return (produto_id, _texto(registro, 'numero_lote'), validade, quantidade)
+
+def _mapa_produtos(conexao):
+    """IDs existentes e nome -> id (None quando o nome se repete)."""
+    produtos_ids = set()
+    produtos_por_nome = {}
+    for produto_id, nome in conexao.execute("SELECT id, nome FROM produtos"):
+        produtos_ids.add(produto_id)
+        produtos_por_nome[nome] = None if nome in produtos_por_nome else produto_id
+    return produtos_ids, produtos_por_nome
+
+# =====================================================
+# CARGA
+# =====================================================
+
+INSERCOES = {
+    'produtos': """
+        INSERT INTO produtos (nome, fabricante, categoria, preco_venda, descricao)
+        VALUES (?, ?, ?, ?, ?)
+    """,
+    'lotes': """
+        INSERT INTO estoque_lotes (produto_id, numero_lote, data_validade, qtd_atual)
+        VALUES (?, ?, ?, ?)
+    """
+}
+
+TABELAS = {'produtos': 'produtos', 'lotes': 'estoque_lotes'}
+
+def _remover_indices_e_triggers(conexao, tabela):
+    """Remove índices e triggers da tabela e devolve o SQL para recriá-los."""
+    objetos = conexao.execute("""
+        SELECT type, name, sql FROM sqlite_master
+        WHERE tbl_name = ? AND type IN ('index', 'trigger') AND sql IS NOT NULL
+    """, (tabela,)).fetchall()
+    for tipo, nome, _ in objetos:
+        conexao.execute(f'DROP {tipo.upper()} "{nome}"')
+    return [sql for _, _, sql in objetos]
+
+def _existe_tabela(conexao, nome):
+    return conexao.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = ?", (nome,)
+    ).fetchone() is not None
+
+def importar(tipo, caminho, tamanho_bloco=TAMANHO_BLOCO, adiar_indices=True, banco=None):
+    """
+    Importa produtos ou lotes do arquivo. Linhas inválidas são rejeitadas
+    (com o número da linha) e as válidas gravadas em uma única transação.
+    Retorna um dict com lidos, inseridos, rejeitados, erros e linhas_por_segundo.
+    """
+    tabela = TABELAS[tipo]
+    migracoes.aplicar_migracoes(banco)  # Resumo, FTS e versoes_cache precisam existir
+    conexao = sqlite3.connect(banco or Config.DATABASE_PATH,
+                              timeout=Config.DB_BUSY_TIMEOUT_MS / 1000,
+                              isolation_level=None)
+    # PRAGMAs relaxados só nesta conexão (a integridade é validada acima)
+    conexao.execute("PRAGMA synchronous = OFF")
+    conexao.execute("PRAGMA foreign_keys = OFF")
+    conexao.execute("PRAGMA temp_store = MEMORY")
+    conexao.execute("PRAGMA cache_size = -262144")
+
+    lidos = inseridos = rejeitados = 0
+    erros = []  # Só os primeiros MAX_ERROS_EXIBIDOS
+    inicio = time.perf_counter()
+    try:
+        if tipo == 'produtos':
+            categorias = categorias_permitidas(conexao)
+            validar = lambda registro: _validar_produto(registro, categorias)
+        else:
+            produtos_ids, produtos_por_nome = _mapa_produtos(conexao)
+            validar = lambda registro: _validar_lote(registro, produtos_ids, produtos_por_nome)
+
+        # Uma transação para tudo: quem lê em paralelo (WAL) nunca vê a
+        # tabela sem índices/triggers, só o antes ou o depois da carga.
+        conexao.execute("BEGIN IMMEDIATE")
+        try:
+            recriar = _remover_indices_e_triggers(conexao, tabela) if adiar_indices else []
+
+            for bloco in em_blocos(ler_registros(caminho), tamanho_bloco):
+                linhas = []
+                for registro in bloco:
+                    lidos += 1
+                    try:
+                        linhas.append(validar(registro))
+                    except (ValueError, TypeError) as err:
+                        rejeitados += 1
+                        if len(erros) < MAX_ERROS_EXIBIDOS:
+                            linha = lidos + 1 if caminho.endswith('.csv') else lidos  # +1: cabeçalho
+                            erros.append((linha, str(err)))
+                conexao.executemany(INSERCOES[tipo], linhas)
+                inseridos += len(linhas)
+
+            for sql in recriar:
+                conexao.execute(sql)
+            if adiar_indices:
+                # Triggers estavam fora: recalcula o que eles manteriam
+                conexao.execute("DELETE FROM produto_estoque_resumo")
+                conexao.execute("INSERT INTO produto_estoque_resumo " + migracoes.SQL_CALCULAR_RESUMO)
+                if tipo == 'produtos' and _existe_tabela(conexao, 'produtos_fts'):
+                    conexao.execute("INSERT INTO produtos_fts (produtos_fts) VALUES ('rebuild')")
+
+            # Invalida o cache do catálogo dos processos do app
+            conexao.execute("UPDATE versoes_cache SET versao = versao + 1 WHERE nome = 'catalogo'")
+            conexao.execute("COMMIT")
+        except Exception:
+            conexao.execute("ROLLBACK")
+            raise
+
+        conexao.execute(f"ANALYZE {tabela}")
+    finally:
+        conexao.close()
+
+    duracao = time.perf_counter() - inicio
+    return {
+        'lidos': lidos,
+        'inseridos': inseridos,
+        'rejeitados': rejeitados,
+        'erros': erros,
+        'segundos': round(duracao, 2),
+        'linhas_por_segundo': int(inseridos / duracao) if duracao else inseridos
+    }
+
+# =====================================================
+# LINHA DE COMANDO
+# =====================================================
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3 or sys.argv[1] not in TABELAS:
+        print(__doc__)
+        sys.exit(1)
+
+    tipo, caminho = sys.argv[1], sys.argv[2]
+    tamanho_bloco = int(sys.argv[sys.argv.index('--bloco') + 1]) if '--bloco' in sys.argv else TAMANHO_BLOCO
+    adiar_indices = '--manter-indices' not in sys.argv
+
+    print("=" * 60)
+    print("📦 IMPORTAÇÃO EM MASSA")
+    print("=" * 60)
+    print(f"Banco: {Config.DATABASE_PATH}")
+    print(f"Arquivo: {caminho} ({tipo})")
+
+    try:
+        resultado = importar(tipo, caminho, tamanho_bloco, adiar_indices)
+    except (OSError, ValueError, sqlite3.Error) as err:
+        print(f"\n❌ Importação cancelada (nada foi gravado): {err}")
+        sys.exit(1)
+
+    print(f"\n✅ {resultado['inseridos']} de {resultado['lidos']} linhas importadas "
+          f"em {resultado['segundos']}s ({resultado['linhas_por_segundo']} linhas/s)")
+
+    if resultado['erros']:
+        print(f"\n⚠️  {resultado['rejeitados']} linhas rejeitadas:")
+        for linha, mensagem in resultado['erros']:
+            print(f"   linha {linha}: {mensagem}")
+        if resultado['rejeitados'] > MAX_ERROS_EXIBIDOS:
+            print(f"   ... e mais {resultado['rejeitados'] - MAX_ERROS_EXIBIDOS}")
@@ -0,0 +1,267 @@
+"""
+SISTEMA DE GESTÃO FARMACÊUTICA
+Métricas no formato Prometheus (/metrics)
+
+Histogramas de latência por rota e por função do db.py, linhas devolvidas,
+espera por conexão do pool, contadores de SQLITE_BUSY e a fila do
+controle de admissão das escritas (para dimensionar workers).
+
+Registro sem lock: cada thread grava no próprio dicionário (threading.local);
+só a leitura (/metrics) percorre todos. Quando a thread termina (o servidor
+de desenvolvimento abre uma por requisição), o dicionário dela é somado a um
+total das threads encerradas e descartado. Com vários processos
+(gunicorn -w N), defina METRICAS_DIR: cada processo grava um retrato em
+<pid>_<início>.json a cada Config.METRICAS_INTERVALO segundos e o /metrics
+soma os retratos de todos; os de processos que já terminaram são apagados.
+"""
+
+import atexit
+import contextvars
+import json
+import os
+import threading
+import time
+import weakref
+from bisect import bisect_left
+from functools import wraps
+
+from config import Config
+
+# =====================================================
+# DEFINIÇÃO DAS MÉTRICAS
+# =====================================================
+
+BUCKETS_LATENCIA = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKETS_LINHAS = (0, 1, 5, 10, 50, 100, 500, 1000, 5000, 10000, 100000)
+BUCKETS_FILA = (0, 1, 2, 4, 8, 16, 32, 64)
+
+# nome: (tipo, descrição, rótulos, buckets)
+METRICAS = {
+    'farmacia_http_request_duration_seconds': (
+        'histogram', 'Latência das requisições por rota', ('endpoint', 'method', 'status'), BUCKETS_LATENCIA),
+    'farmacia_db_query_duration_seconds': (
+        'histogram', 'Latência das funções do db.py', ('funcao',), BUCKETS_LATENCIA),
+    'farmacia_db_query_rows': (
+        'histogram', 'Linhas devolvidas pelas funções do db.py', ('funcao',), BUCKETS_LINHAS),
+    'farmacia_db_pool_wait_seconds': (
+        'histogram', 'Espera por uma conexão livre do pool', ('pool',), BUCKETS_LATENCIA),
+    'farmacia_db_busy_total': (
+        'counter', 'Comandos que receberam SQLITE_BUSY (banco travado)', ('funcao',), None),
+    'farmacia_db_busy_retries_total': (
+        'counter', 'Novas tentativas de BEGIN IMMEDIATE após SQLITE_BUSY', ('funcao',), None),
+    'farmacia_admissao_fila': (
+        'histogram', 'Escritas já na fila quando uma nova chega', (), BUCKETS_FILA),
+    'farmacia_admissao_espera_seconds': (
+        'histogram', 'Espera por uma vaga de escrita', (), BUCKETS_LATENCIA),
+    'farmacia_admissao_rejeicoes_total': (
+        'counter', 'Escritas recusadas com 503', ('motivo',), None),
+}
+
+# =====================================================
+# REGISTRO (por thread, sem lock)
+# =====================================================
+
+_local = threading.local()
+_shards = {}                    # id -> dicionário de cada thread viva (para a leitura)
+_encerradas = {}                # Soma das séries das threads que já terminaram
+# Registrar/encerrar uma thread e ler. RLock: o finalizador roda no coletor
+# de lixo, que pode disparar numa thread que já está com o lock
+_shards_lock = threading.RLock()
+
+# Função do db.py em execução (rótulo das métricas em nível de cursor)
+funcao_atual = contextvars.ContextVar('funcao_atual', default='-')
+
+class _DonoDasSeries:
+    """Fica no threading.local: some quando a thread termina e dispara o finalizador."""
+    __slots__ = ('__weakref__',)
+
+def _somar(total, chave, serie):
+    acumulado = total.get(chave)
+    if acumulado is None:
+        total[chave] = list(serie)
+    else:
+        for i, valor in enumerate(serie):
+            acumulado[i] += valor
+
+def _encerrar_thread(series):
+    """Soma as séries de uma thread que terminou ao total e esquece o dicionário."""
+    with _shards_lock:
+        _shards.pop(id(series), None)
+        for chave, serie in series.items():
+            _somar(_encerradas, chave, serie)
+
+def _series_da_thread():
+    series = getattr(_local, 'series', None)
+    if series is None:
+        series = {}
+        dono = _DonoDasSeries()
+        with _shards_lock:
+            _shards[id(series)] = series
+        weakref.finalize(dono, _encerrar_thread, series)
+        _local.dono, _local.series = dono, series
+    return series
+
+def observar(nome, valor, rotulos=()):
+    """Registra uma observação num histograma."""
+    series = _series_da_thread()
+    serie = series.get((nome, rotulos))
+    if serie is None:
+        # [contagem por bucket..., +Inf, soma, total]
+        serie = series[(nome, rotulos)] = [0] * (len(METRICAS[nome][3]) + 1) + [0.0, 0]
+    serie[bisect_left(METRICAS[nome][3], valor)] += 1
+    serie[-2] += valor
+    serie[-1] += 1
+
+def incrementar(nome, rotulos=(), valor=1):
+    """Soma `valor` a um contador."""
+    series = _series_da_thread()
+    serie = series.get((nome, rotulos))
+    if serie is None:
+        serie = series[(nome, rotulos)] = [0]
+    serie[0] += valor
+
+def medir_consulta(funcao):
+    """
+    Decorador das funções do db.py: latência e linhas devolvidas,
+    rotuladas pelo nome da função.
+    """
+    nome = funcao.__name__
+
+    @wraps(funcao)
+    def envoltorio(*args, **kwargs):
+        token = funcao_atual.set(nome)
+        inicio = time.perf_counter()
+        try:
+            resultado = funcao(*args, **kwargs)
+        finally:
+            funcao_atual.reset(token)
+            observar('farmacia_db_query_duration_seconds', time.perf_counter() - inicio, (nome,))
+        observar('farmacia_db_query_rows', _contar_linhas(resultado), (nome,))
+        return resultado
+
+    return envoltorio
+
+def _contar_linhas(resultado):
+    if isinstance(resultado, tuple) and resultado and isinstance(resultado[0], list):
+        resultado = resultado[0]  # (lista, próxima página) e semelhantes
+    if isinstance(resultado, list):
+        return len(resultado)
+    return 0 if resultado is None or resultado is False else 1
+
+# =====================================================
+# AGREGAÇÃO (threads e processos)
+# =====================================================
+
+def _retrato():
+    """Soma das séries de todas as threads deste processo (vivas e encerradas)."""
+    with _shards_lock:
+        total = {chave: list(serie) for chave, serie in _encerradas.items()}
+        for series in list(_shards.values()):
+            for chave, serie in list(series.items()):
+                _somar(total, chave, serie)
+    return total
+
+_ultima_gravacao = 0.0
+# pid + instante de início: um pid reaproveitado não sobrescreve o arquivo de outro processo
+_ARQUIVO_PROCESSO = f'{os.getpid()}_{int(time.time() * 1000)}.json'
+
+def persistir(forcar=False):
+    """
+    Grava o retrato deste processo em METRICAS_DIR/<pid>_<início>.json (no
+    máximo a cada METRICAS_INTERVALO segundos). Sem METRICAS_DIR não faz nada.
+    """
+    global _ultima_gravacao
+    pasta = Config.METRICAS_DIR
+    agora = time.monotonic()
+    if not pasta or (not forcar and agora - _ultima_gravacao < Config.METRICAS_INTERVALO):
+        return
+    _ultima_gravacao = agora
+
+    dados = [[nome, list(rotulos), serie] for (nome, rotulos), serie in _retrato().items()]
+    caminho = os.path.join(pasta, _ARQUIVO_PROCESSO)
+    try:
+        os.makedirs(pasta, exist_ok=True)
+        with open(caminho + '.tmp', 'w', encoding='utf-8') as arquivo:
+            json.dump(dados, arquivo)
+        os.replace(caminho + '.tmp', caminho)
+    except OSError as err:
+        print(f"[ERRO] metricas.persistir: {err}")
+
+atexit.register(persistir, True)
+
+def _processo_vivo(pid):
+    """Se o pid existe. No Windows não há sinal 0: considera vivo (o arquivo fica)."""
+    if os.name == 'nt':
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # Existe, mas é de outro usuário
+    return True
+
+def _consolidado():
+    """
+    Retrato deste processo somado aos gravados pelos outros processos.
+    Apaga os arquivos de processos que já terminaram.
+    """
+    if not Config.METRICAS_DIR:
+        return _retrato()
+
+    persistir(forcar=True)
+    total = {}
+    for arquivo in os.listdir(Config.METRICAS_DIR):
+        if not arquivo.endswith('.json'):
+            continue
+        caminho = os.path.join(Config.METRICAS_DIR, arquivo)
+        pid = arquivo.split('_', 1)[0].split('.', 1)[0]
+        if pid.isdigit() and not _processo_vivo(int(pid)):
+            try:
+                os.remove(caminho)
+            except OSError:
+                pass
+            continue
+        try:
+            with open(caminho, encoding='utf-8') as entrada:
+                dados = json.load(entrada)
+        except (OSError, ValueError):
+            continue  # Arquivo sendo trocado neste instante
+        for nome, rotulos, serie in dados:
+            _somar(total, (nome, tuple(rotulos)), serie)
+    return total
+
+# =====================================================
+# FORMATO TEXTO DO PROMETHEUS
+# =====================================================
+
+def _rotulos_texto(nomes, valores, extra=None):
+    pares = [f'{nome}="{str(valor)}"' for nome, valor in zip(nomes, valores)]
+    if extra:
+        pares.append(extra)
+    return '{' + ','.join(pares) + '}' if pares else ''
+
+def _formatar_numero(valor):
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+def texto_prometheus():
+    """Todas as métricas no formato de exposição do Prometheus (text/plain 0.0.4)."""
+    series = _consolidado()
+    linhas = []
+    for nome, (tipo, descricao, nomes_rotulos, buckets) in METRICAS.items():
+        linhas.append(f'# HELP {nome} {descricao}')
+        linhas.append(f'# TYPE {nome} {tipo}')
+        for (nome_serie, rotulos), serie in sorted(series.items()):
+            if nome_serie != nome:
+                continue
+            if tipo == 'counter':
+                linhas.append(f'{nome}{_rotulos_texto(nomes_rotulos, rotulos)} {serie[0]}')
+                continue
+            acumulado = 0
+            for limite, contagem in zip(list(buckets) + ['+Inf'], serie[:-2]):
+                acumulado += contagem
+                le = 'le="+Inf"' if limite == '+Inf' else f'le="{_formatar_numero(float(limite))}"'
+                linhas.append(f'{nome}_bucket{_rotulos_texto(nomes_rotulos, rotulos, le)} {acumulado}')
+            linhas.append(f'{nome}_sum{_rotulos_texto(nomes_rotulos, rotulos)} {_formatar_numero(float(serie[-2]))}')
+            linhas.append(f'{nome}_count{_rotulos_texto(nomes_rotulos, rotulos)} {serie[-1]}')
+    return '\n'.join(linhas) + '\n'
@@ -0,0 +1,509 @@
+"""
+SISTEMA DE GESTÃO FARMACÊUTICA
+Migrações Versionadas do Esquema (PRAGMA user_version)
+
+Cada migração tem um número de versão. O banco guarda a última versão
+aplicada em PRAGMA user_version; ao iniciar o app só as migrações
+pendentes são executadas (quando não há nada a fazer, custa uma leitura).
+
+Uso pela linha de comando:
+    python migracoes.py                        -> aplica migrações pendentes
+    python migracoes.py --planos               -> mostra EXPLAIN QUERY PLAN antes/depois
+    python migracoes.py --verificar-planos     -> sai com 1 se uma consulta quente varrer
+                                                  vendas, itens_venda ou estoque_lotes
+    python migracoes.py --reconstruir-resumo   -> verifica e recalcula produto_estoque_resumo
+"""
+
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from config import Config
+
+# =====================================================
+# LISTA DE MIGRAÇÕES (em ordem, nunca editar as já publicadas)
+# =====================================================
+
+# Resumo de estoque calculado direto dos lotes (carga inicial e reparo)
+SQL_CALCULAR_RESUMO = """
+    SELECT 
+        p.id AS produto_id,
+        COALESCE(SUM(el.qtd_atual), 0) AS estoque_total,
+        MIN(el.data_validade) AS validade_mais_proxima,
+        COUNT(el.id) AS qtd_lotes
+    FROM produtos p
+    LEFT JOIN estoque_lotes el ON el.produto_id = p.id AND el.qtd_atual > 0
+    GROUP BY p.id
+"""
+
+MIGRACOES = [
+    (1, 'Índices das consultas quentes (FEFO, catálogo, validade, vendas)', [
+        # get_lote_fefo / listar_lotes_por_produto / JOIN de listar_produtos
+        """CREATE INDEX IF NOT EXISTS idx_lotes_produto_validade
+           ON estoque_lotes (produto_id, data_validade, qtd_atual)""",
+        # get_lotes_vencendo: só lotes com saldo entram no índice
+        """CREATE INDEX IF NOT EXISTS idx_lotes_validade_com_estoque
+           ON estoque_lotes (data_validade) WHERE qtd_atual > 0""",
+        # get_vendas_recentes (ORDER BY data_venda DESC)
+        """CREATE INDEX IF NOT EXISTS idx_vendas_data
+           ON vendas (data_venda)""",
+        # Itens de uma venda
+        """CREATE INDEX IF NOT EXISTS idx_itens_venda_venda
+           ON itens_venda (venda_id)""",
+        # ORDER BY nome do catálogo
+        """CREATE INDEX IF NOT EXISTS idx_produtos_nome
+           ON produtos (nome, id)""",
+    ]),
+    (2, 'Tabela produto_estoque_resumo mantida por triggers', [
+        """CREATE TABLE IF NOT EXISTS produto_estoque_resumo (
+               produto_id INTEGER PRIMARY KEY,
+               estoque_total INTEGER NOT NULL DEFAULT 0,
+               validade_mais_proxima DATE,
+               qtd_lotes INTEGER NOT NULL DEFAULT 0
+           )""",
+        # Produto novo já nasce com resumo zerado
+        """CREATE TRIGGER IF NOT EXISTS trg_resumo_produto_insert
+           AFTER INSERT ON produtos
+           BEGIN
+               INSERT OR IGNORE INTO produto_estoque_resumo (produto_id) VALUES (NEW.id);
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_resumo_produto_delete
+           AFTER DELETE ON produtos
+           BEGIN
+               DELETE FROM produto_estoque_resumo WHERE produto_id = OLD.id;
+           END""",
+        # Lotes: só lotes com saldo contam (mesma regra do antigo LEFT JOIN)
+        """CREATE TRIGGER IF NOT EXISTS trg_resumo_lote_insert
+           AFTER INSERT ON estoque_lotes
+           BEGIN
+               INSERT OR IGNORE INTO produto_estoque_resumo (produto_id) VALUES (NEW.produto_id);
+               UPDATE produto_estoque_resumo
+               SET estoque_total = estoque_total + MAX(NEW.qtd_atual, 0),
+                   qtd_lotes = qtd_lotes + (NEW.qtd_atual > 0),
+                   validade_mais_proxima = (SELECT MIN(data_validade) FROM estoque_lotes
+                                            WHERE produto_id = NEW.produto_id AND qtd_atual > 0)
+               WHERE produto_id = NEW.produto_id;
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_resumo_lote_update
+           AFTER UPDATE OF produto_id, qtd_atual, data_validade ON estoque_lotes
+           BEGIN
+               UPDATE produto_estoque_resumo
+               SET estoque_total = estoque_total - MAX(OLD.qtd_atual, 0),
+                   qtd_lotes = qtd_lotes - (OLD.qtd_atual > 0),
+                   validade_mais_proxima = (SELECT MIN(data_validade) FROM estoque_lotes
+                                            WHERE produto_id = OLD.produto_id AND qtd_atual > 0)
+               WHERE produto_id = OLD.produto_id;
+               INSERT OR IGNORE INTO produto_estoque_resumo (produto_id) VALUES (NEW.produto_id);
+               UPDATE produto_estoque_resumo
+               SET estoque_total = estoque_total + MAX(NEW.qtd_atual, 0),
+                   qtd_lotes = qtd_lotes + (NEW.qtd_atual > 0),
+                   validade_mais_proxima = (SELECT MIN(data_validade) FROM estoque_lotes
+                                            WHERE produto_id = NEW.produto_id AND qtd_atual > 0)
+               WHERE produto_id = NEW.produto_id;
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_resumo_lote_delete
+           AFTER DELETE ON estoque_lotes
+           BEGIN
+               UPDATE produto_estoque_resumo
+               SET estoque_total = estoque_total - MAX(OLD.qtd_atual, 0),
+                   qtd_lotes = qtd_lotes - (OLD.qtd_atual > 0),
+                   validade_mais_proxima = (SELECT MIN(data_validade) FROM estoque_lotes
+                                            WHERE produto_id = OLD.produto_id AND qtd_atual > 0)
+               WHERE produto_id = OLD.produto_id;
+           END""",
+        # Carga inicial a partir dos lotes existentes
+        "DELETE FROM produto_estoque_resumo",
+        "INSERT INTO produto_estoque_resumo " + SQL_CALCULAR_RESUMO,
+    ]),
+    (3, 'Contadores de versão para invalidar caches entre processos', [
+        """CREATE TABLE IF NOT EXISTS versoes_cache (
+               nome TEXT PRIMARY KEY,
+               versao INTEGER NOT NULL DEFAULT 0
+           ) WITHOUT ROWID""",
+        "INSERT OR IGNORE INTO versoes_cache (nome, versao) VALUES ('catalogo', 0)",
+    ]),
+    (4, 'Busca textual FTS5 em produtos (nome, fabricante, descrição)', [
+        # Conteúdo externo (lê de produtos); remove_diacritics: "dipírona" = "dipirona"
+        """CREATE VIRTUAL TABLE IF NOT EXISTS produtos_fts USING fts5(
+               nome, fabricante, descricao,
+               content = 'produtos',
+               content_rowid = 'id',
+               tokenize = 'unicode61 remove_diacritics 2',
+               prefix = '2 3'
+           )""",
+        """CREATE TRIGGER IF NOT EXISTS trg_fts_produto_insert
+           AFTER INSERT ON produtos
+           BEGIN
+               INSERT INTO produtos_fts (rowid, nome, fabricante, descricao)
+               VALUES (NEW.id, NEW.nome, NEW.fabricante, NEW.descricao);
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_fts_produto_delete
+           AFTER DELETE ON produtos
+           BEGIN
+               INSERT INTO produtos_fts (produtos_fts, rowid, nome, fabricante, descricao)
+               VALUES ('delete', OLD.id, OLD.nome, OLD.fabricante, OLD.descricao);
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_fts_produto_update
+           AFTER UPDATE OF nome, fabricante, descricao ON produtos
+           BEGIN
+               INSERT INTO produtos_fts (produtos_fts, rowid, nome, fabricante, descricao)
+               VALUES ('delete', OLD.id, OLD.nome, OLD.fabricante, OLD.descricao);
+               INSERT INTO produtos_fts (rowid, nome, fabricante, descricao)
+               VALUES (NEW.id, NEW.nome, NEW.fabricante, NEW.descricao);
+           END""",
+        # Indexa os produtos já cadastrados
+        "INSERT INTO produtos_fts (produtos_fts) VALUES ('rebuild')",
+    ]),
+    (5, 'Consolidados diários de vendas (produto, vendedor, categoria)', [
+        """CREATE TABLE IF NOT EXISTS vendas_diarias_produto (
+               dia DATE NOT NULL,
+               produto_id INTEGER NOT NULL,
+               unidades INTEGER NOT NULL DEFAULT 0,
+               receita REAL NOT NULL DEFAULT 0,
+               qtd_vendas INTEGER NOT NULL DEFAULT 0,
+               PRIMARY KEY (dia, produto_id)
+           ) WITHOUT ROWID""",
+        """CREATE TABLE IF NOT EXISTS vendas_diarias_vendedor (
+               dia DATE NOT NULL,
+               usuario_id INTEGER NOT NULL,
+               unidades INTEGER NOT NULL DEFAULT 0,
+               receita REAL NOT NULL DEFAULT 0,
+               qtd_vendas INTEGER NOT NULL DEFAULT 0,
+               PRIMARY KEY (dia, usuario_id)
+           ) WITHOUT ROWID""",
+        """CREATE TABLE IF NOT EXISTS vendas_diarias_categoria (
+               dia DATE NOT NULL,
+               categoria TEXT NOT NULL,
+               unidades INTEGER NOT NULL DEFAULT 0,
+               receita REAL NOT NULL DEFAULT 0,
+               qtd_vendas INTEGER NOT NULL DEFAULT 0,
+               PRIMARY KEY (dia, categoria)
+           ) WITHOUT ROWID""",
+        # Carga inicial a partir do histórico existente
+        """INSERT OR REPLACE INTO vendas_diarias_produto
+           SELECT date(v.data_venda), iv.produto_id, SUM(iv.quantidade), SUM(iv.subtotal),
+                  COUNT(DISTINCT v.id)
+           FROM vendas v
+           INNER JOIN itens_venda iv ON iv.venda_id = v.id
+           GROUP BY date(v.data_venda), iv.produto_id""",
+        """INSERT OR REPLACE INTO vendas_diarias_vendedor
+           SELECT date(v.data_venda), v.usuario_id, COALESCE(SUM(u.unidades), 0), SUM(v.total), COUNT(*)
+           FROM vendas v
+           LEFT JOIN (SELECT venda_id, SUM(quantidade) AS unidades
+                       FROM itens_venda GROUP BY venda_id) u ON u.venda_id = v.id
+           GROUP BY date(v.data_venda), v.usuario_id""",
+        """INSERT OR REPLACE INTO vendas_diarias_categoria
+           SELECT date(v.data_venda), p.categoria, SUM(iv.quantidade), SUM(iv.subtotal),
+                  COUNT(DISTINCT v.id)
+           FROM vendas v
+           INNER JOIN itens_venda iv ON iv.venda_id = v.id
+           INNER JOIN produtos p ON p.id = iv.produto_id
+           GROUP BY date(v.data_venda), p.categoria""",
+    ]),
+    (6, 'Reservas de estoque com prazo para carrinhos abertos do PDV', [
+        # Só carrinhos abertos: o varredor apaga as vencidas e a venda
+        # apaga as do próprio carrinho, então a tabela fica pequena
+        """CREATE TABLE IF NOT EXISTS reservas_estoque (
+               id INTEGER PRIMARY KEY AUTOINCREMENT,
+               carrinho TEXT NOT NULL,
+               usuario_id INTEGER NOT NULL,
+               produto_id INTEGER NOT NULL,
+               lote_id INTEGER NOT NULL REFERENCES estoque_lotes (id) ON DELETE CASCADE,
+               quantidade INTEGER NOT NULL CHECK (quantidade > 0),
+               expira_em REAL NOT NULL
+           )""",
+        """CREATE INDEX IF NOT EXISTS idx_reservas_carrinho
+           ON reservas_estoque (carrinho, produto_id)""",
+        # Saldo livre de cada lote na venda e na reserva
+        """CREATE INDEX IF NOT EXISTS idx_reservas_lote
+           ON reservas_estoque (lote_id, expira_em)""",
+        # Catálogo do PDV (reservado por produto) e varredura das vencidas
+        """CREATE INDEX IF NOT EXISTS idx_reservas_expira
+           ON reservas_estoque (expira_em, produto_id, quantidade)""",
+    ]),
+    (7, 'Registro dos meses de vendas arquivados (arquivar.py)', [
+        # Um mês por linha: etapa do job e contagens conferidas na cópia
+        """CREATE TABLE IF NOT EXISTS arquivo_vendas_meses (
+               mes TEXT PRIMARY KEY,
+               arquivo TEXT NOT NULL,
+               estado TEXT NOT NULL CHECK (estado IN ('copiando', 'apagando', 'concluido')),
+               vendas INTEGER NOT NULL DEFAULT 0,
+               itens INTEGER NOT NULL DEFAULT 0,
+               total REAL NOT NULL DEFAULT 0,
+               atualizado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+           )""",
+    ]),
+]
+
+# Consultas usadas para comparar os planos antes/depois das migrações
+CONSULTAS_QUENTES = {
+    'get_lote_fefo': (
+        """SELECT id, numero_lote, data_validade, qtd_atual
+           FROM estoque_lotes
+           WHERE produto_id = ? AND qtd_atual >= ?
+           ORDER BY data_validade ASC LIMIT 1""",
+        (1, 1)
+    ),
+    'listar_lotes_por_produto': (
+        """SELECT id FROM estoque_lotes WHERE produto_id = ? ORDER BY data_validade ASC""",
+        (1,)
+    ),
+    'listar_produtos': (
+        """SELECT p.id, COALESCE(r.estoque_total, 0), r.validade_mais_proxima
+           FROM produtos p
+           LEFT JOIN produto_estoque_resumo r ON r.produto_id = p.id
+           ORDER BY p.nome ASC""",
+        ()
+    ),
+    'listar_produtos_pagina': (
+        """SELECT p.id FROM produtos p
+           LEFT JOIN produto_estoque_resumo r ON r.produto_id = p.id
+           WHERE (p.nome, p.id) > (?, ?)
+           ORDER BY p.nome ASC, p.id ASC LIMIT ?""",
+        ('M', 0, 21)
+    ),
+    'get_lotes_vencendo': (
+        """SELECT el.id FROM estoque_lotes el
+           WHERE el.data_validade >= ? AND el.data_validade < ?
+             AND el.qtd_atual > 0
+           ORDER BY el.data_validade ASC""",
+        ('2025-01-01', '2025-02-01')
+    ),
+    'get_vendas_recentes': (
+        """SELECT v.id FROM vendas v ORDER BY v.data_venda DESC LIMIT ?""",
+        (10,)
+    ),
+    'itens_da_venda': (
+        """SELECT id FROM itens_venda WHERE venda_id = ?""",
+        (1,)
+    ),
+}
+
+# =====================================================
+# EXECUÇÃO
+# =====================================================
+
+def versao_alvo():
+    """Maior versão conhecida pelo código."""
+    return MIGRACOES[-1][0] if MIGRACOES else 0
+
+def get_versao(conexao):
+    """Versão atual do esquema gravada no banco."""
+    return conexao.execute("PRAGMA user_version").fetchone()[0]
+
+def aplicar_migracoes(caminho=None, verbose=False):
+    """
+    Aplica as migrações pendentes no banco.
+    Cada migração roda em sua própria transação (BEGIN IMMEDIATE), junto com
+    a atualização do user_version, então um processo concorrente nunca
+    aplica a mesma migração duas vezes. Retorna a lista de versões aplicadas.
+    """
+    conexao = sqlite3.connect(caminho or Config.DATABASE_PATH,
+                              timeout=Config.DB_BUSY_TIMEOUT_MS / 1000,
+                              isolation_level=None)
+    aplicadas = []
+    try:
+        # Caminho rápido: nada a fazer
+        if get_versao(conexao) >= versao_alvo():
+            return aplicadas
+
+        # Banco ainda não criado: as tabelas vêm do setup_banco.py
+        existe = conexao.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'produtos'"
+        ).fetchone()
+        if not existe:
+            print("[MIGRAÇÕES] Tabelas não encontradas. Execute setup_banco.py primeiro.")
+            return aplicadas
+
+        for versao, descricao, comandos in MIGRACOES:
+            conexao.execute("BEGIN IMMEDIATE")
+            try:
+                # Relê dentro do lock: outro worker pode ter aplicado antes
+                if get_versao(conexao) >= versao:
+                    conexao.execute("COMMIT")
+                    continue
+
+                inicio = time.perf_counter()
+                for comando in comandos:
+                    conexao.execute(comando)
+                conexao.execute(f"PRAGMA user_version = {int(versao)}")
+                conexao.execute("COMMIT")
+            except Exception:
+                conexao.execute("ROLLBACK")
+                raise
+
+            aplicadas.append(versao)
+            if verbose:
+                duracao = (time.perf_counter() - inicio) * 1000
+                print(f"   ✅ Migração {versao}: {descricao} ({duracao:.1f} ms)")
+
+        # Estatísticas atualizadas para o planejador escolher os novos índices
+        if aplicadas:
+            conexao.execute("ANALYZE")
+
+        return aplicadas
+    finally:
+        conexao.close()
+
+def planos_de_consulta(conexao):
+    """Retorna {nome_consulta: [linhas do EXPLAIN QUERY PLAN]}."""
+    planos = {}
+    for nome, (sql, params) in CONSULTAS_QUENTES.items():
+        try:
+            linhas = conexao.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+            planos[nome] = [linha[3] for linha in linhas]
+        except sqlite3.OperationalError as err:
+            planos[nome] = [f"(indisponível nesta versão: {err})"]
+    return planos
+
+# =====================================================
+# MANUTENÇÃO: RESUMO DE ESTOQUE (produto_estoque_resumo)
+# =====================================================
+
+def verificar_resumo_estoque(caminho=None):
+    """
+    Compara o resumo mantido pelos triggers com o cálculo direto dos lotes.
+    Retorna a lista de produto_id divergentes (vazia = tudo certo).
+    """
+    conexao = sqlite3.connect(caminho or Config.DATABASE_PATH)
+    try:
+        divergentes = conexao.execute(f"""
+            SELECT calc.produto_id
+            FROM ({SQL_CALCULAR_RESUMO}) AS calc
+            LEFT JOIN produto_estoque_resumo r ON r.produto_id = calc.produto_id
+            WHERE r.produto_id IS NULL
+               OR r.estoque_total <> calc.estoque_total
+               OR r.qtd_lotes <> calc.qtd_lotes
+               OR r.validade_mais_proxima IS NOT calc.validade_mais_proxima
+        """).fetchall()
+        return [linha[0] for linha in divergentes]
+    finally:
+        conexao.close()
+
+def reconstruir_resumo_estoque(caminho=None):
+    """
+    Recalcula produto_estoque_resumo inteiro a partir dos lotes (reparo de
+    divergências). Roda em uma transação; retorna o número de produtos.
+    """
+    conexao = sqlite3.connect(caminho or Config.DATABASE_PATH,
+                              timeout=Config.DB_BUSY_TIMEOUT_MS / 1000,
+                              isolation_level=None)
+    try:
+        conexao.execute("BEGIN IMMEDIATE")
+        try:
+            conexao.execute("DELETE FROM produto_estoque_resumo")
+            conexao.execute("INSERT INTO produto_estoque_resumo " + SQL_CALCULAR_RESUMO)
+            total = conexao.execute("SELECT COUNT(*) FROM produto_estoque_resumo").fetchone()[0]
+            conexao.execute("COMMIT")
+        except Exception:
+            conexao.execute("ROLLBACK")
+            raise
+        return total
+    finally:
+        conexao.close()
+
+# Tabelas que crescem com o histórico (nome ou alias usado nas consultas)
+TABELAS_CRESCENTES = {'estoque_lotes', 'el', 'vendas', 'v', 'itens_venda', 'iv'}
+
+def _tem_scan(plano):
+    """True se o plano varre inteira (SCAN sem índice) uma tabela que cresce."""
+    for linha in plano:
+        partes = [parte for parte in linha.split() if parte != 'TABLE']  # 'SCAN TABLE x' (SQLite < 3.36)
+        if len(partes) >= 2 and partes[0] == 'SCAN' and 'INDEX' not in linha:
+            if partes[1] in TABELAS_CRESCENTES:
+                return True
+    return False
+
+def verificar_planos(caminho=None):
+    """
+    Confere os planos das CONSULTAS_QUENTES numa cópia do banco com as
+    migrações aplicadas (o banco em si não é alterado).
+    Retorna {nome_consulta: plano} das reprovadas: varrem inteira uma
+    tabela que cresce ou nem rodaram (vazio = tudo certo).
+    """
+    with tempfile.TemporaryDirectory() as pasta:
+        copia = os.path.join(pasta, 'planos.db')
+        origem = sqlite3.connect(caminho or Config.DATABASE_PATH)
+        destino = sqlite3.connect(copia)
+        try:
+            origem.backup(destino)
+        finally:
+            origem.close()
+            destino.close()
+        
+        aplicar_migracoes(copia)
+        reprovadas = {}
+        conexao = sqlite3.connect(copia)
+        try:
+            for nome, (sql, params) in CONSULTAS_QUENTES.items():
+                try:
+                    plano = [linha[3] for linha in
+                             conexao.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()]
+                except sqlite3.OperationalError as err:
+                    reprovadas[nome] = [f"(não rodou: {err})"]
+                    continue
+                if _tem_scan(plano):
+                    reprovadas[nome] = plano
+        finally:
+            conexao.close()
+    
+    return reprovadas
+
+# =====================================================
+# LINHA DE COMANDO
+# =====================================================
+
+if __name__ == '__main__':
+    caminho = Config.DATABASE_PATH
+    mostrar_planos = '--planos' in sys.argv
+    reconstruir_resumo = '--reconstruir-resumo' in sys.argv
+
+    print("=" * 60)
+    print("🔁 MIGRAÇÕES DO BANCO DE DADOS")
+    print("=" * 60)
+    print(f"Banco: {caminho}")
+
+    if '--verificar-planos' in sys.argv:
+        reprovadas = verificar_planos(caminho)
+        print(f"\n📋 Planos das {len(CONSULTAS_QUENTES)} consultas quentes (cópia migrada do banco)")
+        for nome, plano in reprovadas.items():
+            print(f"\n❌ {nome}")
+            print("   plano: " + " | ".join(plano))
+        if reprovadas:
+            print(f"\n❌ {len(reprovadas)} consulta(s) reprovada(s)")
+            sys.exit(1)
+        print("\n✅ Nenhuma consulta quente varre tabela que cresce")
+        sys.exit(0)
+
+    if mostrar_planos:
+        conexao = sqlite3.connect(caminho)
+        antes = planos_de_consulta(conexao)
+        conexao.close()
+
+    conexao = sqlite3.connect(caminho)
+    print(f"Versão atual: {get_versao(conexao)} | Versão do código: {versao_alvo()}")
+    conexao.close()
+
+    aplicadas = aplicar_migracoes(caminho, verbose=True)
+    if not aplicadas:
+        print("   ⚠️  Nenhuma migração pendente.")
+
+    if mostrar_planos:
+        conexao = sqlite3.connect(caminho)
+        depois = planos_de_consulta(conexao)
+        conexao.close()
+
+        print("\n📋 Planos de consulta (antes -> depois)")
+        for nome in CONSULTAS_QUENTES:
+            marca = '❌' if _tem_scan(depois[nome]) else '✅'
+            print(f"\n{marca} {nome}")
+            print("   antes : " + " | ".join(antes[nome]))
+            print("   depois: " + " | ".join(depois[nome]))
+
+    if reconstruir_resumo:
+        print("\n🔧 Resumo de estoque (produto_estoque_resumo)")
+        divergentes = verificar_resumo_estoque(caminho)
+        print(f"   Produtos divergentes antes do reparo: {len(divergentes)}")
+        total = reconstruir_resumo_estoque(caminho)
+        print(f"   ✅ Resumo recalculado para {total} produto(s)")
@@ -0,0 +1,171 @@
+"""
+SISTEMA DE GESTÃO FARMACÊUTICA
+Log de Consultas Lentas do db.py (com EXPLAIN QUERY PLAN)
+
+Opcional: ligado só quando CONSULTAS_LENTAS_MS está definido (ambiente).
+O CursorMedido (db.py) cronometra cada comando, somando execute e fetch*,
+e os que passam do limite são gravados em Config.CONSULTAS_LENTAS_ARQUIVO
+(um JSON por linha). Cada registro traz o SQL, o formato dos parâmetros
+(tipos, nunca os valores), a duração, as linhas e o plano de execução.
+O plano é obtido uma única vez para cada texto de SQL distinto.
+
+Uso:
+    CONSULTAS_LENTAS_MS=20 python app.py       -> grava consultas acima de 20 ms
+    python perfil_sql.py                       -> piores consultas do log
+    python perfil_sql.py --limite 10 --arquivo outro.jsonl
+"""
+
+import json
+import re
+import sqlite3
+import sys
+import threading
+import time
+
+from config import Config
+
+# Varredura completa destas tabelas é o que derruba o caixa com dados reais
+TABELAS_VIGIADAS = {'estoque_lotes', 'itens_venda'}
+
+_planos = {}                 # chave do SQL -> linhas do EXPLAIN QUERY PLAN
+_arquivo_lock = threading.Lock()
+
+# =====================================================
+# REGISTRO
+# =====================================================
+
+def chave_sql(sql):
+    """SQL em uma linha, com listas IN (?, ?, ...) de qualquer tamanho unificadas."""
+    texto = ' '.join(sql.split())
+    return re.sub(r'\bIN \(\?(\s*,\s*\?)*\)', 'IN (?, ...)', texto, flags=re.IGNORECASE)
+
+def forma_parametros(parametros):
+    """Formato dos parâmetros sem expor os valores: ['int', 'str'] ou {'nome': 'str'}."""
+    if isinstance(parametros, dict):
+        return {nome: type(valor).__name__ for nome, valor in parametros.items()}
+    if isinstance(parametros, (list, tuple)):
+        if parametros and isinstance(parametros[0], (list, tuple, dict)):
+            return {'executemany': len(parametros), 'linha': forma_parametros(parametros[0])}
+        return [type(valor).__name__ for valor in parametros]
+    return type(parametros).__name__
+
+def _plano(conexao, chave, sql, parametros):
+    """EXPLAIN QUERY PLAN do comando, calculado uma vez por chave."""
+    if chave in _planos:
+        return _planos[chave]
+    if conexao is None or sql.lstrip()[:6].upper() in ('BEGIN', 'COMMIT', 'ROLLBA', 'PRAGMA', 'ANALYZ'):
+        return []
+    if isinstance(parametros, (list, tuple)) and parametros and isinstance(parametros[0], (list, tuple, dict)):
+        parametros = parametros[0]  # executemany: o plano da primeira linha vale para todas
+    elif not isinstance(parametros, (list, tuple, dict)):
+        return []  # executemany com gerador: não dá para reaproveitar os parâmetros
+    try:
+        cursor = sqlite3.Cursor(conexao)  # Cursor simples: não entra de novo no perfil
+        linhas = cursor.execute("EXPLAIN QUERY PLAN " + sql, parametros).fetchall()
+        plano = [linha[3] for linha in linhas]
+    except sqlite3.Error as err:
+        plano = [f"(plano indisponível: {err})"]
+    _planos[chave] = plano
+    return plano
+
+def tabelas_varridas(sql, plano):
+    """Tabelas que o plano percorre inteiras (SCAN sem índice), resolvendo aliases."""
+    aliases = {}
+    for tabela, alias in re.findall(r'\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?', sql, re.IGNORECASE):
+        aliases[tabela] = tabela
+        if alias and alias.upper() not in ('ON', 'WHERE', 'INNER', 'LEFT', 'JOIN', 'GROUP',
+                                           'ORDER', 'LIMIT', 'USING', 'CROSS', 'SET'):
+            aliases[alias] = tabela
+    varridas = set()
+    for linha in plano:
+        partes = linha.split()
+        if len(partes) >= 2 and partes[0] == 'SCAN' and 'INDEX' not in linha:
+            varridas.add(aliases.get(partes[1], partes[1]))
+    return varridas
+
+def registrar(conexao, sql, parametros, duracao_ms, linhas, funcao):
+    """Grava um comando lento no log (chamado pelo CursorMedido)."""
+    chave = chave_sql(sql)
+    plano = _plano(conexao, chave, sql, parametros)
+    registro = {
+        'quando': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'funcao': funcao,
+        'sql': chave,
+        'parametros': forma_parametros(parametros),
+        'duracao_ms': round(duracao_ms, 3),
+        'linhas': linhas,
+        'plano': plano,
+        'scan_vigiado': sorted(tabelas_varridas(sql, plano) & TABELAS_VIGIADAS)
+    }
+    try:
+        with _arquivo_lock, open(Config.CONSULTAS_LENTAS_ARQUIVO, 'a', encoding='utf-8') as arquivo:
+            arquivo.write(json.dumps(registro, ensure_ascii=False) + '\n')
+    except OSError as err:
+        print(f"[ERRO] perfil_sql.registrar: {err}")
+
+# =====================================================
+# AGREGAÇÃO (piores consultas)
+# =====================================================
+
+def piores_consultas(limite=20, caminho=None):
+    """
+    Agrupa o log por SQL e ordena pelo tempo total gasto.
+    Cada item: sql, funcoes, execucoes, total_ms, media_ms, max_ms,
+    linhas_max, plano e scan_vigiado (tabelas grandes varridas inteiras).
+    """
+    grupos = {}
+    try:
+        with open(caminho or Config.CONSULTAS_LENTAS_ARQUIVO, encoding='utf-8') as arquivo:
+            for linha in arquivo:
+                try:
+                    registro = json.loads(linha)
+                except ValueError:
+                    continue  # Linha incompleta (gravação em andamento)
+                grupo = grupos.setdefault(registro['sql'], {
+                    'sql': registro['sql'], 'funcoes': set(), 'execucoes': 0,
+                    'total_ms': 0.0, 'max_ms': 0.0, 'linhas_max': 0,
+                    'plano': [], 'scan_vigiado': []
+                })
+                grupo['funcoes'].add(registro['funcao'])
+                grupo['execucoes'] += 1
+                grupo['total_ms'] += registro['duracao_ms']
+                grupo['max_ms'] = max(grupo['max_ms'], registro['duracao_ms'])
+                grupo['linhas_max'] = max(grupo['linhas_max'], registro['linhas'])
+                if registro['plano']:
+                    grupo['plano'] = registro['plano']
+                    grupo['scan_vigiado'] = registro['scan_vigiado']
+    except FileNotFoundError:
+        return []
+
+    resultado = sorted(grupos.values(), key=lambda grupo: grupo['total_ms'], reverse=True)[:limite]
+    for grupo in resultado:
+        grupo['funcoes'] = sorted(grupo['funcoes'])
+        grupo['total_ms'] = round(grupo['total_ms'], 3)
+        grupo['media_ms'] = round(grupo['total_ms'] / grupo['execucoes'], 3)
+    return resultado
+
+# =====================================================
+# LINHA DE COMANDO
+# =====================================================
+
+if __name__ == '__main__':
+    limite = int(sys.argv[sys.argv.index('--limite') + 1]) if '--limite' in sys.argv else 20
+    caminho = sys.argv[sys.argv.index('--arquivo') + 1] if '--arquivo' in sys.argv else None
+
+    print("=" * 60)
+    print("🐢 CONSULTAS LENTAS DO db.py")
+    print("=" * 60)
+    print(f"Log: {caminho or Config.CONSULTAS_LENTAS_ARQUIVO}")
+
+    consultas = piores_consultas(limite, caminho)
+    if not consultas:
+        print("\n⚠️  Nenhuma consulta lenta registrada (defina CONSULTAS_LENTAS_MS ao iniciar o app).")
+
+    for posicao, consulta in enumerate(consultas, 1):
+        marca = f"❌ SCAN em {', '.join(consulta['scan_vigiado'])}" if consulta['scan_vigiado'] else '✅'
+        print(f"\n{posicao}. {', '.join(consulta['funcoes'])} | {consulta['execucoes']}x | "
+              f"total {consulta['total_ms']:.1f} ms | média {consulta['media_ms']:.1f} ms | "
+              f"máx {consulta['max_ms']:.1f} ms | até {consulta['linhas_max']} linhas | {marca}")
+        print(f"   {consulta['sql'][:300]}")
+        for linha in consulta['plano']:
+            print(f"   plano: {linha}")
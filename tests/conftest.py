@@ -0,0 +1,36 @@
+"""
+Fixtures dos testes: bancos temporários criados com setup_banco.criar_banco,
+nunca o farmacia.db.
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+import setup_banco
+
+
+@pytest.fixture
+def banco_v0(tmp_path):
+    """Banco com as tabelas base e os dados de exemplo, sem migrações (user_version=0)."""
+    caminho = str(tmp_path / 'farmacia.db')
+    setup_banco.criar_banco(caminho, migrar=False)
+    return caminho
+
+
+@pytest.fixture
+def banco(tmp_path, monkeypatch):
+    """Banco completo (com migrações) apontado pelo db.py durante o teste."""
+    import db
+
+    caminho = str(tmp_path / 'farmacia.db')
+    setup_banco.criar_banco(caminho)
+    monkeypatch.setattr(Config, 'DATABASE_PATH', caminho)
+    monkeypatch.setattr(Config, 'RELATORIOS_SNAPSHOT', None)
+    yield caminho
+    db.get_pool().fechar_todas()
+    db.get_pool_leitura().fechar_todas()
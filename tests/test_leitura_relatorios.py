@@ -0,0 +1,104 @@
+"""Escritas dos caixas seguem enquanto um relatório longo lê (mode=ro e snapshot)."""
+
+import sqlite3
+import time
+from datetime import date, timedelta
+
+import pytest
+
+from config import Config
+import db
+
+# Folga para máquina lenta; esperar o lock de um leitor levaria ao BancoOcupado antes
+ESCRITA_MAX_S = 1.0
+
+
+def _contar_vendas(caminho):
+    conexao = sqlite3.connect(caminho)
+    try:
+        return conexao.execute("SELECT COUNT(*) FROM vendas").fetchone()[0]
+    finally:
+        conexao.close()
+
+
+def _escrever_durante(conexao_relatorio, caminho):
+    """Com a transação de leitura aberta, vende e recebe lotes; devolve as durações."""
+    cursor = conexao_relatorio.cursor()
+    cursor.execute("BEGIN")
+    vendas_no_relatorio = cursor.execute("SELECT COUNT(*) FROM vendas").fetchone()[0]
+    validade = (date.today() + timedelta(days=365)).isoformat()
+    
+    duracoes = []
+    for n in range(5):
+        inicio = time.perf_counter()
+        venda_id = db.registrar_venda([{'produto_id': 1, 'quantidade': 1}], 1)
+        lote_id = db.criar_lote(2, f'TESTE-{n}', validade, 10)
+        duracoes.append(time.perf_counter() - inicio)
+        assert venda_id and lote_id
+        
+        # O relatório continua lendo a mesma foto; as vendas já estão gravadas
+        cursor.execute("SELECT COUNT(*), SUM(total) FROM vendas").fetchone()
+        assert cursor.execute("SELECT COUNT(*) FROM vendas").fetchone()[0] == vendas_no_relatorio
+    
+    assert _contar_vendas(caminho) == vendas_no_relatorio + 5
+    conexao_relatorio.rollback()
+    return duracoes
+
+
+@pytest.fixture
+def sem_espera_de_lock(monkeypatch):
+    """Uma única tentativa de pegar o lock: qualquer espera vira BancoOcupado."""
+    monkeypatch.setattr(Config, 'ESCRITA_PRAZO', 0)
+    monkeypatch.setattr(Config, 'VENDAS_GRUPO_COMMIT', False)
+
+
+def test_escritas_seguem_com_relatorio_aberto_em_mode_ro(banco, sem_espera_de_lock):
+    conexao = db.get_db_connection_relatorio()
+    try:
+        assert conexao.pool.nome == 'leitura'
+        duracoes = _escrever_durante(conexao, banco)
+    finally:
+        conexao.close()
+    
+    assert max(duracoes) < ESCRITA_MAX_S
+
+
+def test_escritas_seguem_com_relatorio_aberto_no_snapshot(banco, sem_espera_de_lock, tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'RELATORIOS_SNAPSHOT', str(tmp_path / 'snapshot.db'))
+    assert db.atualizar_snapshot_relatorios(forcar=True)
+    
+    conexao = db.get_db_connection_relatorio()
+    try:
+        assert conexao.pool.nome == 'snapshot'
+        cursor = conexao.cursor()
+        cursor.execute("BEGIN")
+        cursor.execute("SELECT COUNT(*), SUM(qtd_atual) FROM estoque_lotes").fetchone()
+        inicio = time.perf_counter()
+        assert db.registrar_venda([{'produto_id': 1, 'quantidade': 1}], 1)
+        assert time.perf_counter() - inicio < ESCRITA_MAX_S
+        conexao.rollback()
+    finally:
+        conexao.close()
+        db.get_pool_snapshot().fechar_todas()
+
+
+def test_conexao_de_leitura_recusa_escrita(banco):
+    conexao = db.get_db_connection_leitura()
+    try:
+        with pytest.raises(sqlite3.OperationalError):
+            conexao.execute("UPDATE produtos SET preco_venda = preco_venda")
+    finally:
+        conexao.close()
+
+
+def test_leitor_com_lock_de_escrita_faz_a_venda_desistir(banco, sem_espera_de_lock):
+    """Controle: se o relatório segurasse o lock, a venda levantaria BancoOcupado."""
+    db.get_pool().obter().close()  # Conexão do caixa já aberta (e o banco já em WAL)
+    conexao = sqlite3.connect(banco, isolation_level=None)
+    try:
+        conexao.execute("BEGIN IMMEDIATE")
+        with pytest.raises(db.BancoOcupado):
+            db.registrar_venda([{'produto_id': 1, 'quantidade': 1}], 1)
+    finally:
+        conexao.rollback()
+        conexao.close()
@@ -0,0 +1,56 @@
+"""Planos das consultas quentes antes e depois das migrações."""
+
+import sqlite3
+
+import migracoes
+
+# Consultas que só existem depois das migrações (produto_estoque_resumo)
+DEPENDEM_DE_MIGRACAO = {'listar_produtos', 'listar_produtos_pagina'}
+
+
+def _planos(caminho):
+    conexao = sqlite3.connect(caminho)
+    try:
+        return migracoes.get_versao(conexao), migracoes.planos_de_consulta(conexao)
+    finally:
+        conexao.close()
+
+
+def test_consultas_quentes_varrem_tabelas_sem_migracoes(banco_v0):
+    versao, planos = _planos(banco_v0)
+
+    assert versao == 0
+    for nome, plano in planos.items():
+        if nome in DEPENDEM_DE_MIGRACAO:
+            assert plano[0].startswith('(indisponível'), (nome, plano)
+        else:
+            assert migracoes._tem_scan(plano), (nome, plano)
+
+
+def test_migracoes_trocam_scan_por_indice(banco_v0):
+    aplicadas = migracoes.aplicar_migracoes(banco_v0)
+    versao, planos = _planos(banco_v0)
+
+    assert aplicadas == [versao for versao, _, _ in migracoes.MIGRACOES]
+    assert versao == migracoes.versao_alvo()
+    for nome, plano in planos.items():
+        assert not migracoes._tem_scan(plano), (nome, plano)
+        assert any('idx_' in linha for linha in plano), (nome, plano)
+
+
+def test_aplicar_migracoes_de_novo_nao_faz_nada(banco_v0):
+    migracoes.aplicar_migracoes(banco_v0)
+    conexao = sqlite3.connect(banco_v0)
+    esquema = conexao.execute("SELECT sql FROM sqlite_master ORDER BY name").fetchall()
+    conexao.close()
+
+    assert migracoes.aplicar_migracoes(banco_v0) == []
+
+    conexao = sqlite3.connect(banco_v0)
+    assert conexao.execute("SELECT sql FROM sqlite_master ORDER BY name").fetchall() == esquema
+    assert migracoes.get_versao(conexao) == migracoes.versao_alvo()
+    conexao.close()
+
+
+def test_verificar_planos_aprova_banco_migrado(banco_v0):
+    assert migracoes.verificar_planos(banco_v0) == {}